@@ -0,0 +1,269 @@
+"""Play animated GIF, APNG and WebP files and numbered frame sequences.
+
+An :class:`AnimationPlayer` decodes ahead on a worker thread into a
+small bounded queue: each frame is fitted to the screen, compared with
+the one before it, and only the changed rectangle is packed for the
+panel. The app's loop calls :meth:`AnimationPlayer.update` when
+:meth:`AnimationPlayer.timeout` runs out; frames keep the timing stored
+in the file, and a frame whose successor is already due is dropped
+rather than sent late, so playback keeps time when the SPI bus cannot
+keep up. The next frame shown then covers the union of the changes it
+and the dropped frames made.
+
+A frame sequence is a directory of numbered pictures (``0001.png``,
+``0002.png``, ...) played at :data:`SEQUENCE_FRAME_TIME`.
+"""
+
+import os
+import queue
+import re
+import threading
+import time
+from typing import Iterator, Optional
+
+from PIL import Image, ImageChops
+
+from image_transcode import IMAGE_EXTENSIONS, fit
+import tracing
+from rgb565 import Rgb565Packer
+
+# Frames decoded ahead of playback.
+QUEUE_SIZE = 8
+
+# Loops after the first replay decoded frames if they fit in this many.
+MAX_CACHED_FRAMES = 120
+
+# Like browsers, play frames stored with no delay at 10 per second.
+DEFAULT_FRAME_TIME = 0.1
+SEQUENCE_FRAME_TIME = 1 / 15
+
+# How often playback looks again when the decoder is behind.
+DECODE_POLL = 0.01
+
+
+Box = tuple[int, int, int, int]
+
+
+def _union(a: Optional[Box], b: Optional[Box]) -> Optional[Box]:
+    if a is None or b is None:
+        return a or b
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _frame_number(name: str) -> tuple:
+    return tuple(int(part) for part in re.findall(r"\d+", name)) or (0,)
+
+
+def sequence_frames(path: str) -> list[str]:
+    """Return the frames of sequence directory ``path`` in order."""
+    names = [
+        name
+        for name in os.listdir(path)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    return [
+        os.path.join(path, name)
+        for name in sorted(names, key=lambda name: (_frame_number(name), name))
+    ]
+
+
+def is_animation(path: str) -> bool:
+    """Return True for frame sequences and multi-frame image files."""
+    if os.path.isdir(path):
+        return len(sequence_frames(path)) > 1
+    try:
+        with Image.open(path) as img:
+            return getattr(img, "is_animated", False)
+    except OSError:
+        return False
+
+
+class Frame:
+    """A decoded frame and the window that turns its predecessor into it.
+
+    ``window`` is None for the first frame, which is sent whole, and
+    empty when nothing changed.
+    """
+
+    __slots__ = ("index", "image", "duration", "window")
+
+    def __init__(self, index, image, duration, window) -> None:
+        self.index = index
+        self.image = image
+        self.duration = duration
+        self.window = window
+
+
+class AnimationPlayer:
+    """Play the animation at ``path`` on ``device``."""
+
+    def __init__(self, device, path: str, size=None) -> None:
+        self.device = device
+        self.path = path
+        self.size = size or device.size
+        self.shown = 0
+        # Frames skipped because the next one was already due, and times
+        # a frame was due but still being decoded.
+        self.dropped = 0
+        self.stalls = 0
+        # Why decoding stopped early, set by the worker thread.
+        self.error: Optional[str] = None
+        self._queue: queue.Queue[Frame] = queue.Queue(QUEUE_SIZE)
+        self._stopped = threading.Event()
+        self._next: Optional[Frame] = None
+        self._due: Optional[float] = None
+        self._stalled = False
+        # Area changed by frames dropped since the last one shown.
+        self._skipped: Optional[Box] = None
+        pixels = self.size[0] * self.size[1]
+        self._packer = Rgb565Packer(pixels)
+        self._decode_packer = Rgb565Packer(pixels)
+        self._thread = threading.Thread(target=self._decode, daemon=True)
+        self._thread.start()
+
+    # --- Decoding (worker thread) ---
+
+    def _source_frames(self) -> Iterator[tuple[Image.Image, float]]:
+        if os.path.isdir(self.path):
+            for frame_path in sequence_frames(self.path):
+                with Image.open(frame_path) as img:
+                    yield img.convert("RGB"), SEQUENCE_FRAME_TIME
+            return
+        with Image.open(self.path) as img:
+            for index in range(getattr(img, "n_frames", 1)):
+                img.seek(index)
+                duration = img.info.get("duration") or 0
+                # GIF and APNG frames are composited by Pillow on seek.
+                yield (
+                    img.convert("RGB"),
+                    duration / 1000 or DEFAULT_FRAME_TIME,
+                )
+
+    def _decoded_frames(self) -> Iterator[tuple[Image.Image, float]]:
+        cache: Optional[list] = []
+        for image, duration in self._source_frames():
+            if image.size != self.size:
+                image = fit(image, self.size)
+            if cache is not None:
+                cache.append((image, duration))
+                if len(cache) > MAX_CACHED_FRAMES:
+                    cache = None
+            yield image, duration
+        while cache:
+            yield from cache
+        while True:
+            # Too long to keep in memory: decode every loop.
+            for image, duration in self._source_frames():
+                if image.size != self.size:
+                    image = fit(image, self.size)
+                yield image, duration
+
+    def _decode(self) -> None:
+        previous = None
+        try:
+            decode_start = time.perf_counter_ns()
+            for index, (image, duration) in enumerate(self._decoded_frames()):
+                tracing.complete("decode", decode_start)
+                window = None
+                if previous is not None:
+                    box = ImageChops.difference(previous, image).getbbox()
+                    if box is not None:
+                        data = self._decode_packer.pack(image.crop(box))
+                        data = bytes(data)
+                        window = (box, data)
+                    else:
+                        window = ()
+                previous = image
+                frame = Frame(index, image, duration, window)
+                while not self._stopped.is_set():
+                    try:
+                        self._queue.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if self._stopped.is_set():
+                    return
+                decode_start = time.perf_counter_ns()
+        except Exception as exc:
+            # Pillow raises more than OSError on damaged files; any error
+            # ends playback instead of leaving the app waiting for frames.
+            self.error = str(exc) or type(exc).__name__
+            print(f"Cannot play {os.path.basename(self.path)}: {exc}")
+
+    # --- Playback (app thread) ---
+
+    def timeout(self) -> Optional[float]:
+        """Seconds until the next frame is due (0 while starting)."""
+        if self._due is None:
+            return 0.0
+        return max(0.0, self._due - time.monotonic())
+
+    def update(self) -> None:
+        """Show the frame that is due, dropping any that are late."""
+        now = time.monotonic()
+        if self._due is not None and now < self._due:
+            return
+        while True:
+            if self._next is None:
+                try:
+                    self._next = self._queue.get_nowait()
+                except queue.Empty:
+                    if self.shown and not self._stalled:
+                        self.stalls += 1
+                        self._stalled = True
+                    self._due = now + DECODE_POLL
+                    return
+            frame = self._next
+            if self._due is None:
+                self._due = now
+            following = self._due + frame.duration
+            if following > now:
+                break
+            # The next frame is already due: skip this one.
+            self._next = None
+            self._due = following
+            self._skipped = _union(self._skipped, self._changed(frame))
+            self.dropped += 1
+        self._next = None
+        self._stalled = False
+        self._show(frame)
+        self._due = following
+
+    def _changed(self, frame: Frame) -> Optional[Box]:
+        if frame.window is None:
+            return (0, 0) + self.size
+        return frame.window[0] if frame.window else None
+
+    def _show(self, frame: Frame) -> None:
+        tracing.instant("frame", str(frame.index))
+        skipped, self._skipped = self._skipped, None
+        if frame.window is None and skipped is None:
+            # The first frame: let the driver diff it against the screen.
+            self.device.display(frame.image)
+        elif skipped is None:
+            windows = [frame.window] if frame.window else []
+            self.device.display_windows(frame.image, windows)
+        else:
+            box = _union(skipped, self._changed(frame))
+            data = bytes(self._packer.pack(frame.image.crop(box)))
+            self.device.display_windows(frame.image, [(box, data)])
+        self.shown += 1
+
+    @property
+    def failed(self) -> bool:
+        """True once decoding failed and every decoded frame was shown."""
+        return (
+            self.error is not None
+            and self._next is None
+            and self._queue.empty()
+        )
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def summary(self) -> str:
+        return (
+            f"{os.path.basename(self.path)}: {self.shown} frames shown,"
+            f" {self.dropped} dropped, {self.stalls} decode stalls"
+        )
@@ -0,0 +1,82 @@
+"""Local message bus between the app host and the foreground app.
+
+Every app runs in its own process, so background services (the remote
+control server, notifications) cannot hand events to it directly. The
+foreground app binds a Unix datagram socket at :data:`BUS_PATH` and the
+services send small JSON messages to it. Messages sent while nobody is
+listening are dropped, which is what we want for button presses.
+"""
+
+import json
+import os
+import socket
+import tempfile
+from typing import Optional
+
+BUS_PATH = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+    "nanodeck-bus.sock",
+)
+
+# Datagrams are button names and short notification texts.
+MAX_MESSAGE_SIZE = 4096
+
+_send_socket: Optional[socket.socket] = None
+
+
+def publish(message: dict, path: str = BUS_PATH) -> bool:
+    """Send ``message`` to the foreground app; False if nobody listens."""
+    global _send_socket
+    data = json.dumps(message).encode("utf-8")
+    if len(data) > MAX_MESSAGE_SIZE:
+        raise ValueError("bus message too large")
+    if _send_socket is None:
+        _send_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        _send_socket.sendto(data, path)
+    except OSError:
+        return False
+    return True
+
+
+class Subscriber:
+    """Receiving end of the bus, owned by the foreground app."""
+
+    def __init__(self, path: str = BUS_PATH) -> None:
+        self.path = path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self._sock.bind(path)
+        self._inode = os.stat(path).st_ino
+
+    def receive(self) -> Optional[dict]:
+        """Block for the next message; return None once closed."""
+        while True:
+            try:
+                data = self._sock.recv(MAX_MESSAGE_SIZE)
+            except OSError:
+                return None
+            if not data:
+                return None
+            try:
+                message = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(message, dict):
+                return message
+
+    def close(self) -> None:
+        """Stop receiving and remove the socket if it is still ours."""
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        try:
+            if os.stat(self.path).st_ino == self._inode:
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,239 @@
+"""Stack app frames, status bars and popups as layers with their own caches.
+
+A :class:`Compositor` stands in for the screen: it looks like a device
+(``display``, ``display_windows``, ``size``), and what the app sends
+becomes its ``app`` layer. Other layers, such as a status bar or a popup,
+sit above or below it. Each layer keeps its own surface and the bounding
+box of what is drawn on it, and marks the areas it changes as dirty.
+:meth:`Compositor.render` recomposes only the dirty areas, bottom layer
+first, and sends them as packed windows. A popup costs only its own area
+to show and to hide. Windows the app packed itself, such as those from
+:class:`tile_engine.TileScene`, pass through untouched unless a layer
+above the app covers them.
+"""
+
+from typing import Optional
+
+from PIL import Image, ImageChops
+
+import tracing
+from palette import colors
+from rgb565 import Rgb565Packer
+
+# Stacking order of the standard layers, bottom first.
+BACKGROUND = 0
+APP = 10
+STATUS = 20
+OVERLAY = 30
+
+Box = tuple[int, int, int, int]
+
+
+def _intersect(a: Box, b: Box) -> Optional[Box]:
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return None
+    return box
+
+
+def _union(a: Optional[Box], b: Optional[Box]) -> Optional[Box]:
+    if a is None or b is None:
+        return a or b
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def merge_boxes(boxes: list[Box]) -> list[Box]:
+    """Replace overlapping boxes with their bounding box until none do."""
+    merged: list[Box] = []
+    for box in boxes:
+        while True:
+            for index, other in enumerate(merged):
+                if _intersect(box, other) is not None:
+                    box = _union(box, merged.pop(index))
+                    break
+            else:
+                break
+        merged.append(box)
+    return merged
+
+
+class Layer:
+    """A surface covering ``box`` of the screen.
+
+    Opaque layers are RGB; others are RGBA and blended over the layers
+    below. Draw through :meth:`paste` and :meth:`clear`, or draw on
+    :attr:`surface` directly and call :meth:`changed` with the area.
+    """
+
+    def __init__(
+        self, compositor, name: str, z: int, box: Box, opaque: bool
+    ) -> None:
+        self.compositor = compositor
+        self.name = name
+        self.z = z
+        self.box = box
+        self.opaque = opaque
+        size = (box[2] - box[0], box[3] - box[1])
+        self.surface = Image.new(
+            "RGB" if opaque else "RGBA",
+            size,
+            colors.background if opaque else 0,
+        )
+        self.visible = True
+        # Screen area with something drawn on it; None when empty.
+        self.content: Optional[Box] = box if opaque else None
+
+    def _to_screen(self, box: Box) -> Optional[Box]:
+        x, y = self.box[:2]
+        return _intersect(
+            (box[0] + x, box[1] + y, box[2] + x, box[3] + y), self.box
+        )
+
+    def changed(self, box: Optional[Box] = None) -> None:
+        """Mark ``box`` (layer coordinates, default all) for redrawing."""
+        screen_box = self.box if box is None else self._to_screen(box)
+        if screen_box is None:
+            return
+        if not self.opaque:
+            self.content = _union(self.content, screen_box)
+        if self.visible:
+            self.compositor.invalidate(screen_box)
+
+    def paste(self, image: Image.Image, xy: tuple[int, int] = (0, 0)) -> None:
+        """Replace the area under ``image``, alpha included."""
+        self.surface.paste(image.convert(self.surface.mode), xy)
+        self.changed((xy[0], xy[1], xy[0] + image.width, xy[1] + image.height))
+
+    def clear(self) -> None:
+        """Make the layer transparent (black if opaque)."""
+        if self.content is None:
+            return
+        fill = colors.background if self.opaque else 0
+        self.surface.paste(fill, (0, 0) + self.surface.size)
+        if self.visible:
+            self.compositor.invalidate(self.content)
+        if not self.opaque:
+            self.content = None
+
+    def show(self, visible: bool = True) -> None:
+        if visible != self.visible:
+            self.visible = visible
+            if self.content is not None:
+                self.compositor.invalidate(self.content)
+
+    def hide(self) -> None:
+        self.show(False)
+
+
+class Compositor:
+    """Layers composed onto ``screen``, a device or a display writer.
+
+    The opaque, full-screen ``app`` layer is created up front and is fed
+    by :meth:`display` and :meth:`display_windows`.
+    """
+
+    def __init__(self, screen) -> None:
+        self.screen = screen
+        self.mode = "RGB"
+        self.size = screen.size
+        self.width = screen.width
+        self.height = screen.height
+        self.bounding_box = (0, 0, self.width - 1, self.height - 1)
+        self.layers: list[Layer] = []
+        # The last composed frame; sent frames are copies of it.
+        self.frame = Image.new("RGB", self.size, colors.background)
+        self._dirty: list[Box] = []
+        self._packer = Rgb565Packer(self.width * self.height)
+        self.app = self.add_layer("app", APP, opaque=True)
+
+    def add_layer(
+        self,
+        name: str,
+        z: int,
+        box: Optional[Box] = None,
+        opaque: bool = False,
+    ) -> Layer:
+        layer = Layer(self, name, z, box or (0, 0) + self.size, opaque)
+        self.layers.append(layer)
+        # Stable sort: a new layer goes above others with the same z.
+        self.layers.sort(key=lambda item: item.z)
+        return layer
+
+    def layer(self, name: str) -> Layer:
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        raise KeyError(name)
+
+    def invalidate(self, box: Optional[Box] = None) -> None:
+        """Recompose ``box`` (default the whole screen) on the next render."""
+        self._dirty.append(box or (0, 0) + self.size)
+
+    def _covered(self, box: Box, above: int) -> bool:
+        """Return True if a visible layer above z ``above`` overlaps."""
+        return any(
+            layer.z > above
+            and layer.visible
+            and layer.content is not None
+            and _intersect(box, layer.content) is not None
+            for layer in self.layers
+        )
+
+    def _compose(self, box: Box) -> tuple[Box, bytes]:
+        region = Image.new(
+            "RGB", (box[2] - box[0], box[3] - box[1]), colors.background
+        )
+        for layer in self.layers:
+            if not layer.visible or layer.content is None:
+                continue
+            overlap = _intersect(box, layer.content)
+            if overlap is None:
+                continue
+            x, y = layer.box[:2]
+            left, top, right, bottom = overlap
+            part = layer.surface.crop(
+                (left - x, top - y, right - x, bottom - y)
+            )
+            at = (left - box[0], top - box[1])
+            region.paste(part, at, None if layer.opaque else part)
+        self.frame.paste(region, box[:2])
+        return box, bytes(self._packer.pack(region))
+
+    def render(self, windows: Optional[list] = None) -> int:
+        """Send the dirty areas, after ``windows`` already packed.
+
+        Returns the number of windows sent.
+        """
+        windows = list(windows or [])
+        dirty, self._dirty = merge_boxes(self._dirty), []
+        with tracing.span("compose"):
+            windows += [self._compose(box) for box in dirty]
+        if windows:
+            self.screen.display_windows(self.frame.copy(), windows)
+        return len(windows)
+
+    # --- The app layer ---
+
+    def display(self, image: Image.Image) -> None:
+        """Show ``image`` as the app layer, sending only what changed."""
+        image = image.convert("RGB")
+        box = ImageChops.difference(self.app.surface, image).getbbox()
+        self.app.surface = image
+        if box is not None:
+            self.invalidate(box)
+        self.render()
+
+    def display_windows(self, image: Image.Image, windows: list) -> None:
+        """Show ``image`` as the app layer given the windows that changed.
+
+        Windows not covered by a higher layer are sent as packed.
+        """
+        self.app.surface = image
+        passed = []
+        for box, data in windows:
+            if self._covered(box, APP):
+                self.invalidate(box)
+            else:
+                self.frame.paste(image.crop(box), box[:2])
+                passed.append((box, data))
+        self.render(passed)
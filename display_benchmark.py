@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Time full-frame updates on a simulated panel.
+
+Compares luma's stock ST7735 path (18-bit colour sent as Python lists)
+with the HAT driver's RGB565 path, using NumPy and the Pillow fallback.
+Every frame is different noise so each update is a full-frame push.
+Then times a snake game tick drawn the old way (whole frame redrawn and
+diffed) against the tile engine, alone and under a compositor with a
+popup over part of the board. Nothing is sent to real hardware.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from luma.core.render import canvas
+from luma.lcd.device import st7735
+from PIL import Image
+
+import memory_profile
+from compositor import OVERLAY, Compositor
+from palette import colors
+from rgb565 import Rgb565Packer, numpy
+from simulated_hat import create_simulated_device
+from tile_engine import Tileset, TileScene
+
+# Nominal SPI clock, used only to estimate time on the wire.
+BUS_SPEED_HZ = 16000000
+
+# Snake ticks: a snake of SNAKE_LENGTH 4 px cells circling the board.
+SNAKE_CELL = 4
+SNAKE_LENGTH = 20
+
+
+def make_frames(count: int, size: tuple[int, int]) -> list[Image.Image]:
+    return [
+        Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+        for _ in range(count)
+    ]
+
+
+def run(name: str, device, frames: list[Image.Image]) -> None:
+    timed(name, device, len(frames), lambda i: device.display(frames[i]))
+
+
+def timed(name: str, device, count: int, draw_frame) -> None:
+    spi_dev = device.simulated_spi
+    spi_dev.bytes_written = 0
+    spi_dev.transfers = 0
+    start = time.perf_counter()
+    for i in range(count):
+        draw_frame(i)
+    elapsed = (time.perf_counter() - start) / count
+    sent = spi_dev.bytes_written / count
+    wire = sent * 8 / BUS_SPEED_HZ
+    print(
+        f"{name:<14} {elapsed * 1e3:7.2f} ms/frame"
+        f" {sent / 1024:6.1f} KB/frame"
+        f" {spi_dev.transfers / count:5.1f} transfers/frame"
+        f" ~{wire * 1e3:5.1f} ms on the wire"
+    )
+
+
+def snake_positions(count: int, cols: int) -> list[list[tuple[int, int]]]:
+    """The snake's cells on each tick, moving round the board's edge."""
+    ring = (
+        [(x, 0) for x in range(cols)]
+        + [(cols - 1, y) for y in range(1, cols)]
+        + [(x, cols - 1) for x in range(cols - 2, -1, -1)]
+        + [(0, y) for y in range(cols - 2, 0, -1)]
+    )
+    return [
+        [ring[(i - n) % len(ring)] for n in range(SNAKE_LENGTH)]
+        for i in range(count)
+    ]
+
+
+def run_snake(count: int) -> None:
+    cols = 128 // SNAKE_CELL
+    ticks = snake_positions(count, cols)
+
+    device = create_simulated_device()
+
+    def draw_canvas(i: int) -> None:
+        with canvas(device) as draw:
+            for x, y in ticks[i]:
+                draw.rectangle(
+                    (
+                        x * SNAKE_CELL,
+                        y * SNAKE_CELL,
+                        (x + 1) * SNAKE_CELL - 1,
+                        (y + 1) * SNAKE_CELL - 1,
+                    ),
+                    fill=colors.accent,
+                )
+
+    draw_canvas(0)
+    timed("snake canvas", device, count, draw_canvas)
+
+    device = create_simulated_device()
+    tileset = Tileset(SNAKE_CELL)
+    tileset.add("empty", colors.background)
+    tileset.add("body", colors.accent)
+    scene = TileScene(device, tileset, "empty")
+
+    def draw_tiles(i: int) -> None:
+        if i:
+            for x, y in ticks[i - 1]:
+                scene.set_tile(x, y, "empty")
+        for x, y in ticks[i]:
+            scene.set_tile(x, y, "body")
+        scene.render()
+
+    draw_tiles(0)
+    timed("snake tiles", device, count, draw_tiles)
+
+    # The same ticks with a translucent popup over the middle of the
+    # board: only the cells under it are recomposed.
+    device = create_simulated_device()
+    compositor = Compositor(device)
+    popup = compositor.add_layer("popup", OVERLAY)
+    popup.paste(Image.new("RGBA", (64, 32), (0, 0, 0, 128)), (32, 48))
+    scene = TileScene(compositor, tileset, "empty")
+    draw_tiles(0)
+    timed("snake + popup", device, count, draw_tiles)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=100)
+    args = parser.parse_args()
+
+    stock = create_simulated_device(st7735)
+    frames = make_frames(args.frames, stock.size)
+    run("luma RGB666", stock, frames)
+
+    device = create_simulated_device()
+    if numpy is not None:
+        run("RGB565 numpy", device, frames)
+    else:
+        print("RGB565 numpy   skipped (numpy not installed)")
+    device._packer = Rgb565Packer(device.width * device.height, "pil")
+    run("RGB565 pillow", device, frames)
+
+    run_snake(args.frames)
+
+    if not memory_profile.check_budget(sys.argv[0]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Push frames to the LCD from a dedicated writer thread.
+
+A full frame takes several milliseconds on the SPI bus, and calling
+``device.display`` from an app's loop stalls input handling and game
+ticks for that long. :class:`DisplayWriter` hands finished frames to a
+writer thread instead: the app keeps composing the next frame (into
+:attr:`DisplayWriter.back` or a fresh ``canvas``) while the previous one
+is still on the wire. Only the newest finished frame is kept, so if the
+app outpaces the bus, stale frames are dropped rather than queued.
+
+The writer looks enough like a luma device for ``canvas(writer)``.
+"""
+
+import threading
+import time
+from typing import Optional
+
+from PIL import Image
+
+import tracing
+from palette import colors
+
+
+class DisplayWriter:
+    """Double-buffered, latest-frame-wins display output for ``device``."""
+
+    def __init__(self, device) -> None:
+        self.device = device
+        self.mode = device.mode
+        self.size = device.size
+        self.width = device.width
+        self.height = device.height
+        self.bounding_box = device.bounding_box
+        # The app draws into the back buffer; present() hands a copy to
+        # the writer so the back buffer keeps its contents.
+        self.back = Image.new(self.mode, self.size, colors.background)
+        self.frames = 0
+        self.dropped = 0
+        self._cond = threading.Condition()
+        self._pending: Optional[Image.Image] = None
+        self._pending_windows: Optional[list] = None
+        self._pending_draw: Optional[float] = None
+        self._pending_at = 0
+        self._sending = False
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def display(self, image: Image.Image) -> None:
+        """Queue ``image`` for the panel; the writer owns it from now on."""
+        self._queue(image, None)
+
+    def display_windows(self, image: Image.Image, windows: list) -> None:
+        """Queue packed windows for ``device.display_windows``.
+
+        The window data must not be reused by the caller. If an earlier
+        frame is still queued, both frames' windows are sent.
+        """
+        self._queue(image, list(windows))
+
+    def _queue(self, image: Image.Image, windows: Optional[list]) -> None:
+        stats = getattr(self.device, "stats", None)
+        # Draw time is the app thread's CPU time, so measure it here.
+        draw = stats.draw_time() if stats is not None else None
+        with self._cond:
+            self._raise_error()
+            if self._pending is not None:
+                self.dropped += 1
+                if windows is not None:
+                    if self._pending_windows is None:
+                        # A whole frame is queued: diff this one instead.
+                        windows = None
+                    else:
+                        windows = self._pending_windows + windows
+            self._pending = image
+            self._pending_windows = windows
+            self._pending_draw = draw
+            self._pending_at = time.perf_counter_ns()
+            self._cond.notify()
+
+    def present(self) -> None:
+        """Queue the current contents of :attr:`back`."""
+        self.display(self.back.copy())
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                image, self._pending = self._pending, None
+                windows = self._pending_windows
+                draw = self._pending_draw
+                tracing.complete("queued", self._pending_at)
+                self._sending = True
+            try:
+                if windows is not None:
+                    self.device.display_windows(image, windows, draw)
+                elif draw is None:
+                    self.device.display(image)
+                else:
+                    self.device.display(image, draw_time=draw)
+            except Exception as exc:
+                with self._cond:
+                    self._error = exc
+            else:
+                self.frames += 1
+            with self._cond:
+                self._sending = False
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued frame is on the panel."""
+        with self._cond:
+            done = self._cond.wait_for(
+                lambda: self._pending is None and not self._sending,
+                timeout,
+            )
+            self._raise_error()
+            return done
+
+    def close(self) -> None:
+        """Send the last frame and stop the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
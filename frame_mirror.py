@@ -0,0 +1,174 @@
+"""Shared snapshot of the LCD framebuffer for the remote mirror.
+
+Whichever app currently owns the panel publishes every frame it sends to
+the LCD into a small memory-mapped file. The remote control server reads
+that single snapshot, diffs it tile by tile against the previous one and
+encodes the changes once for all connected viewers.
+
+The snapshot is a seqlock: the writer bumps the sequence number to an odd
+value before copying pixels and back to an even value afterwards, so a
+reader can tell when it raced a write and simply retry.
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+from typing import Optional
+
+_SHM_DIR = "/dev/shm"
+FRAME_PATH = os.path.join(
+    _SHM_DIR if os.path.isdir(_SHM_DIR) else tempfile.gettempdir(),
+    "nanodeck-frame",
+)
+
+# seq (u64), width (u16), height (u16), padding
+_HEADER = struct.Struct("<QHH4x")
+
+# Tiles are square; 16 px gives 64 tiles on the 128x128 panel.
+TILE_SIZE = 16
+
+# Mirror message: width, height, tile size, tile count, then for every
+# tile its column, row and raw RGB888 pixels (row-major).
+_MESSAGE_HEADER = struct.Struct("<HHBH")
+_TILE_HEADER = struct.Struct("<BB")
+
+
+class FrameWriter:
+    """Publish frames into the shared snapshot file."""
+
+    def __init__(self, width: int, height: int, path: str = FRAME_PATH):
+        self.width = width
+        self.height = height
+        size = _HEADER.size + width * height * 3
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        seq = _HEADER.unpack_from(self._map, 0)[0]
+        _HEADER.pack_into(self._map, 0, seq + (seq & 1), width, height)
+
+    def publish(self, pixels: bytes) -> None:
+        """Copy one RGB888 frame into the snapshot."""
+        # The menu and the app it starts take turns writing the same
+        # file, so continue from the sequence number found there rather
+        # than from a copy that may have fallen behind.
+        seq = _HEADER.unpack_from(self._map, 0)[0]
+        seq += 1 + (seq & 1)
+        _HEADER.pack_into(self._map, 0, seq, self.width, self.height)
+        self._map[_HEADER.size:] = pixels
+        _HEADER.pack_into(self._map, 0, seq + 1, self.width, self.height)
+
+
+class FrameReader:
+    """Read consistent copies of the shared snapshot."""
+
+    def __init__(self, path: str = FRAME_PATH) -> None:
+        self._path = path
+        self._map: Optional[mmap.mmap] = None
+
+    def _open(self) -> bool:
+        try:
+            fd = os.open(self._path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            size = os.fstat(fd).st_size
+            if size <= _HEADER.size:
+                return False
+            self._map = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        return True
+
+    def read(self) -> Optional[tuple[int, int, int, bytes]]:
+        """Return ``(seq, width, height, pixels)`` or None if unavailable."""
+        if self._map is None and not self._open():
+            return None
+        for _attempt in range(5):
+            seq, width, height = _HEADER.unpack_from(self._map, 0)
+            if seq & 1:
+                continue
+            end = _HEADER.size + width * height * 3
+            if end > len(self._map):
+                # The writer resized the file; map it again.
+                self._map.close()
+                self._map = None
+                return self.read() if self._open() else None
+            pixels = self._map[_HEADER.size:end]
+            if _HEADER.unpack_from(self._map, 0)[0] == seq:
+                return seq, width, height, pixels
+        return None
+
+
+class TileEncoder:
+    """Encode only the tiles that changed since the previous frame."""
+
+    def __init__(self, tile_size: int = TILE_SIZE) -> None:
+        self.tile_size = tile_size
+        self._previous: Optional[bytes] = None
+        self._size: Optional[tuple[int, int]] = None
+
+    def reset(self) -> None:
+        """Forget the previous frame so the next encode is a keyframe."""
+        self._previous = None
+
+    def encode(self, width: int, height: int, pixels: bytes) -> bytes:
+        """Return a mirror message for ``pixels`` (possibly zero tiles)."""
+        tile = self.tile_size
+        stride = width * 3
+        previous = self._previous
+        if self._size != (width, height):
+            previous = None
+        tiles = []
+        view = memoryview(pixels)
+        for top in range(0, height, tile):
+            bottom = min(top + tile, height)
+            band = slice(top * stride, bottom * stride)
+            # Skip unchanged bands with one comparison before looking
+            # at individual tiles.
+            if previous is not None and view[band] == previous[band]:
+                continue
+            for left in range(0, width, tile):
+                right = min(left + tile, width)
+                rows = [
+                    view[y * stride + left * 3:y * stride + right * 3]
+                    for y in range(top, bottom)
+                ]
+                if previous is not None and all(
+                    row == previous[
+                        y * stride + left * 3:y * stride + right * 3
+                    ]
+                    for y, row in zip(range(top, bottom), rows)
+                ):
+                    continue
+                tiles.append(
+                    _TILE_HEADER.pack(left // tile, top // tile)
+                    + b"".join(rows)
+                )
+        self._previous = bytes(pixels)
+        self._size = (width, height)
+        return (
+            _MESSAGE_HEADER.pack(width, height, tile, len(tiles))
+            + b"".join(tiles)
+        )
+
+
+_writer: Optional[FrameWriter] = None
+_disabled = False
+
+
+def publish(image) -> None:
+    """Publish a PIL RGB image; mirroring never breaks the display."""
+    global _writer, _disabled
+    if _disabled:
+        return
+    try:
+        if _writer is None:
+            _writer = FrameWriter(*image.size)
+        _writer.publish(image.tobytes())
+    except (OSError, ValueError):
+        _disabled = True
@@ -0,0 +1,162 @@
+"""Per-frame timing and SPI throughput counters for the LCD.
+
+When frame stats are switched on (Settings -> Display), the display path
+times every frame in three parts:
+
+* draw: CPU time the app's thread spent between two frames, which is the
+  drawing and game logic but not time spent waiting for input;
+* convert: the frame diff and the RGB565 packing;
+* transfer: the SPI writes, together with the number of bytes sent.
+
+The counters are kept in a small memory-mapped file (a seqlock, like the
+frame mirror) so the remote control server can report them for whichever
+app owns the panel, and :meth:`FrameStats.draw_overlay` paints them over
+the frame while KEY1 and KEY2 are held together. When stats are off the
+display path does not touch this module at all.
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Optional
+
+_SHM_DIR = "/dev/shm"
+STATS_PATH = os.path.join(
+    _SHM_DIR if os.path.isdir(_SHM_DIR) else tempfile.gettempdir(),
+    "nanodeck-stats",
+)
+
+# seq, pid, frames, bytes, total draw/convert/transfer ns, then moving
+# averages: fps, draw/convert/transfer ms and bytes per frame.
+_RECORD = struct.Struct("<QIQQQQQ5d")
+_FIELDS = (
+    "pid",
+    "frames",
+    "bytes",
+    "draw_ns",
+    "convert_ns",
+    "transfer_ns",
+    "fps",
+    "draw_ms",
+    "convert_ms",
+    "transfer_ms",
+    "frame_bytes",
+)
+
+# Weight of the newest frame in the moving averages.
+SMOOTHING = 0.1
+
+
+class FrameStats:
+    """Accumulate frame timings and publish them for other processes."""
+
+    def __init__(self, path: str = STATS_PATH) -> None:
+        self.frames = 0
+        self.bytes = 0
+        self.totals = [0, 0, 0]  # draw, convert, transfer (ns)
+        self.fps = 0.0
+        self.averages = [0.0, 0.0, 0.0]  # draw, convert, transfer (ms)
+        self.frame_bytes = 0.0
+        self._seq = 0
+        self._last_cpu = time.thread_time()
+        self._last_frame: Optional[float] = None
+        self._map: Optional[mmap.mmap] = None
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.ftruncate(fd, _RECORD.size)
+                self._map = mmap.mmap(fd, _RECORD.size)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+        self._overlay_font = None
+
+    def draw_time(self) -> float:
+        """Return the calling thread's CPU seconds since its last call.
+
+        The thread that draws the frames calls this once per frame.
+        """
+        now = time.thread_time()
+        draw, self._last_cpu = now - self._last_cpu, now
+        return draw
+
+    def record(
+        self, draw: float, convert: float, transfer: float, sent: int
+    ) -> None:
+        """Add one frame (times in seconds) and publish the counters."""
+        now = time.perf_counter()
+        if self._last_frame is not None and now > self._last_frame:
+            rate = 1.0 / (now - self._last_frame)
+            self.fps += SMOOTHING * (rate - self.fps)
+        self._last_frame = now
+        self.frames += 1
+        self.bytes += sent
+        self.frame_bytes += SMOOTHING * (sent - self.frame_bytes)
+        for i, seconds in enumerate((draw, convert, transfer)):
+            self.totals[i] += int(seconds * 1e9)
+            self.averages[i] += SMOOTHING * (seconds * 1e3 - self.averages[i])
+        self._publish()
+
+    def _publish(self) -> None:
+        if self._map is None:
+            return
+        values = (
+            os.getpid(),
+            self.frames,
+            self.bytes,
+            *self.totals,
+            self.fps,
+            *self.averages,
+            self.frame_bytes,
+        )
+        self._seq += 1
+        _RECORD.pack_into(self._map, 0, self._seq, *values)
+        self._seq += 1
+        _RECORD.pack_into(self._map, 0, self._seq, *values)
+
+    def draw_overlay(self, image):
+        """Return a copy of ``image`` with the averages drawn on top."""
+        from PIL import ImageDraw, ImageFont
+
+        from palette import colors
+
+        if self._overlay_font is None:
+            self._overlay_font = ImageFont.load_default()
+        draw_ms, convert_ms, transfer_ms = self.averages
+        lines = (
+            f"{self.fps:5.1f} fps {self.frame_bytes / 1024:5.1f}K",
+            f"draw {draw_ms:6.1f} ms",
+            f"conv {convert_ms:6.1f} ms",
+            f"spi  {transfer_ms:6.1f} ms",
+        )
+        image = image.copy()
+        draw = ImageDraw.Draw(image)
+        draw.rectangle(
+            (0, 0, image.width - 1, 12 * len(lines)), fill=colors.background
+        )
+        for i, line in enumerate(lines):
+            draw.text((2, 1 + 12 * i), line, fill=colors.accent,
+                      font=self._overlay_font)
+        return image
+
+
+def read(path: str = STATS_PATH) -> Optional[dict]:
+    """Return the latest published counters, or None if there are none."""
+    try:
+        with open(path, "rb", buffering=0) as stats_file:
+            for _attempt in range(5):
+                stats_file.seek(0)
+                data = stats_file.read(_RECORD.size)
+                if len(data) < _RECORD.size:
+                    return None
+                seq, *values = _RECORD.unpack(data)
+                stats_file.seek(0)
+                if seq & 1 or stats_file.read(8) != data[:8]:
+                    continue
+                return dict(zip(_FIELDS, values)) if seq else None
+    except OSError:
+        pass
+    return None
@@ -0,0 +1,726 @@
+#!/usr/bin/env python3
+"""Check what the apps draw against stored golden frames.
+
+Each scenario runs an app script on a simulated panel (see
+:mod:`simulated_hat`) in its own process, presses buttons on a simulated
+GPIO, and at every checkpoint compares the frame on the panel with a
+PNG under ``golden/<scenario>/``. A checkpoint over a range of frames
+compares them all at once against one strip image, so a game's first
+few hundred ticks cost one vectorized diff.
+
+Pixels count as different when a channel is off by more than the
+tolerance, which by default absorbs the rounding RGB565 does on the
+glass anyway. Failures list the differing regions and leave the actual
+frame and a diff image in :data:`FAIL_DIR`. After an intended change to
+what an app draws, record new golden frames with ``--update``.
+
+Run it on the Pi or any machine with the requirements installed; the
+clocks, status bars and animations that change with time are masked.
+"""
+
+import argparse
+import json
+import os
+import random
+import runpy
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import Callable, NamedTuple, Optional
+
+from PIL import Image, ImageChops
+
+import simulated_gpio
+from rgb565 import numpy
+from tile_engine import merge_cells
+
+Box = tuple[int, int, int, int]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = os.path.join(HERE, "golden")
+FAIL_DIR = os.path.join(tempfile.gettempdir(), "nanodeck-golden")
+# Scenarios view copies of these pictures, so that thumbnails, tiles and
+# placeholders they create never land in the real images/ directory.
+IMAGES_DIR = os.path.join(HERE, "images")
+
+# Largest per-channel difference still counted as equal. RGB565 keeps 5
+# or 6 bits per channel, so smaller differences never reach the panel.
+TOLERANCE = 8
+# Differences are reported as rectangles of DIFF_TILE px cells.
+DIFF_TILE = 8
+
+# A checkpoint waits until the unmasked part of the screen has not
+# changed for SETTLE_TIME, or gives up after STEP_TIMEOUT.
+SETTLE_TIME = 0.3
+STEP_TIMEOUT = 10.0
+POLL_INTERVAL = 0.02
+# Short enough that held buttons do not repeat.
+PRESS_TIME = 0.05
+EXIT_BUTTON = "KEY3"
+EXIT_PRESSES = 4
+EXIT_WAIT = 1.0
+# A scenario's process is killed after this long.
+RUN_TIMEOUT = 120.0
+
+# --- Scenarios ---
+
+
+class Press(NamedTuple):
+    """Press ``button`` and release it ``hold`` seconds later."""
+
+    button: str
+    hold: float = PRESS_TIME
+
+
+class Wait(NamedTuple):
+    seconds: float
+
+
+class Check(NamedTuple):
+    """Compare the screen with the golden frame ``name``.
+
+    ``frames=(start, stop)`` compares the frames sent since the app
+    started instead of the current one. ``mask`` boxes are ignored.
+    """
+
+    name: str
+    mask: tuple[Box, ...] = ()
+    frames: Optional[tuple[int, int]] = None
+    tolerance: int = TOLERANCE
+
+
+class Scenario(NamedTuple):
+    """Run ``script`` with ``args`` through ``steps``.
+
+    ``setup`` runs in the app's process just before the script.
+    """
+
+    script: str
+    steps: tuple
+    args: tuple[str, ...] = ()
+    setup: Optional[Callable[[], None]] = None
+
+
+STATUS_BAR: Box = (0, 0, 128, 12)
+
+IRC_LINES = (
+    ":irc.local 001 birdie :Welcome to the test network",
+    ":alice!alice@pet.local PRIVMSG #pet :morning birdie",
+    ":bob!bob@pet.local PRIVMSG #pet :the feeder is empty again",
+    ":alice!alice@pet.local PRIVMSG #pet :on it",
+    ":carol!carol@pet.local PRIVMSG #other :not for this channel",
+    ":bob!bob@pet.local PRIVMSG #pet :thanks, the sparrows were"
+    " getting loud about it",
+    ":alice!alice@pet.local PRIVMSG #pet :done",
+)
+
+
+def serve_irc(lines: tuple[str, ...] = IRC_LINES) -> None:
+    """Point :mod:`irc_link` at a local server that sends ``lines``."""
+    import irc_link
+
+    server = socket.create_server(("127.0.0.1", 0))
+    irc_link.SERVER, irc_link.PORT = server.getsockname()
+
+    def serve() -> None:
+        conn, _address = server.accept()
+        with conn:
+            conn.sendall("".join(f"{line}\r\n" for line in lines).encode())
+            # Hold the connection open until the client quits.
+            while conn.recv(4096):
+                pass
+
+    threading.Thread(target=serve, daemon=True).start()
+
+
+def no_irc() -> None:
+    """Point :mod:`irc_link` at a local port nothing listens on."""
+    import irc_link
+
+    with socket.socket() as unused:
+        unused.bind(("127.0.0.1", 0))
+        irc_link.SERVER, irc_link.PORT = unused.getsockname()
+
+
+SCENARIOS = {
+    "images": Scenario(
+        "images_app.py",
+        (
+            Check("first"),
+            Press("JOY_RIGHT"),
+            Check("next"),
+            Press("JOY_LEFT"),
+            Press("JOY_LEFT"),
+            Check("previous"),
+        ),
+        args=("1.png",),
+    ),
+    "main_menu": Scenario(
+        "main_menu.py",
+        (
+            Check("menu", mask=(STATUS_BAR,)),
+            Press("JOY_DOWN"),
+            Check("input_selected", mask=(STATUS_BAR,)),
+            Press("JOY_DOWN"),
+            Press("JOY_DOWN"),
+            Press("JOY_DOWN"),
+            Press("JOY_DOWN"),
+            Check("scrolled", mask=(STATUS_BAR,)),
+        ),
+        # The IRC mention watcher must not reach the real server.
+        setup=no_irc,
+    ),
+    "irc": Scenario(
+        "irc_chat.py",
+        (
+            Check("messages", mask=(STATUS_BAR,)),
+            Press("JOY_UP"),
+            Press("JOY_UP"),
+            Press("JOY_UP"),
+            Check("scrolled_back", mask=(STATUS_BAR,)),
+        ),
+        setup=serve_irc,
+    ),
+    "settings": Scenario(
+        "settings_menu.py",
+        (
+            Check("main", mask=(STATUS_BAR,)),
+            Press("JOY_DOWN"),
+            Check("connections_selected", mask=(STATUS_BAR,)),
+            Press("JOY_UP"),
+            Press("KEY1"),
+            Check("display", mask=(STATUS_BAR,)),
+            Press("KEY1"),
+            Check("brightness"),
+            Press("JOY_LEFT"),
+            Check("brightness_down"),
+            Press("KEY1"),
+            Check("after_brightness", mask=(STATUS_BAR,)),
+        ),
+    ),
+    "snake": Scenario(
+        "snake_game.py",
+        (
+            Check("start", frames=(0, 2)),
+            Check("run_right", frames=(2, 9)),
+            Press("JOY_DOWN"),
+            Check("turn_down", frames=(9, 13)),
+        ),
+    ),
+    "buttons": Scenario(
+        "test_screen_buttons_joystick.py",
+        (
+            Check("released", mask=((0, 0, 128, 25), (5, 100, 124, 116))),
+            Press("KEY1", hold=1.0),
+            Check("key1_held", mask=((0, 0, 128, 25), (5, 100, 124, 116))),
+            Wait(0.5),
+            Check("key1_released",
+                  mask=((0, 0, 128, 25), (5, 100, 124, 116))),
+        ),
+    ),
+    "lcd_test": Scenario(
+        "test_144_lcd.py",
+        (Check("screen", mask=((5, 25, 128, 65), (5, 90, 123, 106))),),
+    ),
+}
+
+# --- Diffing ---
+
+
+class FrameDiff(NamedTuple):
+    pixels: int
+    max_delta: int
+    # (frame index, box) of each differing area.
+    regions: list[tuple[int, Box]]
+
+
+def masked(image: Image.Image, mask, frame_width: int) -> Image.Image:
+    """Black out ``mask`` boxes in every frame of a strip."""
+    if not mask:
+        return image
+    image = image.copy()
+    for offset in range(0, image.width, frame_width):
+        for box in mask:
+            image.paste(
+                0, (box[0] + offset, box[1], box[2] + offset, box[3])
+            )
+    return image
+
+
+def _bad_cells_numpy(actual, expected, tolerance):
+    # Unsigned |a - b| without widening, then the largest channel;
+    # elementwise maximum is much faster than reducing over an axis.
+    a = numpy.asarray(actual)
+    b = numpy.asarray(expected)
+    delta = numpy.maximum(a, b)
+    delta -= numpy.minimum(a, b)
+    delta = numpy.maximum(
+        numpy.maximum(delta[..., 0], delta[..., 1]), delta[..., 2]
+    )
+    bad = delta > tolerance
+    rows, cols = bad.shape
+    cells = (
+        bad.reshape(rows // DIFF_TILE, DIFF_TILE, cols // DIFF_TILE,
+                    DIFF_TILE)
+        .max(axis=3)
+        .max(axis=1)
+    )
+    rows, cols = numpy.nonzero(cells)
+    return (
+        int(numpy.count_nonzero(bad)),
+        int(delta.max()),
+        list(zip(cols.tolist(), rows.tolist())),
+    )
+
+
+def _bad_cells_pil(actual, expected, tolerance):
+    red, green, blue = ImageChops.difference(actual, expected).split()
+    delta = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+    bad = delta.point(lambda value: 255 if value > tolerance else 0)
+    # A cell with any bad pixel has a non-zero mean.
+    size = (bad.width // DIFF_TILE, bad.height // DIFF_TILE)
+    cells = bad.resize(size, Image.BOX, reducing_gap=None)
+    data = cells.tobytes()
+    return (
+        bad.histogram()[255],
+        delta.getextrema()[1],
+        [
+            (index % size[0], index // size[0])
+            for index, value in enumerate(data)
+            if value
+        ],
+    )
+
+
+def diff_frames(
+    actual: Image.Image,
+    expected: Image.Image,
+    tolerance: int = TOLERANCE,
+    frame_width: Optional[int] = None,
+) -> FrameDiff:
+    """Compare two frames, or two strips of ``frame_width`` px frames."""
+    if frame_width is None:
+        frame_width = actual.width
+    if actual.size != expected.size:
+        return FrameDiff(actual.width * actual.height, 255,
+                         [(0, (0, 0) + actual.size)])
+    if numpy is not None:
+        pixels, max_delta, cells = _bad_cells_numpy(
+            actual, expected, tolerance
+        )
+    else:
+        pixels, max_delta, cells = _bad_cells_pil(
+            actual, expected, tolerance
+        )
+    # Group the cells by frame and merge each frame's into rectangles.
+    per_frame = frame_width // DIFF_TILE
+    by_frame: dict[int, list[tuple[int, int]]] = {}
+    for col, row in cells:
+        by_frame.setdefault(col // per_frame, []).append(
+            (col % per_frame, row)
+        )
+    regions = [
+        (index, tuple(edge * DIFF_TILE for edge in rect))
+        for index, frame_cells in sorted(by_frame.items())
+        for rect in merge_cells(frame_cells)
+    ]
+    return FrameDiff(pixels, max_delta, regions)
+
+
+def diff_image(actual: Image.Image, expected: Image.Image) -> Image.Image:
+    """The actual frame dimmed, with differing pixels in red."""
+    difference = ImageChops.difference(actual, expected).convert("L")
+    mark = difference.point(lambda value: 255 if value else 0)
+    image = Image.eval(actual, lambda value: value // 3)
+    image.paste((255, 0, 0), mask=mark)
+    return image
+
+
+def strip(frames: list[Image.Image]) -> Image.Image:
+    """Put ``frames`` side by side in one image."""
+    width, height = frames[0].size
+    image = Image.new(frames[0].mode, (width * len(frames), height))
+    for index, frame in enumerate(frames):
+        image.paste(frame, (index * width, 0))
+    return image
+
+
+# --- Running an app ---
+
+
+class FrameRecorder:
+    """Every frame an app sends to the panel, in order."""
+
+    def __init__(self) -> None:
+        self.frames: list[Image.Image] = []
+        self._cond = threading.Condition()
+
+    def add(self, image: Image.Image) -> None:
+        # Apps keep drawing into frames they already sent.
+        image = image.copy()
+        with self._cond:
+            self.frames.append(image)
+            self._cond.notify_all()
+
+    def wait_for(self, count: int, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: len(self.frames) >= count, timeout
+            )
+
+    def latest(self) -> Optional[Image.Image]:
+        with self._cond:
+            return self.frames[-1] if self.frames else None
+
+
+def _patch_create_device(recorder: FrameRecorder) -> None:
+    """Have ``hat.create_device`` open a recording simulated panel.
+
+    Everything else ``create_device`` does (settings, SPI tuning, frame
+    stats, tracing) runs as on the Pi.
+    """
+    import hat
+    from simulated_hat import create_simulated_device
+
+    class RecordingHat(hat.HatST7735):
+        # Off while create_device probes the SPI bus, so that the first
+        # recorded frame is the app's.
+        recording = False
+
+        def display(self, image, draw_time=None):
+            if self.recording:
+                recorder.add(image)
+            super().display(image, draw_time)
+
+        def display_windows(self, image, windows, draw_time=None):
+            if self.recording:
+                recorder.add(image)
+            super().display_windows(image, windows, draw_time)
+
+    real_create_device = hat.create_device
+
+    def create_device():
+        device = real_create_device(
+            lambda settings: create_simulated_device(RecordingHat)
+        )
+        device.recording = True
+        return device
+
+    hat.create_device = create_device
+
+
+def copy_images(target: str) -> None:
+    """Copy the pictures in :data:`IMAGES_DIR`, not its caches."""
+    shutil.copytree(
+        IMAGES_DIR,
+        target,
+        ignore=lambda _dir, names: [n for n in names if n.startswith(".")],
+    )
+
+
+def use_images(img_dir: str) -> None:
+    """Point the image viewer and its caches at ``img_dir``."""
+    import image_transcode
+    import tile_pyramid
+
+    image_transcode.IMG_DIR = img_dir
+    image_transcode.ORIGINALS_DIR = os.path.join(img_dir, ".originals")
+    image_transcode.THUMBS_DIR = os.path.join(img_dir, ".thumbs")
+    image_transcode.INCOMING_DIR = os.path.join(img_dir, ".incoming")
+    tile_pyramid.PYRAMID_DIR = os.path.join(img_dir, ".tiles")
+
+
+class AppRun:
+    """Run ``scenario``'s script, pressing simulated buttons.
+
+    The app runs on the main thread, as it does on the Pi, so that its
+    signal handlers and Ctrl+C work; the steps run on another thread.
+    """
+
+    def __init__(self, scenario: Scenario) -> None:
+        self.scenario = scenario
+        self.recorder = FrameRecorder()
+        self.error: Optional[str] = None
+        # Must happen before anything imports the HAT or the input mux.
+        self.gpio = simulated_gpio.install()
+        _patch_create_device(self.recorder)
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        """Run the app until it exits; call on the main thread."""
+        path = os.path.join(HERE, self.scenario.script)
+        sys.argv = [path, *self.scenario.args]
+        if self.scenario.setup is not None:
+            self.scenario.setup()
+        # Snake places its food with random.
+        random.seed(0)
+        try:
+            runpy.run_path(path, run_name="__main__")
+        except (SystemExit, KeyboardInterrupt):
+            pass
+        except BaseException:
+            self.error = traceback.format_exc()
+        finally:
+            self._done.set()
+
+    @property
+    def running(self) -> bool:
+        return not self._done.is_set()
+
+    def press(self, button: str, hold: float = PRESS_TIME) -> None:
+        from hat import BUTTON_PINS
+
+        pin = BUTTON_PINS[button]
+        self.gpio.press(pin)
+        timer = threading.Timer(hold, self.gpio.release, (pin,))
+        timer.daemon = True
+        timer.start()
+        # Let the press reach the app before the next step; checks can
+        # run while a long press is still held.
+        time.sleep(min(hold, PRESS_TIME) + POLL_INTERVAL)
+
+    def settled(self, mask) -> Optional[Image.Image]:
+        """Wait until the unmasked screen stops changing and return it."""
+        deadline = time.monotonic() + STEP_TIMEOUT
+        shown = None
+        since = time.monotonic()
+        while time.monotonic() < deadline and self.running:
+            frame = self.recorder.latest()
+            if frame is not None:
+                contents = masked(frame, mask, frame.width).tobytes()
+                if contents != shown:
+                    shown = contents
+                    since = time.monotonic()
+                elif time.monotonic() - since >= SETTLE_TIME:
+                    return frame
+            time.sleep(POLL_INTERVAL)
+        return None
+
+    def stop(self) -> None:
+        """Press the exit button, then interrupt as Ctrl+C would."""
+        for _ in range(EXIT_PRESSES):
+            if not self.running:
+                return
+            self.press(EXIT_BUTTON)
+            self._done.wait(EXIT_WAIT)
+        # The main menu has no exit button.
+        if self.running:
+            os.kill(os.getpid(), signal.SIGINT)
+
+
+def _check(run: AppRun, name: str, check: Check, update: bool) -> dict:
+    result = {"check": f"{name}/{check.name}"}
+    if check.frames is None:
+        actual = run.settled(check.mask)
+        frame_width = None
+    else:
+        start, stop = check.frames
+        run.recorder.wait_for(stop, STEP_TIMEOUT)
+        frames = run.recorder.frames[start:stop]
+        actual = strip(frames) if len(frames) == stop - start else None
+        frame_width = run.recorder.frames[0].width if frames else None
+    if actual is None:
+        status = "app exited" if not run.running else "no stable frame"
+        return dict(result, status="fail", detail=status)
+    frame_width = frame_width or actual.width
+    actual = masked(actual, check.mask, frame_width)
+
+    path = os.path.join(GOLDEN_DIR, name, check.name + ".png")
+    if update:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        actual.save(path)
+        return dict(result, status="updated")
+    if not os.path.exists(path):
+        return dict(result, status="fail",
+                    detail="no golden frame; record it with --update")
+    with Image.open(path) as golden:
+        expected = golden.convert(actual.mode)
+
+    start = time.perf_counter()
+    diff = diff_frames(actual, expected, check.tolerance, frame_width)
+    result["diff_ms"] = (time.perf_counter() - start) * 1e3
+    result["frames"] = actual.width // frame_width
+    if not diff.pixels:
+        return dict(result, status="ok")
+
+    os.makedirs(os.path.join(FAIL_DIR, name), exist_ok=True)
+    stem = os.path.join(FAIL_DIR, name, check.name)
+    actual.save(stem + ".actual.png")
+    if actual.size == expected.size:
+        diff_image(actual, expected).save(stem + ".diff.png")
+    regions = ", ".join(
+        f"frame {index} {box}" if result["frames"] > 1 else str(box)
+        for index, box in diff.regions
+    )
+    detail = (
+        f"{diff.pixels} px differ (max {diff.max_delta}) in {regions};"
+        f" see {stem}.*.png"
+    )
+    return dict(result, status="fail", detail=detail)
+
+
+def run_scenario(name: str, update: bool = False) -> list[dict]:
+    """Run one scenario in this process; returns a result per check."""
+    scenario = SCENARIOS[name]
+    run = AppRun(scenario)
+    results = []
+
+    def play() -> None:
+        try:
+            for step in scenario.steps:
+                if isinstance(step, Press):
+                    run.press(step.button, step.hold)
+                elif isinstance(step, Wait):
+                    time.sleep(step.seconds)
+                else:
+                    results.append(_check(run, name, step, update))
+        except Exception:
+            results.append({"check": name, "status": "fail",
+                            "detail": traceback.format_exc()})
+        finally:
+            run.stop()
+
+    player = threading.Thread(target=play, daemon=True)
+    player.start()
+    run.run()
+    # stop() may interrupt an app that was already on its way out.
+    while player.is_alive():
+        try:
+            player.join()
+        except KeyboardInterrupt:
+            pass
+    if run.error is not None:
+        results.append(
+            {"check": name, "status": "fail", "detail": run.error}
+        )
+    return results
+
+
+# --- Command line ---
+
+
+def _child(
+    name: str, update: bool, result_path: str, img_dir: str
+) -> None:
+    import memory_profile
+
+    use_images(img_dir)
+
+    # Profile the whole run when asked to (see memory_profile).
+    memory_profile.install()
+    try:
+        results = run_scenario(name, update)
+    except Exception:
+        results = [{"check": name, "status": "fail",
+                    "detail": traceback.format_exc()}]
+    report = memory_profile.finish()
+    if report is not None:
+        over = memory_profile.over_budget(report)
+        results.append(dict(
+            report,
+            check=f"{name}/memory",
+            status="fail" if over else "ok",
+            detail=memory_profile.summary(report),
+        ))
+    with open(result_path, "w") as result_file:
+        json.dump(results, result_file)
+    # Apps leave worker threads behind; do not wait for them.
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def run_isolated(
+    name: str, update: bool, verbose: bool, env: Optional[dict] = None
+) -> list[dict]:
+    """Run a scenario in a fresh process with its own settings and bus.
+
+    The app sees a copy of the pictures in :data:`IMAGES_DIR`.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        result_path = os.path.join(tmp, "results.json")
+        img_dir = os.path.join(tmp, "images")
+        copy_images(img_dir)
+        env = dict(
+            os.environ,
+            XDG_CONFIG_HOME=os.path.join(tmp, "config"),
+            XDG_RUNTIME_DIR=tmp,
+            **(env or {}),
+        )
+        command = [sys.executable, os.path.abspath(__file__), "--child",
+                   name, "--result", result_path, "--images", img_dir]
+        if update:
+            command.append("--update")
+        # stdin stays open and quiet, like an idle console: the IRC
+        # client waits on it for lines to send.
+        process = subprocess.Popen(
+            command,
+            env=env,
+            cwd=HERE,
+            stdin=subprocess.PIPE,
+            stdout=None if verbose else subprocess.DEVNULL,
+            stderr=subprocess.STDOUT if not verbose else None,
+        )
+        try:
+            process.wait(RUN_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            return [{"check": name, "status": "fail",
+                     "detail": f"still running after {RUN_TIMEOUT} s"}]
+        finally:
+            process.stdin.close()
+        if not os.path.exists(result_path):
+            return [{"check": name, "status": "fail",
+                     "detail": f"exited with status {process.returncode}"}]
+        with open(result_path) as result_file:
+            return json.load(result_file)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"one of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--update", action="store_true",
+                        help="record the current frames as golden")
+    parser.add_argument("--verbose", action="store_true",
+                        help="show the apps' output")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--images", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args.child, args.update, args.result, args.images)
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+    failed = 0
+    for name in names:
+        start = time.perf_counter()
+        results = run_isolated(name, args.update, args.verbose)
+        elapsed = time.perf_counter() - start
+        for result in results:
+            line = f"{result['check']:<32} {result['status']}"
+            if "diff_ms" in result:
+                line += (f" ({result['frames']} frames,"
+                         f" {result['diff_ms']:.1f} ms)")
+            print(line)
+            if "detail" in result:
+                print("    " + result["detail"].rstrip().replace(
+                    "\n", "\n    "))
+            failed += result["status"] == "fail"
+        print(f"{name}: {len(results)} checks in {elapsed:.1f} s")
+    if failed:
+        print(f"{failed} checks failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,548 @@
+"""Shared display setup for the Waveshare 1.44 inch LCD HAT."""
+
+import itertools
+import threading
+import time
+from typing import Callable, Optional
+
+import RPi.GPIO as GPIO
+from luma.core.interface.serial import spi
+from luma.lcd.device import st7735
+
+import frame_mirror
+import memory_profile
+import notifications
+import palette
+import settings_store
+import spi_tuning
+import tracing
+from frame_stats import FrameStats
+from rgb565 import Rgb565Packer
+
+# --- Display configuration ---
+RST_PIN = 27  # GPIO pin connected to the RST (Reset) line
+DC_PIN = 25  # GPIO pin connected to the DC (Data/Command) line
+BL_PIN = 24  # GPIO pin connected to the backlight
+# CS (GPIO 8 / CE0), SCLK and MOSI are handled by the SPI interface.
+
+# The backlight is dimmed with PWM; brightness 0 still leaves the panel
+# readable so it can never be turned all the way off from the menu.
+BACKLIGHT_PWM_HZ = 1000
+BACKLIGHT_MIN = 5.0
+
+LCD_WIDTH = 128
+LCD_HEIGHT = 128
+
+# --- Buttons & joystick (BCM numbering, active low) ---
+BUTTON_PINS = {
+    "KEY1": 21,
+    "KEY2": 20,
+    "KEY3": 16,
+    "JOY_UP": 6,
+    "JOY_DOWN": 19,
+    "JOY_LEFT": 5,
+    "JOY_RIGHT": 26,
+    "JOY_PRESS": 13,
+}
+
+# Holding these together shows the frame stats overlay (when stats are
+# on). Apps bind each on its own, so the input mux keeps presses that
+# form the chord from the app; a press waits this long for its partner.
+STATS_OVERLAY_BUTTONS = ("KEY1", "KEY2")
+OVERLAY_CHORD_WINDOW = 0.15
+# How often the buttons are read so the overlay comes and goes at once,
+# even on screens that only draw when something changes.
+OVERLAY_POLL_INTERVAL = 0.05
+
+# Notification banners (see :mod:`notifications`) cover this many rows at
+# the bottom of the panel while the app keeps drawing underneath.
+BANNER_HEIGHT = 12
+
+# Column/row address commands plus memory write: 11 bytes per region.
+WINDOW_COMMAND_BYTES = 11
+
+# Interface pixel format: 16-bit RGB565 instead of luma's 18-bit mode.
+COLMOD = 0x3A
+COLMOD_RGB565 = 0x05
+
+# ST7735 commands for power saving; the panel needs 120 ms after sleep
+# out before it takes pixel data again.
+SLEEP_IN = 0x10
+SLEEP_OUT = 0x11
+DISPLAY_OFF = 0x28
+DISPLAY_ON = 0x29
+SLEEP_OUT_DELAY = 0.12
+
+# Above the safe SPI clock, resend the whole panel this often (seconds).
+FULL_REFRESH_INTERVAL = 30.0
+
+# spidev refuses single transfers larger than its buffer (4 KB unless
+# the module was loaded with a bigger bufsiz).
+SPIDEV_BUFSIZ_PATH = "/sys/module/spidev/parameters/bufsiz"
+DEFAULT_TRANSFER_SIZE = 4096
+
+
+def spidev_bufsiz() -> int:
+    """Return the largest transfer the spidev driver accepts."""
+    try:
+        with open(SPIDEV_BUFSIZ_PATH) as bufsiz_file:
+            return int(bufsiz_file.read())
+    except (OSError, ValueError):
+        return DEFAULT_TRANSFER_SIZE
+
+
+class HatSPI(spi):
+    """luma SPI interface that writes buffers without building lists."""
+
+    def _write_bytes(self, data):
+        if isinstance(data, list):
+            self._spi.writebytes(data)
+        else:
+            # writebytes2 takes any buffer, e.g. a slice of the frame.
+            self._spi.writebytes2(data)
+
+    @property
+    def speed_hz(self) -> int:
+        return self._spi.max_speed_hz
+
+    @speed_hz.setter
+    def speed_hz(self, speed_hz: int) -> None:
+        self._spi.max_speed_hz = speed_hz
+
+    @property
+    def transfer_size(self) -> int:
+        return self._transfer_size
+
+    @transfer_size.setter
+    def transfer_size(self, size: int) -> None:
+        self._transfer_size = size
+
+
+class HatST7735(st7735):
+    """ST7735 driver for the HAT.
+
+    Frames are sent as RGB565 (see :mod:`rgb565`) and published for the
+    web mirror. With :attr:`stats` set, every frame is also timed and
+    counted (see :mod:`frame_stats`).
+
+    A banner set with :meth:`show_banner` stays over the bottom rows:
+    frames are clipped above it, so a notification costs one small
+    window to show and one to take down, whatever the app draws.
+
+    A transfer error drops the SPI clock one step and resends the whole
+    frame; :attr:`on_spi_fallback` is told the new rate. Above the safe
+    clock the whole panel is also refreshed every
+    :data:`FULL_REFRESH_INTERVAL` seconds, since pixels cannot be read
+    back to catch glitches.
+    """
+
+    stats: Optional[FrameStats] = None
+    on_spi_fallback: Optional[Callable[[int], None]] = None
+
+    def __init__(self, serial_interface: HatSPI, **kwargs):
+        # luma clears the panel in its own 18-bit format during __init__.
+        self._packer: Optional[Rgb565Packer] = None
+        # Held while talking to the panel: frames may come from a writer
+        # thread while the idle manager sleeps or wakes the panel.
+        self._lock = threading.RLock()
+        self._duty = 100.0
+        self._dim = 1.0
+        self.asleep = False
+        self._skipped = None
+        # (box, image, packed data) of the notification banner.
+        self._banner: Optional[tuple] = None
+        # True when the panel may not show the frame an app's windows
+        # were worked out against: the last frame came from display(),
+        # or had the stats overlay drawn on it.
+        self._diff_windows = False
+        # The app's last frame, without the overlay.
+        self._frame = None
+        super().__init__(serial_interface, **kwargs)
+        self.command(COLMOD, COLMOD_RGB565)
+        self._packer = Rgb565Packer(self.width * self.height)
+        self._refreshed_at = time.monotonic()
+
+    @property
+    def spi_speed_hz(self) -> int:
+        return self._serial_interface.speed_hz
+
+    @spi_speed_hz.setter
+    def spi_speed_hz(self, speed_hz: int) -> None:
+        self._serial_interface.speed_hz = speed_hz
+
+    @property
+    def transfer_size(self) -> int:
+        return self._serial_interface.transfer_size
+
+    @transfer_size.setter
+    def transfer_size(self, size: int) -> None:
+        self._serial_interface.transfer_size = size
+
+    def pack(self, image):
+        """Return ``image`` in the panel's RGB565 format."""
+        return self._packer.pack(image)
+
+    def write_window(self, bounding_box, data) -> None:
+        """Write packed pixels ``data`` into ``bounding_box`` on the panel."""
+        left, top, right, bottom = self.apply_offsets(bounding_box)
+        self.command(0x2A, left >> 8, left & 0xFF,
+                     (right - 1) >> 8, (right - 1) & 0xFF)
+        self.command(0x2B, top >> 8, top & 0xFF,
+                     (bottom - 1) >> 8, (bottom - 1) & 0xFF)
+        self.command(0x2C)
+        self.data(data)
+
+    def force_full_refresh(self) -> None:
+        """Send the whole of the next frame, not just what changed."""
+        if hasattr(self.framebuffer, "prev_image"):
+            self.framebuffer.prev_image = None
+        self._refreshed_at = time.monotonic()
+
+    def _fall_back(self) -> bool:
+        speed = spi_tuning.slower_speed(self.spi_speed_hz)
+        if speed is None:
+            return False
+        self.spi_speed_hz = speed
+        if self.on_spi_fallback is not None:
+            self.on_spi_fallback(speed)
+        return True
+
+    # --- Notification banner ---
+
+    def _banner_top(self) -> int:
+        return self.height if self._banner is None else self._banner[0][1]
+
+    def _redraw(self, image):
+        """Diff ``image`` with the last frame and pack what changed."""
+        top = self._banner_top()
+        for region, box in self.framebuffer.redraw(image):
+            if box[3] > top:
+                if box[1] >= top:
+                    continue
+                region = region.crop((0, 0, region.width, top - box[1]))
+                box = (box[0], box[1], box[2], top)
+            with tracing.span("convert"):
+                data = self._packer.pack(region)
+            yield box, data
+
+    def _clip(self, windows):
+        """Drop the rows of packed ``windows`` that the banner covers."""
+        top = self._banner_top()
+        for box, data in windows:
+            if box[3] > top:
+                if box[1] >= top:
+                    continue
+                data = data[:(top - box[1]) * (box[2] - box[0]) * 2]
+                box = (box[0], box[1], box[2], top)
+            yield box, data
+
+    def _with_banner(self, image):
+        if self._banner is None:
+            return image
+        box, banner, _data = self._banner
+        image = image.copy()
+        image.paste(banner, box[:2])
+        return image
+
+    def show_banner(self, image) -> None:
+        """Show ``image`` over the bottom rows until :meth:`clear_banner`."""
+        with self._lock:
+            box = (0, self.height - image.height, self.width, self.height)
+            data = bytes(self._packer.pack(image))
+            self._banner = (box, image, data)
+            frame = getattr(self.framebuffer, "prev_image", None)
+            if self.asleep or frame is None:
+                return
+            self.write_window(box, data)
+            frame_mirror.publish(self._with_banner(frame))
+
+    def clear_banner(self) -> None:
+        """Take the banner down, restoring what the app drew under it."""
+        with self._lock:
+            if self._banner is None:
+                return
+            box = self._banner[0]
+            self._banner = None
+            frame = getattr(self.framebuffer, "prev_image", None)
+            if self.asleep:
+                # The banner may still be on the panel: repaint on wake.
+                self.force_full_refresh()
+            if self.asleep or frame is None:
+                return
+            self.write_window(box, self._packer.pack(frame.crop(box)))
+            frame_mirror.publish(frame)
+
+    # --- Frames ---
+
+    def _send(self, image, timed: bool, windows=None) -> tuple[float, int]:
+        full = (
+            windows is None
+            and getattr(self.framebuffer, "prev_image", None) is None
+        )
+        if windows is None:
+            windows = self._redraw(image)
+        else:
+            self.framebuffer.prev_image = image
+            windows = self._clip(windows)
+        if full and self._banner is not None:
+            # The panel is being repainted: put the banner back too.
+            box, _banner, data = self._banner
+            windows = itertools.chain(windows, [(box, data)])
+        transfer = 0.0
+        sent = 0
+        for bounding_box, data in windows:
+            if timed:
+                sent_at = time.perf_counter()
+            with tracing.span("transfer"):
+                self.write_window(bounding_box, data)
+            if timed:
+                transfer += time.perf_counter() - sent_at
+                sent += len(data) + WINDOW_COMMAND_BYTES
+        return transfer, sent
+
+    def display(self, image, draw_time: Optional[float] = None):
+        """Send ``image`` to the panel.
+
+        ``draw_time`` is the CPU time the app spent on the frame when it
+        was measured on another thread (see :mod:`display_writer`).
+        """
+        if self._packer is None:
+            super().display(image)
+            return
+        with self._lock:
+            if self.asleep:
+                # Keep the newest frame for when the panel wakes up.
+                self._skipped = image
+                frame_mirror.publish(image)
+                return
+            self._display(image, draw_time)
+
+    def display_windows(
+        self, image, windows, draw_time: Optional[float] = None
+    ) -> None:
+        """Send packed ``windows`` that turn the last frame into ``image``.
+
+        ``windows`` is a list of ``(bounding_box, data)`` with ``data`` in
+        the panel's format, for apps that track what changed themselves
+        (see :mod:`tile_engine`) and so skip the frame diff and packing.
+        ``image`` is the whole new frame; it is sent in full instead when
+        the panel's contents are not known, and diffed against the panel
+        when the last frame came from :meth:`display` or had the stats
+        overlay on it.
+        """
+        with self._lock:
+            if self.asleep:
+                self._skipped = image
+                frame_mirror.publish(image)
+                return
+            self._display(image, draw_time, windows)
+
+    def _display(
+        self, image, draw_time: Optional[float], windows=None
+    ) -> None:
+        # Windows only patch the app's own previous frame; diff against
+        # what the panel really shows when that may differ.
+        self._frame = image
+        patch = windows is not None
+        if self._diff_windows:
+            windows = None
+        self._diff_windows = not patch
+        stats = self.stats
+        if stats is not None:
+            same_thread = draw_time is None
+            if same_thread:
+                draw_time = stats.draw_time()
+            if overlay_held():
+                image = stats.draw_overlay(image)
+                windows = None
+                self._diff_windows = True
+            start = time.perf_counter()
+        assert image.mode == self.mode
+        assert image.size == self.size
+
+        if (
+            self.spi_speed_hz > spi_tuning.SAFE_SPI_SPEED_HZ
+            and time.monotonic() - self._refreshed_at > FULL_REFRESH_INTERVAL
+        ):
+            self.force_full_refresh()
+        if getattr(self.framebuffer, "prev_image", None) is None:
+            windows = None
+        image = self.preprocess(image)
+        try:
+            transfer, sent = self._send(image, stats is not None, windows)
+        except OSError:
+            if not self._fall_back():
+                raise
+            self.force_full_refresh()
+            transfer, sent = self._send(image, stats is not None)
+
+        if stats is not None:
+            convert = time.perf_counter() - start - transfer
+            stats.record(draw_time, convert, transfer, sent)
+            if same_thread:
+                # Restart the draw clock so it excludes this transfer.
+                stats.draw_time()
+        frame_mirror.publish(self._with_banner(image))
+
+    def redraw_overlay(self) -> None:
+        """Resend the last frame with or without the stats overlay.
+
+        Called when the overlay chord is made or broken; unlike a frame
+        from the app it is not timed.
+        """
+        with self._lock:
+            stats = self.stats
+            image = self._frame
+            if self.asleep or stats is None or image is None:
+                return
+            if overlay_held():
+                image = stats.draw_overlay(image)
+            self._diff_windows = True
+            self._send(self.preprocess(image), False)
+            frame_mirror.publish(self._with_banner(image))
+
+    def contrast(self, level: int) -> None:
+        """Set the brightness (0-255) through the backlight PWM.
+
+        The ST7735 has no contrast register, so luma's ``contrast`` was a
+        no-op on this panel.
+        """
+        level = max(0, min(255, int(level)))
+        self._duty = BACKLIGHT_MIN + (100.0 - BACKLIGHT_MIN) * level / 255
+        if not self.asleep:
+            self.backlight(self._duty * self._dim)
+
+    def dim(self, fraction: float) -> None:
+        """Scale the backlight to ``fraction`` of the brightness setting."""
+        self._dim = fraction
+        if not self.asleep:
+            self.backlight(self._duty * fraction)
+
+    def sleep(self) -> None:
+        """Turn the backlight off and put the panel into sleep mode."""
+        with self._lock:
+            if self.asleep:
+                return
+            self.backlight(False)
+            self.command(DISPLAY_OFF)
+            self.command(SLEEP_IN)
+            self.asleep = True
+
+    def wake(self) -> None:
+        """Leave sleep mode and show the newest frame at full brightness."""
+        with self._lock:
+            if not self.asleep:
+                return
+            self.command(SLEEP_OUT)
+            time.sleep(SLEEP_OUT_DELAY)
+            self.command(DISPLAY_ON)
+            self.asleep = False
+            self._dim = 1.0
+            if self._skipped is not None:
+                image, self._skipped = self._skipped, None
+                self._display(image, None)
+            if self._banner is not None:
+                # Shown or replaced while the panel was asleep.
+                box, _banner, data = self._banner
+                self.write_window(box, data)
+            self.backlight(self._duty)
+
+
+def open_device(settings: dict) -> HatST7735:
+    """Open SPI0 CE0 and return the LCD, before settings are applied."""
+    bufsiz = spidev_bufsiz()
+    serial = HatSPI(
+        port=0,
+        device=0,
+        gpio_DC=DC_PIN,
+        gpio_RST=RST_PIN,
+        bus_speed_hz=spi_tuning.SAFE_SPI_SPEED_HZ,
+        transfer_size=min(settings["spi_transfer_size"] or bufsiz, bufsiz),
+    )
+    # h_offset/v_offset line the 128x128 window up with the glass.
+    return HatST7735(
+        serial,
+        width=LCD_WIDTH,
+        height=LCD_HEIGHT,
+        h_offset=2,
+        v_offset=1,
+        gpio_LIGHT=BL_PIN,
+        pwm_frequency=BACKLIGHT_PWM_HZ,
+    )
+
+
+def create_device(
+    factory: Callable[[dict], HatST7735] = open_device,
+) -> HatST7735:
+    """Return the LCD with the saved settings applied.
+
+    ``factory`` builds the device from the settings; the default opens
+    the HAT (see :func:`open_device`), and :mod:`golden_frames` passes
+    one that builds a simulated panel. The first time, the transfer
+    size is probed at the safe SPI clock (see :mod:`spi_tuning`) and
+    saved for later runs.
+    """
+    settings = settings_store.load()
+    device = factory(settings)
+    palette.use(settings["theme"])
+    device.contrast(settings["brightness"])
+    set_frame_stats(device, settings["frame_stats"])
+    tracing.enable(settings["tracing"])
+    tracing.install_signal_handler()
+    memory_profile.install()
+    if settings["spi_speed_hz"] is None:
+        tune_spi(device)
+    else:
+        device.spi_speed_hz = settings["spi_speed_hz"]
+    device.on_spi_fallback = (
+        lambda speed: settings_store.update(spi_speed_hz=speed)
+    )
+    notifications.attach(device, BANNER_HEIGHT)
+    return device
+
+
+def tune_spi(
+    device: HatST7735,
+    speeds: tuple[int, ...] = (spi_tuning.SAFE_SPI_SPEED_HZ,),
+) -> tuple[int, int]:
+    """Probe the fastest SPI settings among ``speeds`` and save them."""
+    speed, size = spi_tuning.probe(device, spidev_bufsiz(), speeds)
+    settings_store.update(spi_speed_hz=speed, spi_transfer_size=size)
+    return speed, size
+
+
+def set_frame_stats(device: HatST7735, enabled: bool) -> None:
+    """Switch per-frame timing (and the KEY1+KEY2 overlay) on or off."""
+    if not enabled:
+        device.stats = None
+    elif device.stats is None:
+        for name in STATS_OVERLAY_BUTTONS:
+            GPIO.setup(BUTTON_PINS[name], GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        device.stats = FrameStats()
+        threading.Thread(
+            target=_watch_overlay_button, args=(device, device.stats),
+            daemon=True,
+        ).start()
+
+
+def overlay_held() -> bool:
+    """Return True while every stats overlay button is held."""
+    return all(
+        GPIO.input(BUTTON_PINS[name]) == GPIO.LOW
+        for name in STATS_OVERLAY_BUTTONS
+    )
+
+
+def _watch_overlay_button(device: HatST7735, stats: FrameStats) -> None:
+    """Redraw as the overlay chord is made or broken until stats are off.
+
+    The input mux already owns the pins' edge detection, so the levels
+    are polled.
+    """
+    held = False
+    while device.stats is stats:
+        pressed = overlay_held()
+        if pressed != held:
+            held = pressed
+            device.redraw_overlay()
+        time.sleep(OVERLAY_POLL_INTERVAL)
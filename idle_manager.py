@@ -0,0 +1,97 @@
+"""Step the display down while nobody is using the device.
+
+Without input for a while, :class:`IdleManager` first throttles the app
+(its waits in :meth:`input_mux.InputMux.get` are stretched to
+:data:`IDLE_FRAME_INTERVAL`), then dims the backlight, then turns the
+backlight off and puts the ST7735 to sleep, at which point the app's
+loop blocks until the next input and the CPU is idle. Any button edge
+(on the HAT or from the remote) wakes everything at once; the press that
+wakes a sleeping panel is swallowed so it does not also act on a screen
+the user could not see.
+"""
+
+import threading
+import time
+from typing import Optional
+
+# Seconds without input before each step.
+THROTTLE_AFTER = 10.0
+DIM_AFTER = 30.0
+SLEEP_AFTER = 60.0
+
+# Longest an idle app waits between redraws, and the dimmed brightness
+# as a fraction of the user's setting.
+IDLE_FRAME_INTERVAL = 1.0
+DIM_FRACTION = 0.3
+
+ACTIVE = "active"
+THROTTLED = "throttled"
+DIMMED = "dimmed"
+ASLEEP = "asleep"
+
+
+class IdleManager:
+    """Track input activity for ``device`` and power it down when idle."""
+
+    def __init__(
+        self,
+        device,
+        throttle_after: float = THROTTLE_AFTER,
+        dim_after: float = DIM_AFTER,
+        sleep_after: float = SLEEP_AFTER,
+    ) -> None:
+        self.device = device
+        self._steps = (
+            (throttle_after, THROTTLED),
+            (dim_after, DIMMED),
+            (sleep_after, ASLEEP),
+        )
+        self.state = ACTIVE
+        self._last_activity = time.monotonic()
+        self._lock = threading.Lock()
+
+    def poke(self) -> bool:
+        """Note activity and wake the panel.
+
+        Returns True if the panel was asleep.
+        """
+        with self._lock:
+            self._last_activity = time.monotonic()
+            state, self.state = self.state, ACTIVE
+            if state == ASLEEP:
+                self.device.wake()
+            elif state == DIMMED:
+                self.device.dim(1.0)
+        return state == ASLEEP
+
+    def update(self) -> None:
+        """Move to the step the idle time has reached."""
+        with self._lock:
+            idle = time.monotonic() - self._last_activity
+            target = ACTIVE
+            for after, state in self._steps:
+                if idle >= after:
+                    target = state
+            if target == self.state:
+                return
+            if target == ASLEEP:
+                self.device.sleep()
+            elif target == DIMMED:
+                self.device.dim(DIM_FRACTION)
+            self.state = target
+
+    def next_change(self) -> Optional[float]:
+        """Monotonic time of the next step, or None once asleep."""
+        for after, state in self._steps:
+            deadline = self._last_activity + after
+            if deadline > time.monotonic():
+                return deadline
+        return None
+
+    def stretch(self, timeout: Optional[float]) -> Optional[float]:
+        """Return how long an app asking for ``timeout`` should wait."""
+        if self.state == ASLEEP:
+            return None
+        if self.state != ACTIVE and timeout is not None:
+            return max(timeout, IDLE_FRAME_INTERVAL)
+        return timeout
@@ -0,0 +1,172 @@
+"""Prepare uploaded pictures for the 128x128 LCD.
+
+Uploads keep their original under ``images/.originals`` and get a
+display-sized copy in ``images/`` (which is all the viewer ever decodes)
+plus a small thumbnail in ``images/.thumbs`` for the web page. The work
+happens in :func:`transcode`, which the remote control server runs in a
+separate short-lived process per upload (this module run as a script),
+so decoding a large photo never competes with the UI and a conversion
+killed for running out of memory takes nothing else down.
+
+:func:`load_fitted` decodes JPEGs at a reduced scale (libjpeg's DCT
+scaling through Pillow's draft mode) instead of at full resolution,
+applies the EXIF orientation and fits the picture to the screen without
+stretching it.
+"""
+
+import os
+import re
+import time
+from typing import Optional
+
+IMG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+ORIGINALS_DIR = os.path.join(IMG_DIR, ".originals")
+THUMBS_DIR = os.path.join(IMG_DIR, ".thumbs")
+INCOMING_DIR = os.path.join(IMG_DIR, ".incoming")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp")
+
+DISPLAY_SIZE = (128, 128)
+THUMB_SIZE = (32, 32)
+
+# "letterbox" shows the whole picture with bars; "crop" fills the screen
+# and trims the longer side.
+FIT_MODES = ("letterbox", "crop")
+FIT_MODE = "letterbox"
+
+_ORIENTATION = 0x0112
+
+
+def safe_name(name: str) -> str:
+    """Return ``name`` reduced to a harmless file name (may be empty)."""
+    name = os.path.basename(name.replace("\\", "/"))
+    return re.sub(r"[^A-Za-z0-9._-]", "_", name).lstrip(".")
+
+
+def display_name(name: str) -> str:
+    """Return the file name of the display copy of upload ``name``."""
+    return os.path.splitext(safe_name(name))[0] + ".png"
+
+
+def unique_name(name: str, taken=()) -> str:
+    """Return upload ``name``, renamed if its display copy would clash.
+
+    A clash is an image already in :data:`IMG_DIR`, an original that
+    converts to the same display name, or a display name in ``taken``
+    (uploads still converting). ``photo.jpg`` becomes ``photo-1.jpg``,
+    ``photo-2.jpg`` and so on.
+    """
+    used = set(taken)
+    used.update(list_images(IMG_DIR))
+    try:
+        used.update(display_name(n) for n in os.listdir(ORIGINALS_DIR))
+    except FileNotFoundError:
+        pass
+    stem, ext = os.path.splitext(safe_name(name))
+    candidate = stem + ext
+    number = 0
+    while display_name(candidate) in used:
+        number += 1
+        candidate = f"{stem}-{number}{ext}"
+    return candidate
+
+
+def original_path(path: str) -> str:
+    """Return the uploaded original of display copy ``path``.
+
+    Pictures that were not uploaded are their own original.
+    """
+    name = os.path.basename(path)
+    try:
+        originals = sorted(os.listdir(ORIGINALS_DIR))
+    except FileNotFoundError:
+        return path
+    for original in originals:
+        if display_name(original) == name:
+            return os.path.join(ORIGINALS_DIR, original)
+    return path
+
+
+def list_images(img_dir: Optional[str] = None) -> list[str]:
+    """Return the sorted names of the images the viewer can show.
+
+    ``img_dir`` defaults to :data:`IMG_DIR`.
+    """
+    if img_dir is None:
+        img_dir = IMG_DIR
+    try:
+        names = os.listdir(img_dir)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        n
+        for n in names
+        if n.lower().endswith(IMAGE_EXTENSIONS)
+        and os.path.isfile(os.path.join(img_dir, n))
+    )
+
+
+def _save_atomic(image, path: str) -> None:
+    tmp_path = path + ".tmp"
+    image.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+
+
+def upright_rgb(image):
+    """Return ``image`` loaded, turned by its EXIF orientation, in RGB.
+
+    ``exif_transpose`` and ``convert`` always copy, and a decoded 12 MP
+    photo takes 48 MB, so each runs only when it changes something.
+    """
+    from PIL import ImageOps
+
+    image.load()
+    if image.getexif().get(_ORIENTATION, 1) != 1:
+        image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def fit(image, size=DISPLAY_SIZE, mode: str = FIT_MODE):
+    """Scale ``image`` to ``size`` keeping its aspect ratio."""
+    from PIL import Image, ImageOps
+
+    if mode == "crop":
+        return ImageOps.fit(image, size, Image.LANCZOS)
+    return ImageOps.pad(image, size, Image.LANCZOS, color="black")
+
+
+def load_fitted(path: str, size=DISPLAY_SIZE, mode: str = FIT_MODE):
+    """Decode ``path`` as an RGB image of ``size``.
+
+    Returns ``(image, seconds)``, the second item being the time spent
+    decoding and scaling.
+    """
+    from PIL import Image
+
+    start = time.perf_counter()
+    with Image.open(path) as img:
+        # Ask for the smallest DCT scale that still covers ``size``;
+        # formats other than JPEG ignore this.
+        img.draft("RGB", size)
+        frame = upright_rgb(img)
+        if frame.size != size:
+            frame = fit(frame, size, mode)
+    return frame, time.perf_counter() - start
+
+
+def transcode(source: str, display_path: str, thumb_path: str) -> None:
+    """Write the display copy and the thumbnail of ``source``."""
+    frame, _ = load_fitted(source)
+    _save_atomic(frame, display_path)
+    thumb = frame.resize(THUMB_SIZE)
+    _save_atomic(thumb, thumb_path)
+
+
+if __name__ == "__main__":
+    # The remote control server converts each upload in its own process:
+    # python3 image_transcode.py SOURCE DISPLAY_PATH THUMB_PATH
+    import sys
+
+    transcode(*sys.argv[1:4])
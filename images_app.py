@@ -1,59 +1,67 @@
 #!/usr/bin/env python3
-"""Simple image viewer for the 1.44 inch LCD."""
+"""Simple image viewer for the 1.44 inch LCD.
+
+Animated GIF, APNG and WebP pictures play, and so does any directory of
+numbered frames inside ``images/``. Pressing the joystick (or starting
+with ``--slideshow``) rotates through the pictures unattended.
+"""
 import os
-import time
+import sys
+import textwrap
+import threading
+from collections import OrderedDict
 
 import RPi.GPIO as GPIO
-from luma.core.interface.serial import spi
-from luma.lcd.device import st7735
-from PIL import Image
+from PIL import Image, ImageDraw
 
-# --- Display setup ---
-RST_PIN = 27
-DC_PIN = 25
-LCD_WIDTH = 128
-LCD_HEIGHT = 128
-
-serial = spi(
-    port=0,
-    device=0,
-    cs_high=False,
-    gpio_DC=DC_PIN,
-    gpio_RST=RST_PIN,
-    speed_hz=16000000,
-)
+import tracing
+from animation import AnimationPlayer, is_animation, sequence_frames
+from hat import LCD_HEIGHT, LCD_WIDTH, create_device
+from idle_manager import IdleManager
+from image_transcode import IMG_DIR, list_images, load_fitted, original_path
+from input_mux import InputMux
+from palette import colors
+from slideshow import Slideshow
+from tile_pyramid import PanZoomView, TilePyramid
 
-device = st7735(
-    serial, width=LCD_WIDTH, height=LCD_HEIGHT, h_offset=2, v_offset=1
-)
+# --- Display setup ---
+device = create_device()
 
 # --- Button setup ---
-GPIO.setmode(GPIO.BCM)
-BUTTON_PINS = {
-    "KEY3": 16,
-    "JOY_LEFT": 5,
-    "JOY_RIGHT": 26,
-}
-for pin in BUTTON_PINS.values():
-    GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+# Playing an animation counts as activity, like a game.
+idle = IdleManager(device)
+mux = InputMux(
+    buttons=(
+        "KEY1",
+        "KEY2",
+        "KEY3",
+        "JOY_UP",
+        "JOY_DOWN",
+        "JOY_LEFT",
+        "JOY_RIGHT",
+        "JOY_PRESS",
+    ),
+    idle=idle,
+)
 
 # --- Load images ---
-IMG_DIR = os.path.join(os.path.dirname(__file__), "images")
+# Uploads from the remote control server are already converted to the
+# display size; pictures copied into images/ by hand are decoded at a
+# reduced scale and fitted to the screen.
 os.makedirs(IMG_DIR, exist_ok=True)
-images = [
-    os.path.join(IMG_DIR, f)
-    for f in os.listdir(IMG_DIR)
-    if f.lower().endswith((".png", ".jpg", ".jpeg", ".bmp"))
-]
-images.sort()
+images = [os.path.join(IMG_DIR, f) for f in list_images()]
+images += sorted(
+    entry.path
+    for entry in os.scandir(IMG_DIR)
+    if entry.is_dir()
+    and not entry.name.startswith(".")
+    and len(sequence_frames(entry.path)) > 1
+)
 
 if not images:
     # Generate simple placeholders if no images exist. This avoids bundling
     # binary files in the repository while still demonstrating functionality.
-    from PIL import ImageDraw
-
-    colors = ["red", "green", "blue"]
-    for i, color in enumerate(colors, start=1):
+    for i, color in enumerate(("red", "green", "blue"), start=1):
         img = Image.new("RGB", (LCD_WIDTH, LCD_HEIGHT), color)
         draw = ImageDraw.Draw(img)
         draw.text((10, 60), f"Image {i}", fill="white")
@@ -63,30 +71,242 @@ if not images:
 
 current_idx = 0
 
+# Decoded, display-sized frames of recently shown images.
+CACHE_SIZE = 8
+_frame_cache: "OrderedDict[str, Image.Image]" = OrderedDict()
+# The slideshow prefetches through load_frame() on its worker thread.
+_cache_lock = threading.Lock()
+
+
+def load_frame(path: str) -> Image.Image:
+    """Return the display-sized frame for ``path``, decoding at most once."""
+    with _cache_lock:
+        frame = _frame_cache.get(path)
+        if frame is not None:
+            _frame_cache.move_to_end(path)
+            return frame
+        source = path
+        if os.path.isdir(path):
+            source = sequence_frames(path)[0]
+        frame, seconds = load_fitted(source, (LCD_WIDTH, LCD_HEIGHT))
+        name = os.path.basename(source)
+        print(f"{name}: decoded in {seconds * 1000:.1f} ms")
+        _frame_cache[path] = frame
+        if len(_frame_cache) > CACHE_SIZE:
+            _frame_cache.popitem(last=False)
+        return frame
+
+
+player = None
+
+
+def stop_animation() -> None:
+    global player
+    if player is not None:
+        player.stop()
+        print(player.summary())
+        player = None
+
+
+def show_error(title: str, detail: str) -> None:
+    """Replace the picture with ``title`` and the start of ``detail``."""
+    frame = Image.new("RGB", (LCD_WIDTH, LCD_HEIGHT), colors.background)
+    draw = ImageDraw.Draw(frame)
+    draw.text((4, 40), title, fill=colors.alert)
+    for row, line in enumerate(textwrap.wrap(detail, 20)[:4]):
+        draw.text((4, 56 + row * 12), line, fill=colors.text)
+    device.display(frame)
+
 
 def show_image(idx: int) -> None:
+    """Show picture ``idx``, playing it if it (or its original) moves."""
+    global player
+    stop_animation()
     path = images[idx]
-    img = Image.open(path).convert("RGB").resize((LCD_WIDTH, LCD_HEIGHT))
-    device.display(img)
+    source = original_path(path)
+    if is_animation(source):
+        player = AnimationPlayer(device, source, (LCD_WIDTH, LCD_HEIGHT))
+        player.update()
+    else:
+        with tracing.span("draw", os.path.basename(path)):
+            frame = load_frame(path)
+        device.display(frame)
+
+
+# --- Slideshow ---
+# Animations show their first frame while the slideshow runs.
+slideshow = None
+
+
+def start_slideshow() -> None:
+    global slideshow, zoom_view, zoom_pending
+    stop_animation()
+    zoom_view = None
+    zoom_pending = False
+    slideshow = Slideshow(device, images, current_idx, load_frame)
 
 
-show_image(current_idx)
+def stop_slideshow() -> None:
+    """Stop the slideshow, staying on the picture it last showed."""
+    global slideshow, current_idx
+    if slideshow is None:
+        return
+    slideshow.stop()
+    current_idx = slideshow.index
+    slideshow = None
+
+
+# --- Zoom ---
+# KEY1 zooms in on the original picture and KEY2 back out; while zoomed
+# the joystick pans by PAN_STEP pixels.
+PAN_STEP = 32
+# How often the screen checks whether a zoom level has been built.
+LOADING_POLL = 0.2
+
+zoom_view = None
+zoom_pending = False
+
+
+def show_zoom() -> None:
+    """Show the zoomed window, or a notice while its level is built."""
+    global zoom_pending
+    with tracing.span("draw", "zoom"):
+        frame = zoom_view.render()
+    failed = zoom_view.level in zoom_view.pyramid.failed
+    zoom_pending = frame is None and not failed
+    if frame is None:
+        frame = load_frame(images[current_idx]).copy()
+        draw = ImageDraw.Draw(frame)
+        draw.rectangle((0, 54, LCD_WIDTH, 72), fill=colors.background)
+        notice = "Cannot zoom" if failed else "Loading..."
+        draw.text((30, 58), notice, fill=colors.text)
+    device.display(frame)
+
+
+def zoom_in() -> None:
+    global zoom_view
+    if player is not None or os.path.isdir(images[current_idx]):
+        return  # Animations are not zoomable.
+    if zoom_view is None:
+        zoom_view = PanZoomView(
+            TilePyramid(original_path(images[current_idx])),
+            (LCD_WIDTH, LCD_HEIGHT),
+        )
+    if zoom_view.zoom(1):
+        show_zoom()
+    elif zoom_view.level == 0:
+        zoom_view = None  # The picture has no more detail than the screen.
+
+
+def zoom_out() -> None:
+    global zoom_view, zoom_pending
+    if zoom_view is None:
+        return
+    zoom_view.zoom(-1)
+    if zoom_view.level == 0:
+        zoom_view = None
+        zoom_pending = False
+        show_image(current_idx)
+    else:
+        show_zoom()
+
+
+def pan(dx: int, dy: int) -> None:
+    if zoom_view.pan(dx * PAN_STEP, dy * PAN_STEP):
+        show_zoom()
+
+
+PAN_BUTTONS = {
+    "JOY_UP": (0, -1),
+    "JOY_DOWN": (0, 1),
+    "JOY_LEFT": (-1, 0),
+    "JOY_RIGHT": (1, 0),
+}
+
+
+def find_image(name: str):
+    """Return the index of the image called ``name`` or None."""
+    for idx, path in enumerate(images):
+        if os.path.basename(path) == name:
+            return idx
+    return None
+
+
+def view_image(message: dict) -> None:
+    """Jump to an image requested through the remote control server."""
+    global current_idx, zoom_view, zoom_pending
+    idx = find_image(str(message.get("name")))
+    if idx is not None:
+        stop_slideshow()
+        current_idx = idx
+        zoom_view = None
+        zoom_pending = False
+        show_image(current_idx)
+
+
+mux.on("view_image", view_image)
+args = sys.argv[1:]
+kiosk = "--slideshow" in args
+if kiosk:
+    args.remove("--slideshow")
+if args:
+    current_idx = find_image(args[0]) or 0
+if kiosk:
+    start_slideshow()
+else:
+    show_image(current_idx)
 
 try:
     while True:
-        if GPIO.input(BUTTON_PINS["KEY3"]) == GPIO.LOW:
+        timeout = LOADING_POLL if zoom_pending else None
+        if player is not None:
+            timeout = player.timeout()
+            idle.poke()
+        elif slideshow is not None:
+            # A kiosk slideshow keeps the screen awake.
+            timeout = slideshow.timeout()
+            idle.poke()
+        button = mux.get(timeout=timeout)
+        if player is not None:
+            player.update()
+            if player.failed:
+                error = player.error
+                stop_animation()
+                show_error("Cannot play", error)
+        if slideshow is not None:
+            slideshow.update()
+        if button == "KEY3":
             break
-        if GPIO.input(BUTTON_PINS["JOY_LEFT"]) == GPIO.LOW:
+        if button == "JOY_PRESS":
+            if slideshow is None:
+                start_slideshow()
+            else:
+                stop_slideshow()
+                show_image(current_idx)
+        elif button is not None and slideshow is not None:
+            # Any other button takes over from the slideshow.
+            stop_slideshow()
+            show_image(current_idx)
+        elif button == "KEY1":
+            zoom_in()
+        elif button == "KEY2":
+            zoom_out()
+        elif zoom_view is not None:
+            if button in PAN_BUTTONS:
+                pan(*PAN_BUTTONS[button])
+            elif zoom_pending:
+                show_zoom()
+        elif button == "JOY_LEFT":
             current_idx = (current_idx - 1) % len(images)
             show_image(current_idx)
-            time.sleep(0.2)
-        if GPIO.input(BUTTON_PINS["JOY_RIGHT"]) == GPIO.LOW:
+        elif button == "JOY_RIGHT":
             current_idx = (current_idx + 1) % len(images)
             show_image(current_idx)
-            time.sleep(0.2)
-        time.sleep(0.05)
 except KeyboardInterrupt:
     pass
 finally:
+    stop_animation()
+    stop_slideshow()
+    mux.close()
     device.cleanup()
     GPIO.cleanup()
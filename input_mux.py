@@ -0,0 +1,247 @@
+"""Single input stream for the HAT buttons and remote control events.
+
+Apps used to poll ``GPIO.input`` in their loops and the remote control
+server's queue was never read. :class:`InputMux` turns GPIO falling
+edges and button messages from the app bus into one queue of button
+names, adds key repeat for held joystick directions, and dispatches any
+other bus message (such as ``view_image``) to registered handlers on the
+app's own thread; toasts go straight to :mod:`notifications`. Given an
+:class:`idle_manager.IdleManager`, it also reports activity to it and
+lets it stretch the app's waits while idle.
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+import RPi.GPIO as GPIO
+
+import app_bus
+import notifications
+import tracing
+from hat import (
+    BUTTON_PINS,
+    OVERLAY_CHORD_WINDOW,
+    STATS_OVERLAY_BUTTONS,
+    overlay_held,
+)
+
+# Held buttons repeat after REPEAT_DELAY, then every REPEAT_INTERVAL.
+REPEAT_DELAY = 0.4
+REPEAT_INTERVAL = 0.2
+REPEAT_BUTTONS = ("JOY_UP", "JOY_DOWN", "JOY_LEFT", "JOY_RIGHT")
+
+# A remote press counts as "held" for is_pressed() this long; the server
+# repeats held remote buttons faster than this.
+REMOTE_HOLD = 0.3
+
+DEBOUNCE_MS = 50
+# How often a press waiting for the overlay chord reads the buttons.
+CHORD_POLL = 0.01
+
+
+class InputMux:
+    """Merge GPIO edges and app bus messages into one event stream."""
+
+    def __init__(
+        self,
+        buttons: Optional[tuple[str, ...]] = None,
+        repeat: tuple[str, ...] = REPEAT_BUTTONS,
+        remote: bool = True,
+        idle=None,
+    ) -> None:
+        self.buttons = tuple(buttons or BUTTON_PINS)
+        self.repeat = repeat
+        self.idle = idle
+        self._events: queue.Queue[tuple[str, object]] = queue.Queue()
+        self._held: dict[str, float] = {}
+        self._remote_pressed: dict[str, float] = {}
+        self._handlers: dict[str, Callable[[dict], None]] = {}
+        # Chord buttons whose next edge, if it comes by _chord_until,
+        # completes a stats overlay chord.
+        self._chord_pending: set[str] = set()
+        self._chord_until = 0.0
+        self._pin_names = {BUTTON_PINS[name]: name for name in self.buttons}
+        if idle is not None:
+            # Every button wakes the panel, even ones the app ignores.
+            self._pin_names = {pin: name for name, pin in BUTTON_PINS.items()}
+
+        GPIO.setmode(GPIO.BCM)
+        for pin in self._pin_names:
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            GPIO.add_event_detect(
+                pin,
+                GPIO.FALLING,
+                callback=self._on_edge,
+                bouncetime=DEBOUNCE_MS,
+            )
+
+        self._bus: Optional[app_bus.Subscriber] = None
+        if remote:
+            self._bus = app_bus.Subscriber()
+            threading.Thread(target=self._read_bus, daemon=True).start()
+
+    def _on_edge(self, channel: int) -> None:
+        name = self._pin_names[channel]
+        tracing.instant("edge", name)
+        if not self._overlay_chord(name):
+            self._events.put(("gpio", name))
+
+    def _overlay_chord(self, name: str) -> bool:
+        """Return True if the press of ``name`` is for the stats overlay.
+
+        Only while frame stats are on (the IdleManager knows the device).
+        Edges arrive here one at a time and in order, so a chord button
+        pressed alone waits briefly for the rest of the chord, whose own
+        edges then follow and are dropped as well.
+        """
+        if name in self._chord_pending:
+            self._chord_pending.discard(name)
+            if time.monotonic() < self._chord_until:
+                return True
+        if name not in STATS_OVERLAY_BUTTONS:
+            return False
+        stats = getattr(getattr(self.idle, "device", None), "stats", None)
+        if stats is None:
+            return False
+        waiting = {
+            button
+            for button in STATS_OVERLAY_BUTTONS
+            if GPIO.input(BUTTON_PINS[button]) != GPIO.LOW
+        }
+        deadline = time.monotonic() + OVERLAY_CHORD_WINDOW
+        while not overlay_held():
+            released = GPIO.input(BUTTON_PINS[name]) != GPIO.LOW
+            if released or time.monotonic() >= deadline:
+                return False
+            time.sleep(CHORD_POLL)
+        self._chord_pending = waiting - {name}
+        self._chord_until = time.monotonic() + OVERLAY_CHORD_WINDOW
+        return True
+
+    def _read_bus(self) -> None:
+        bus = self._bus
+        while True:
+            message = bus.receive()
+            if message is None:
+                return
+            tracing.instant("bus recv", message.get("type"))
+            if message.get("type") == "button":
+                if message.get("button") in BUTTON_PINS:
+                    self._events.put(("remote", message["button"]))
+            elif message.get("type") == "trace_dump":
+                tracing.dump(message.get("path"))
+            elif message.get("type") == "toast":
+                # Drawn without the app; the event only wakes the panel.
+                notifications.deliver(message)
+                if self.idle is not None:
+                    self._events.put(("message", message))
+            else:
+                self._events.put(("message", message))
+
+    def on(self, kind: str, handler: Callable[[dict], None]) -> None:
+        """Call ``handler(message)`` for bus messages of type ``kind``."""
+        self._handlers[kind] = handler
+
+    def interrupt(self) -> None:
+        """Make a waiting :meth:`get` return None, e.g. to redraw."""
+        self._events.put(("interrupt", None))
+
+    def is_pressed(self, name: str) -> bool:
+        """Return True while ``name`` is held on the HAT or remotely."""
+        if GPIO.input(BUTTON_PINS[name]) == GPIO.LOW:
+            return True
+        return self._remote_pressed.get(name, 0) > time.monotonic()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Return the next button name, or None after ``timeout`` seconds.
+
+        Bus messages are dispatched to their handlers while waiting; None
+        is also returned after a handler ran so the caller can redraw,
+        after a press that only woke the sleeping panel, and after
+        :meth:`interrupt`.
+        """
+        idle = self.idle
+        if idle is not None:
+            timeout = idle.stretch(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            wake = deadline
+            for due in (
+                min(self._held.values(), default=None),
+                None if idle is None else idle.next_change(),
+            ):
+                if due is not None and (wake is None or due < wake):
+                    wake = due
+            try:
+                if wake is None:
+                    source, item = self._events.get()
+                else:
+                    source, item = self._events.get(
+                        timeout=max(0.0, wake - now)
+                    )
+            except queue.Empty:
+                button = self._due_repeat()
+                if button is not None:
+                    return button
+                if idle is not None:
+                    idle.update()
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                continue
+            if source == "interrupt":
+                return None
+            if idle is not None and idle.poke():
+                if source == "message":
+                    self._events.put((source, item))
+                return None
+            if source == "message":
+                handler = self._handlers.get(item.get("type"))
+                if handler is not None:
+                    handler(item)
+                    return None
+                continue
+            if item not in self.buttons:
+                continue
+            now = time.monotonic()
+            if source == "gpio" and item in self.repeat:
+                self._held[item] = now + REPEAT_DELAY
+            elif source == "remote":
+                self._remote_pressed[item] = now + REMOTE_HOLD
+            tracing.instant("input", item)
+            return item
+
+    def _due_repeat(self) -> Optional[str]:
+        now = time.monotonic()
+        for name, due in list(self._held.items()):
+            if due > now:
+                continue
+            if GPIO.input(BUTTON_PINS[name]) == GPIO.LOW:
+                self._held[name] = now + REPEAT_INTERVAL
+                return name
+            del self._held[name]
+        return None
+
+    def drain(self) -> None:
+        """Discard pending presses, e.g. after a slow blocking action."""
+        messages = []
+        while True:
+            try:
+                source, item = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if source == "message":
+                messages.append((source, item))
+        for event in messages:
+            self._events.put(event)
+        self._held.clear()
+
+    def close(self) -> None:
+        """Release the GPIO edge detectors and the bus socket."""
+        for pin in self._pin_names:
+            GPIO.remove_event_detect(pin)
+        if self._bus is not None:
+            self._bus.close()
+            self._bus = None
@@ -1,70 +1,90 @@
 #!/usr/bin/env python3
 """Simple console IRC client for #pet on 192.168.0.81."""
 
+import os
+import signal
 import socket
 import threading
 import textwrap
 
 import RPi.GPIO as GPIO
-from luma.core.interface.serial import spi
-from luma.core.render import canvas
-from luma.lcd.device import st7735
-from PIL import ImageFont
-
-# Connection details are now fixed so that the client always connects to
-# 192.168.0.81 on port 6667 using nickname "birdie" in channel "#pet".
-SERVER = "192.168.0.81"
-PORT = 6667
-CHANNEL = "#pet"
-NICK = "birdie"
+from PIL import Image, ImageFont
+
+import tracing
+from hat import LCD_HEIGHT, LCD_WIDTH, create_device
+from idle_manager import IdleManager
+from input_mux import InputMux
+from irc_link import CHANNEL, NICK, PORT, SERVER, parse_privmsg, register, send
+from list_view import ListView
+from palette import colors
+from status_bar import STATUS_HEIGHT, StatusBar
+from widgets import WidgetScreen
 
 # --- Display setup ---
-RST_PIN = 27
-DC_PIN = 25
-LCD_WIDTH = 128
-LCD_HEIGHT = 128
-
-serial = spi(
-    port=0,
-    device=0,
-    cs_high=False,
-    gpio_DC=DC_PIN,
-    gpio_RST=RST_PIN,
-    speed_hz=16000000,
-)
-
-device = st7735(
-    serial, width=LCD_WIDTH, height=LCD_HEIGHT, h_offset=2, v_offset=1
-)
+device = create_device()
 
 try:
     font = ImageFont.truetype("DejaVuSansMono.ttf", 10)
 except IOError:
     font = ImageFont.load_default()
 
-GPIO.setmode(GPIO.BCM)
-EXIT_PIN = 16  # KEY3 on the Waveshare HAT
-GPIO.setup(EXIT_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+idle = IdleManager(device)
+mux = InputMux(buttons=("KEY3", "JOY_UP", "JOY_DOWN"), idle=idle)
+
+# Wrapped lines kept for scrolling back with the joystick.
+MAX_HISTORY = 500
+LINE_HEIGHT = 12
+VISIBLE_LINES = (LCD_HEIGHT - STATUS_HEIGHT) // LINE_HEIGHT
 
 messages: list[str] = []
+message_view = ListView(
+    (0, STATUS_HEIGHT, LCD_WIDTH, STATUS_HEIGHT + VISIBLE_LINES * LINE_HEIGHT),
+    LINE_HEIGHT,
+    font,
+    label_x=0,
+    selectable=False,
+)
+message_view.items = messages
+frame = Image.new("RGB", (LCD_WIDTH, LCD_HEIGHT), colors.background)
+status = WidgetScreen(
+    device, [StatusBar((0, 0, LCD_WIDTH, STATUS_HEIGHT))], frame=frame
+)
+# Messages arrive on the server thread while input scrolls the view.
+_draw_lock = threading.Lock()
 
 
 def draw_messages() -> None:
-    """Render the last messages to the LCD."""
-    with canvas(device) as draw:
-        draw.rectangle(device.bounding_box, outline="black", fill="black")
-        start = max(0, len(messages) - 10)
-        for i, msg in enumerate(messages[start:]):
-            draw.text((0, i * 12), msg, fill="white", font=font)
+    """Render the visible messages and the status bar to the LCD."""
+    with _draw_lock, tracing.span("draw"):
+        changed = message_view.draw(frame)
+        changed = status.draw() or changed
+        if changed:
+            device.display(frame)
+
+
+def next_redraw():
+    """Seconds until the scrolling view or the status bar next changes."""
+    timeouts = [message_view.next_frame_in(), status.timeout()]
+    return min((t for t in timeouts if t is not None), default=None)
 
 
 def add_message(text: str) -> None:
     """Add text to the message buffer and redraw."""
-    for line in textwrap.wrap(text, width=21):
-        messages.append(line)
-    if len(messages) > 30:
-        del messages[:-30]
+    with _draw_lock:
+        follow = message_view.at_end
+        for line in textwrap.wrap(text, width=21):
+            messages.append(line)
+        if len(messages) > MAX_HISTORY:
+            del messages[:-MAX_HISTORY]
+        message_view.items = messages
+        if follow:
+            message_view.scroll_to_end()
+    # New messages light the screen up again.
+    idle.poke()
     draw_messages()
+    # The input thread may be waiting with no timeout; let it pick up
+    # the scroll this started.
+    mux.interrupt()
 
 
 def get_text_input(prompt: str = "") -> str:
@@ -75,61 +95,66 @@ def get_text_input(prompt: str = "") -> str:
         return ""
 
 
-def _send(sock: socket.socket, msg: str) -> None:
-    sock.sendall(msg.encode("utf-8"))
-
-
 def _handle_server(sock: socket.socket) -> None:
     buffer = ""
     while True:
         data = sock.recv(4096).decode("utf-8", "ignore")
         if not data:
             break
+        tracing.instant("recv", "irc")
         buffer += data
         while "\r\n" in buffer:
             line, buffer = buffer.split("\r\n", 1)
             if line.startswith("PING"):
-                _send(sock, f"PONG {line.split()[1]}\r\n")
+                send(sock, f"PONG {line.split()[1]}\r\n")
             else:
-                if " PRIVMSG " in line and " :" in line:
-                    prefix, rest = line.split(" PRIVMSG ", 1)
-                    target, text = rest.split(" :", 1)
-                    if target == CHANNEL:
-                        nick = (
-                            prefix.split("!")[0][1:]
-                            if line.startswith(":")
-                            else prefix
-                        )
-                        add_message(f"{nick}: {text}")
-                else:
+                privmsg = parse_privmsg(line)
+                if privmsg is None:
                     add_message(line)
+                elif privmsg[1] == CHANNEL:
+                    add_message(f"{privmsg[0]}: {privmsg[2]}")
+
+
+def _watch_input() -> None:
+    """Scroll the history with the joystick; KEY3 interrupts the prompt."""
+    while True:
+        button = mux.get(timeout=next_redraw())
+        if button == "KEY3":
+            break
+        with _draw_lock:
+            if button == "JOY_UP":
+                message_view.move(-1)
+            elif button == "JOY_DOWN":
+                message_view.move(1)
+        draw_messages()
+    os.kill(os.getpid(), signal.SIGINT)
 
 
 def main() -> None:
     with socket.socket() as sock:
         sock.connect((SERVER, PORT))
-        _send(sock, f"NICK {NICK}\r\n")
-        _send(sock, f"USER {NICK} 0 * :{NICK}\r\n")
-        _send(sock, f"JOIN {CHANNEL}\r\n")
+        register(sock)
 
         thread = threading.Thread(
             target=_handle_server, args=(sock,), daemon=True
         )
         thread.start()
+        threading.Thread(target=_watch_input, daemon=True).start()
 
         try:
             while True:
-                if GPIO.input(EXIT_PIN) == GPIO.LOW:
-                    break
                 message = get_text_input("> ")
                 if not message:
                     continue
                 if message.lower() == "/quit":
                     break
-                _send(sock, f"PRIVMSG {CHANNEL} :{message}\r\n")
+                send(sock, f"PRIVMSG {CHANNEL} :{message}\r\n")
                 add_message(f"{NICK}: {message}")
+        except KeyboardInterrupt:
+            pass
         finally:
-            _send(sock, "QUIT :Bye\r\n")
+            send(sock, "QUIT :Bye\r\n")
+            mux.close()
             device.cleanup()
             GPIO.cleanup()
 
@@ -0,0 +1,33 @@
+"""Connection details and line parsing shared by the IRC client and the
+notification service's mention watcher."""
+
+import socket
+from typing import Optional
+
+# Connection details are fixed so that the client always connects to
+# 192.168.0.81 on port 6667 using nickname "birdie" in channel "#pet".
+SERVER = "192.168.0.81"
+PORT = 6667
+CHANNEL = "#pet"
+NICK = "birdie"
+
+
+def send(sock: socket.socket, msg: str) -> None:
+    sock.sendall(msg.encode("utf-8"))
+
+
+def register(sock: socket.socket, nick: str = NICK) -> None:
+    """Log in as ``nick`` and join :data:`CHANNEL`."""
+    send(sock, f"NICK {nick}\r\n")
+    send(sock, f"USER {nick} 0 * :{nick}\r\n")
+    send(sock, f"JOIN {CHANNEL}\r\n")
+
+
+def parse_privmsg(line: str) -> Optional[tuple[str, str, str]]:
+    """Return ``(nick, target, text)`` for a PRIVMSG line, else None."""
+    if " PRIVMSG " not in line or " :" not in line:
+        return None
+    prefix, rest = line.split(" PRIVMSG ", 1)
+    target, text = rest.split(" :", 1)
+    nick = prefix.split("!")[0][1:] if line.startswith(":") else prefix
+    return nick, target, text
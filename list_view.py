@@ -0,0 +1,335 @@
+"""Scrolling list widget for the 128x128 LCD.
+
+:class:`ListView` draws only the rows inside its box, keeps rendered
+rows in a small cache, eases the view towards the selection instead of
+jumping, scrolls labels that are too wide for the screen (marquee) on the
+selected row, and reports which parts of the frame it changed. Drawing
+costs the same for five items or five hundred.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence
+
+from PIL import Image, ImageDraw
+
+from palette import ColorSpec, colors, resolve
+
+# Rendered rows kept for reuse; a screen shows at most a dozen.
+ROW_CACHE_SIZE = 64
+
+# Scrolling eases over SCROLL_TIME; longer jumps (e.g. wrapping from the
+# last item to the first) happen at once.
+SCROLL_TIME = 0.15
+FRAME_INTERVAL = 1 / 30
+
+# Marquee: wait, then scroll at MARQUEE_SPEED pixels per second.
+MARQUEE_DELAY = 1.0
+MARQUEE_SPEED = 30
+MARQUEE_GAP = 24
+MARQUEE_INTERVAL = 1 / 15
+
+Box = tuple[int, int, int, int]
+
+
+class ListView:
+    """A virtualized list of rows inside ``box`` on a frame image.
+
+    ``label(item)`` gives the row text and ``detail(item)`` optional text
+    drawn right-aligned (e.g. a signal strength). Lists that are not
+    ``selectable`` (such as chat history) scroll by rows instead.
+    """
+
+    def __init__(
+        self,
+        box: Box,
+        row_height: int,
+        font,
+        label: Callable[[object], str] = str,
+        detail: Optional[Callable[[object], str]] = None,
+        label_x: int = 15,
+        selectable: bool = True,
+        empty_text: str = "",
+        color: Optional[ColorSpec] = None,
+        selected_color: Optional[ColorSpec] = None,
+        background: Optional[ColorSpec] = None,
+    ) -> None:
+        self.box = box
+        self.row_height = row_height
+        self.font = font
+        self.label = label
+        self.detail = detail
+        self.label_x = label_x
+        self.selectable = selectable
+        self.empty_text = empty_text
+        self.color = resolve(color or colors.text)
+        self.selected_color = resolve(selected_color or colors.highlight)
+        self.background = resolve(background or colors.background)
+
+        self.width = box[2] - box[0]
+        self.height = box[3] - box[1]
+        self._items: Sequence = ()
+        self.index = 0
+        self._selected_at = time.monotonic()
+
+        # Scroll position in pixels, animated from _scroll_from to
+        # _scroll_to between _scroll_start and _scroll_start+SCROLL_TIME.
+        self._scroll_from = 0
+        self._scroll_to = 0
+        self._scroll_start = 0.0
+
+        self._cache: OrderedDict = OrderedDict()
+        self._measure = ImageDraw.Draw(Image.new("1", (1, 1)))
+        self._drawn_scroll: Optional[int] = None
+        self._drawn_count = -1
+        self._drawn_empty = ""
+        self._drawn_rows: dict[int, tuple] = {}
+
+    # --- Model ---
+
+    @property
+    def items(self) -> Sequence:
+        return self._items
+
+    @items.setter
+    def items(self, items: Sequence) -> None:
+        self._items = items
+        if items:
+            self.index = min(self.index, len(items) - 1)
+        else:
+            self.index = 0
+        self._clamp_scroll()
+
+    @property
+    def selected(self):
+        if not self.selectable or not self._items:
+            return None
+        return self._items[self.index]
+
+    def move(self, delta: int) -> None:
+        """Move the selection by ``delta`` rows, wrapping at the ends.
+
+        Lists that are not selectable scroll by ``delta`` rows instead.
+        """
+        if not self._items:
+            return
+        if not self.selectable:
+            self._scroll_towards(self._scroll_to + delta * self.row_height)
+            return
+        self.select((self.index + delta) % len(self._items))
+
+    def select(self, index: int) -> None:
+        self.index = max(0, min(index, len(self._items) - 1))
+        self._selected_at = time.monotonic()
+        top = self.index * self.row_height
+        target = self._scroll_to
+        if top < target:
+            target = top
+        elif top + self.row_height > target + self.height:
+            target = top + self.row_height - self.height
+        self._scroll_towards(target)
+
+    def scroll_to_end(self) -> None:
+        self._scroll_towards(self._max_scroll())
+
+    @property
+    def at_end(self) -> bool:
+        return self._scroll_to >= self._max_scroll()
+
+    # --- Scrolling ---
+
+    def _max_scroll(self) -> int:
+        return max(0, len(self._items) * self.row_height - self.height)
+
+    def _clamp_scroll(self) -> None:
+        limit = self._max_scroll()
+        if self._scroll_to > limit:
+            self._scroll_from = self._scroll_to = limit
+
+    def _scroll_position(self, now: float) -> int:
+        progress = (now - self._scroll_start) / SCROLL_TIME
+        if progress >= 1:
+            return self._scroll_to
+        offset = (self._scroll_to - self._scroll_from) * progress
+        return self._scroll_from + int(offset)
+
+    def _scroll_towards(self, target: int) -> None:
+        target = max(0, min(target, self._max_scroll()))
+        now = time.monotonic()
+        current = self._scroll_position(now)
+        if target == current:
+            self._scroll_from = self._scroll_to = target
+            return
+        if abs(target - current) > self.height:
+            current = target
+        self._scroll_from = current
+        self._scroll_to = target
+        self._scroll_start = now
+
+    def next_frame_in(self) -> Optional[float]:
+        """Seconds until the view needs redrawing, or None when static."""
+        now = time.monotonic()
+        # Compare what was drawn, not where the scroll is by now: the
+        # last frame drawn may be from just before the scroll ended.
+        if self._drawn_scroll != self._scroll_to:
+            return FRAME_INTERVAL
+        if self._marquee_width() is None:
+            return None
+        wait = self._selected_at + MARQUEE_DELAY - now
+        return max(wait, MARQUEE_INTERVAL)
+
+    # --- Rendering ---
+
+    def invalidate(self) -> None:
+        """Redraw the whole box on the next :meth:`draw`."""
+        self._drawn_scroll = None
+
+    def _cached(self, key: tuple, render: Callable[[], Image.Image]):
+        image = self._cache.get(key)
+        if image is None:
+            image = render()
+            self._cache[key] = image
+            if len(self._cache) > ROW_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return image
+
+    def _row_text(self, item, selected: bool) -> tuple[str, str]:
+        text = self.label(item)
+        if selected:
+            text = f"> {text}"
+        detail = self.detail(item) if self.detail is not None else ""
+        return text, detail
+
+    def _label_width(self, detail: str) -> int:
+        width = self.width - self.label_x
+        if detail:
+            detail_width = self._measure.textlength(detail, font=self.font)
+            width -= int(detail_width) + 2
+        return max(0, width)
+
+    def _marquee_width(self) -> Optional[int]:
+        """Width of the selected label if it overflows, else None."""
+        item = self.selected
+        if item is None:
+            return None
+        text, detail = self._row_text(item, True)
+        width = int(self._measure.textlength(text, font=self.font))
+        if width <= self._label_width(detail):
+            return None
+        return width
+
+    def _render_strip(self, text: str, color: str, repeat: bool):
+        width = int(self._measure.textlength(text, font=self.font))
+        if repeat:
+            width = 2 * (width + MARQUEE_GAP)
+        strip = Image.new("RGB", (max(1, width), self.row_height),
+                          self.background)
+        draw = ImageDraw.Draw(strip)
+        draw.text((0, 0), text, fill=color, font=self.font)
+        if repeat:
+            draw.text((width // 2, 0), text, fill=color, font=self.font)
+        return strip
+
+    def _render_row(self, text: str, detail: str, color: str, label_offset):
+        row = Image.new("RGB", (self.width, self.row_height),
+                        self.background)
+        label_width = self._label_width(detail)
+        if label_offset is None:
+            strip = self._cached(
+                ("strip", text, color),
+                lambda: self._render_strip(text, color, False),
+            )
+            row.paste(strip.crop((0, 0, label_width, self.row_height)),
+                      (self.label_x, 0))
+        else:
+            strip = self._cached(
+                ("marquee", text, color),
+                lambda: self._render_strip(text, color, True),
+            )
+            row.paste(
+                strip.crop((label_offset, 0, label_offset + label_width,
+                            self.row_height)),
+                (self.label_x, 0),
+            )
+        if detail:
+            draw = ImageDraw.Draw(row)
+            x = self.width - draw.textlength(detail, font=self.font)
+            draw.text((x, 0), detail, fill=color, font=self.font)
+        return row
+
+    def _row_key(self, index: int, now: float) -> tuple:
+        selected = self.selectable and index == self.index
+        text, detail = self._row_text(self._items[index], selected)
+        color = self.selected_color if selected else self.color
+        offset = None
+        if selected:
+            text_width = self._marquee_width()
+            if text_width is not None:
+                elapsed = max(0.0, now - self._selected_at - MARQUEE_DELAY)
+                offset = int(elapsed * MARQUEE_SPEED) % (
+                    text_width + MARQUEE_GAP
+                )
+        return text, detail, color, offset
+
+    def _paste_row(self, image: Image.Image, key: tuple, y: int) -> Box:
+        text, detail, color, offset = key
+        if offset is None:
+            row = self._cached(
+                ("row",) + key, lambda: self._render_row(*key)
+            )
+        else:
+            row = self._render_row(*key)
+        x0, top, x1, bottom = self.box
+        row_top = max(y, top)
+        row_bottom = min(y + self.row_height, bottom)
+        image.paste(
+            row.crop((0, row_top - y, self.width, row_bottom - y)),
+            (x0, row_top),
+        )
+        return x0, row_top, x1, row_bottom
+
+    def draw(self, image: Image.Image) -> list[Box]:
+        """Draw the visible rows onto ``image``; return the changed boxes."""
+        now = time.monotonic()
+        scroll = self._scroll_position(now)
+        count = len(self._items)
+        full = (
+            scroll != self._drawn_scroll
+            or count != self._drawn_count
+            or (not count and self.empty_text != self._drawn_empty)
+        )
+        if full:
+            ImageDraw.Draw(image).rectangle(
+                (self.box[0], self.box[1], self.box[2] - 1, self.box[3] - 1),
+                fill=self.background,
+            )
+            self._drawn_rows = {}
+            self._drawn_scroll = scroll
+            self._drawn_count = count
+            self._drawn_empty = self.empty_text
+            if not count and self.empty_text:
+                self._draw_empty(image)
+        if not count:
+            return [self.box] if full else []
+
+        first = scroll // self.row_height
+        last = min(count, -(-(scroll + self.height) // self.row_height))
+        dirty = []
+        rows = {}
+        for index in range(first, last):
+            key = self._row_key(index, now)
+            rows[index] = key
+            if not full and self._drawn_rows.get(index) == key:
+                continue
+            y = self.box[1] + index * self.row_height - scroll
+            dirty.append(self._paste_row(image, key, y))
+        self._drawn_rows = rows
+        return [self.box] if full else dirty
+
+    def _draw_empty(self, image: Image.Image) -> None:
+        draw = ImageDraw.Draw(image)
+        y = self.box[1] + (self.height - self.row_height) // 2
+        draw.text((self.label_x, y), self.empty_text,
+                  fill=self.selected_color, font=self.font)
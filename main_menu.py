@@ -4,32 +4,27 @@
 import os
 import subprocess
 import time
+from typing import Optional
 
 import RPi.GPIO as GPIO
-from luma.core.interface.serial import spi
-from luma.core.render import canvas
-from luma.lcd.device import st7735
 from PIL import ImageFont
 
+import app_bus
+import remote_control_server
+import tracing
+from display_writer import DisplayWriter
+from hat import LCD_HEIGHT, LCD_WIDTH, create_device
+from idle_manager import IdleManager
+from input_mux import InputMux
+from list_view import ListView
+from notification_service import NotificationService
+from status_bar import STATUS_HEIGHT, StatusBar
+from widgets import WidgetScreen
 
-# --- Display setup ---
-RST_PIN = 27
-DC_PIN = 25
-LCD_WIDTH = 128
-LCD_HEIGHT = 128
-
-serial = spi(
-    port=0,
-    device=0,
-    cs_high=False,
-    gpio_DC=DC_PIN,
-    gpio_RST=RST_PIN,
-    speed_hz=16000000,
-)
 
-device = st7735(
-    serial, width=LCD_WIDTH, height=LCD_HEIGHT, h_offset=2, v_offset=1
-)
+# --- Display setup ---
+device = create_device()
+screen = DisplayWriter(device)
 
 try:
     font = ImageFont.truetype("DejaVuSansMono.ttf", 12)
@@ -37,39 +32,17 @@ except IOError:
     font = ImageFont.load_default()
 
 # --- Button/Joystick setup ---
-GPIO.setmode(GPIO.BCM)
-BUTTON_PINS = {
-    "KEY1": 21,
-    "KEY2": 20,
-    "KEY3": 16,
-    "JOY_UP": 6,
-    "JOY_DOWN": 19,
-    "JOY_LEFT": 5,
-    "JOY_RIGHT": 26,
-    "JOY_PRESS": 13,
-}
-
-for pin in BUTTON_PINS.values():
-    GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+mux = InputMux(idle=IdleManager(device))
 
 
 def reinitialize():
-    """Reinitialize display and GPIO after running another script."""
-    global serial, device
-    serial = spi(
-        port=0,
-        device=0,
-        cs_high=False,
-        gpio_DC=DC_PIN,
-        gpio_RST=RST_PIN,
-        speed_hz=16000000,
-    )
-    device = st7735(
-        serial, width=LCD_WIDTH, height=LCD_HEIGHT, h_offset=2, v_offset=1
-    )
-    GPIO.setmode(GPIO.BCM)
-    for pin in BUTTON_PINS.values():
-        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    """Reinitialize display and input after running another script."""
+    global device, screen, mux, status
+    device = create_device()
+    screen = DisplayWriter(device)
+    status = new_status(screen)
+    mux = InputMux(idle=IdleManager(device))
+    mux.on("view_image", open_image)
 
 
 MENU_ITEMS = [
@@ -83,67 +56,132 @@ MENU_ITEMS = [
 ]
 
 
-current_index = 0
-top_index = 0
+VIEWER = "images_app.py"
+
+# An image asked for from the remote page while an app that cannot show
+# it was in the foreground; the viewer opens with it when the app exits.
+pending_image: Optional[str] = None
+
 LINE_HEIGHT = 20
-ITEMS_PER_SCREEN = LCD_HEIGHT // LINE_HEIGHT
+ITEMS_PER_SCREEN = (LCD_HEIGHT - STATUS_HEIGHT) // LINE_HEIGHT
+
+menu_view = ListView(
+    (
+        0,
+        STATUS_HEIGHT,
+        LCD_WIDTH,
+        STATUS_HEIGHT + ITEMS_PER_SCREEN * LINE_HEIGHT,
+    ),
+    LINE_HEIGHT,
+    font,
+    label=lambda item: item[0],
+)
+menu_view.items = MENU_ITEMS
 
 
-def run_selected():
-    script_path = os.path.join(
-        os.path.dirname(__file__), MENU_ITEMS[current_index][1]
-    )
+def run_script(script: str, *args: str) -> None:
+    """Hand the display, buttons and bus to ``script`` until it exits."""
+    global pending_image
+    script_path = os.path.join(os.path.dirname(__file__), script)
+    # Set before the menu stops listening so no image request is lost.
+    notifier.foreground = script
+    mux.close()
+    screen.close()
     device.cleanup()
     GPIO.cleanup()
     try:
-        subprocess.call(["python3", script_path])
+        subprocess.call(["python3", script_path, *args])
     finally:
         reinitialize()
+        notifier.foreground = None
+        menu_view.invalidate()
         time.sleep(0.5)
+    name, pending_image = pending_image, None
+    if name is not None:
+        run_script(VIEWER, name)
+
+
+def run_selected():
+    run_script(menu_view.selected[1])
+
+
+def open_image(message: dict) -> None:
+    """Serve a remote ``view_image`` request with the image viewer."""
+    name = message.get("name")
+    if name:
+        run_script(VIEWER, name)
 
 
+def request_image(name: str) -> None:
+    """Route a remote page's image request (called on a server thread).
+
+    The menu and the viewer take it over the bus; any other app keeps
+    running and the viewer opens once it exits.
+    """
+    global pending_image
+    if notifier.foreground in (None, VIEWER):
+        message = {"type": "view_image", "name": name}
+        if app_bus.publish(message):
+            return
+    pending_image = name
+
+
+def new_status(screen):
+    """Status bar drawn into ``screen``'s back buffer above the menu."""
+    return WidgetScreen(
+        screen,
+        [StatusBar((0, 0, LCD_WIDTH, STATUS_HEIGHT))],
+        frame=screen.back,
+    )
+
+
+status = new_status(screen)
+
+
+def draw_menu():
+    # Both report whether they changed; draw both before presenting.
+    with tracing.span("draw"):
+        changed = menu_view.draw(screen.back)
+        changed = status.draw() or changed
+    if changed:
+        screen.present()
+
+
+def next_redraw():
+    """Seconds until the menu or the status bar next changes."""
+    timeouts = [menu_view.next_frame_in(), status.timeout()]
+    return min((t for t in timeouts if t is not None), default=None)
+
+
+mux.on("view_image", open_image)
+try:
+    remote_control_server.start_server()
+except OSError as exc:
+    print(f"Remote server not started: {exc}")
+# Toasts for WiFi changes and IRC mentions, shown over any app.
+notifier = NotificationService()
+notifier.start()
+remote_control_server.on_view_image = request_image
+
 print(
     "Main menu started. Use joystick to navigate and KEY1/JOY_PRESS to select."
 )
 try:
     while True:
-        if GPIO.input(BUTTON_PINS["JOY_UP"]) == GPIO.LOW:
-            prev_index = current_index
-            current_index = (current_index - 1) % len(MENU_ITEMS)
-            if prev_index == 0 and current_index == len(MENU_ITEMS) - 1:
-                top_index = max(0, len(MENU_ITEMS) - ITEMS_PER_SCREEN)
-            elif current_index < top_index:
-                top_index = current_index
-            time.sleep(0.2)
-        elif GPIO.input(BUTTON_PINS["JOY_DOWN"]) == GPIO.LOW:
-            prev_index = current_index
-            current_index = (current_index + 1) % len(MENU_ITEMS)
-            if prev_index == len(MENU_ITEMS) - 1 and current_index == 0:
-                top_index = 0
-            elif current_index >= top_index + ITEMS_PER_SCREEN:
-                top_index = current_index - ITEMS_PER_SCREEN + 1
-            time.sleep(0.2)
-        elif (
-            GPIO.input(BUTTON_PINS["JOY_PRESS"]) == GPIO.LOW
-            or GPIO.input(BUTTON_PINS["KEY1"]) == GPIO.LOW
-        ):
+        draw_menu()
+        button = mux.get(timeout=next_redraw())
+        if button == "JOY_UP":
+            menu_view.move(-1)
+        elif button == "JOY_DOWN":
+            menu_view.move(1)
+        elif button in ("JOY_PRESS", "KEY1"):
             run_selected()
-
-        with canvas(device) as draw:
-            draw.rectangle(device.bounding_box, outline="black", fill="black")
-            for offset, (name, _) in enumerate(
-                MENU_ITEMS[top_index:top_index + ITEMS_PER_SCREEN]
-            ):
-                item_index = top_index + offset
-                y = offset * LINE_HEIGHT
-                if item_index == current_index:
-                    draw.text((15, y), f"> {name}", fill="yellow", font=font)
-                else:
-                    draw.text((15, y), name, fill="white", font=font)
-
-        time.sleep(0.05)
 except KeyboardInterrupt:
     print("\nExiting menu.")
 finally:
+    notifier.stop()
+    remote_control_server.stop_server()
+    mux.close()
+    screen.close()
     device.cleanup()
     GPIO.cleanup()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""How much memory each app uses, and whether it fits its budget.
+
+The Pi Zero has 512 MB shared with the OS and the network services, and
+every app is its own Python process on top of the main menu, so an app
+that grows past a few tens of megabytes pushes the device into swap.
+
+Setting ``NANODECK_MEMORY_PROFILE=1`` in the environment turns on the
+profiling mode in every app started from it (:func:`hat.create_device`
+calls :func:`install`): a daemon thread samples the resident set size
+every :data:`SAMPLE_INTERVAL`, :mod:`tracemalloc` traces Python
+allocations, and at exit the app writes a report under
+:data:`REPORT_DIR` and prints a summary with its peak and steady-state
+(median of the second half of the run) RSS and the lines that allocated
+the most. A number instead of ``1`` keeps that many frames per traceback.
+
+Run as a script, it plays the :mod:`golden_frames` scenarios with
+profiling on and fails if any app's peak RSS exceeds its entry in
+:data:`BUDGETS_MB`; ``display_benchmark.py`` checks its own peak the same
+way.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Optional
+
+ENV_VAR = "NANODECK_MEMORY_PROFILE"
+
+SAMPLE_INTERVAL = 0.5
+TOP_ALLOCATIONS = 10
+
+REPORT_DIR = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+    "nanodeck-memory",
+)
+
+MB = 1024 * 1024
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+STATM_PATH = "/proc/self/statm"
+SMAPS_ROLLUP_PATH = "/proc/self/smaps_rollup"
+
+# Peak resident memory allowed per process, in MB. The main menu stays up
+# under every app, so an app and the menu together must leave the OS,
+# the network services and the page cache most of the 512 MB.
+BUDGETS_MB = {
+    "main_menu.py": 60,
+    # Zooming into a 12 MP photo decodes it in full once (48 MB).
+    "images_app.py": 100,
+    "settings_menu.py": 60,
+    "snake_game.py": 60,
+    "irc_chat.py": 60,
+    "remote_control_server.py": 70,
+    "test_144_lcd.py": 50,
+    "test_screen_buttons_joystick.py": 50,
+    "display_benchmark.py": 80,
+}
+DEFAULT_BUDGET_MB = 60
+
+
+def budget_mb(app: str) -> int:
+    return BUDGETS_MB.get(os.path.basename(app), DEFAULT_BUDGET_MB)
+
+
+def read_rss() -> int:
+    """Resident set size of this process in bytes."""
+    with open(STATM_PATH, "rb") as statm:
+        return int(statm.read().split()[1]) * PAGE_SIZE
+
+
+def read_pss() -> Optional[int]:
+    """Proportional set size in bytes: shared pages split between users.
+
+    Shared libraries count in full in every process's RSS; the PSS is
+    what this process adds to the device's total.
+    """
+    try:
+        with open(SMAPS_ROLLUP_PATH) as rollup:
+            for line in rollup:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemoryProfiler:
+    """Sample this process's RSS and trace its Python allocations."""
+
+    def __init__(
+        self, interval: float = SAMPLE_INTERVAL, frames: int = 1
+    ) -> None:
+        self.interval = interval
+        self.frames = frames
+        self.samples: list[tuple[float, int]] = []
+        self._started = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.frames:
+            tracemalloc.start(self.frames)
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval):
+                return
+
+    def sample(self) -> int:
+        rss = read_rss()
+        self.samples.append((time.monotonic() - self._started, rss))
+        return rss
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def report(self, app: str) -> dict:
+        """Stop sampling and return the figures as a JSON-ready dict."""
+        self.stop()
+        self.sample()
+        rss = [value for _, value in self.samples]
+        later = sorted(rss[len(rss) // 2:])
+        steady = later[len(later) // 2]
+        # The kernel's high-water mark also catches spikes between samples.
+        peak = max(max(rss), resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss * 1024)
+        report = {
+            "app": os.path.basename(app),
+            "pid": os.getpid(),
+            "seconds": round(self.samples[-1][0], 1),
+            "peak_rss_mb": round(peak / MB, 1),
+            "steady_rss_mb": round(steady / MB, 1),
+            "budget_mb": budget_mb(app),
+        }
+        pss = read_pss()
+        if pss is not None:
+            report["pss_mb"] = round(pss / MB, 1)
+        if tracemalloc.is_tracing():
+            current, python_peak = tracemalloc.get_traced_memory()
+            report["python_mb"] = round(current / MB, 1)
+            report["python_peak_mb"] = round(python_peak / MB, 1)
+            stats = tracemalloc.take_snapshot().statistics("lineno")
+            report["top"] = [
+                {
+                    "where": f"{stat.traceback[0].filename}:"
+                             f"{stat.traceback[0].lineno}",
+                    "kb": round(stat.size / 1024),
+                    "count": stat.count,
+                }
+                for stat in stats[:TOP_ALLOCATIONS]
+            ]
+            tracemalloc.stop()
+        return report
+
+
+def over_budget(report: dict) -> bool:
+    return report["peak_rss_mb"] > report["budget_mb"]
+
+
+def summary(report: dict) -> str:
+    line = (
+        f"{report['app']:<32} peak {report['peak_rss_mb']:6.1f} MB"
+        f"  steady {report['steady_rss_mb']:6.1f} MB"
+    )
+    if "pss_mb" in report:
+        line += f"  pss {report['pss_mb']:6.1f} MB"
+    if "python_peak_mb" in report:
+        line += f"  python {report['python_peak_mb']:5.1f} MB"
+    line += f"  budget {report['budget_mb']} MB"
+    if over_budget(report):
+        line += "  OVER BUDGET"
+    return line
+
+
+profiler: Optional[MemoryProfiler] = None
+
+
+def install() -> None:
+    """Start profiling if the environment asks for it; report at exit."""
+    global profiler
+    value = os.environ.get(ENV_VAR, "")
+    if profiler is not None or value in ("", "0"):
+        return
+    profiler = MemoryProfiler(frames=int(value) if value.isdigit() else 1)
+    profiler.start()
+    atexit.register(finish)
+
+
+def finish() -> Optional[dict]:
+    """Write and print this process's report, once."""
+    global profiler
+    if profiler is None:
+        return None
+    report = profiler.report(sys.argv[0])
+    profiler = None
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    app = os.path.splitext(report["app"])[0]
+    path = os.path.join(REPORT_DIR, f"{app}-{os.getpid()}.json")
+    with open(path, "w") as report_file:
+        json.dump(report, report_file, indent=1)
+    print(summary(report))
+    return report
+
+
+def check_budget(app: str) -> bool:
+    """Print this process's peak RSS against its budget; True if within."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    budget = budget_mb(app)
+    within = peak <= budget
+    print(
+        f"Peak RSS {peak:.1f} MB, budget {budget} MB"
+        + ("" if within else ": OVER BUDGET")
+    )
+    return within
+
+
+def main() -> None:
+    import golden_frames
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "scenarios", nargs="*", metavar="scenario",
+        help=f"one of {', '.join(golden_frames.SCENARIOS)} (default: all)",
+    )
+    parser.add_argument("--frames", type=int, default=1,
+                        help="traceback frames kept per allocation")
+    parser.add_argument("--top", action="store_true",
+                        help="list the lines that allocated the most")
+    args = parser.parse_args()
+    names = args.scenarios or list(golden_frames.SCENARIOS)
+    unknown = [name for name in names if name not in golden_frames.SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    failed = 0
+    for name in names:
+        reports = golden_frames.run_isolated(
+            name, False, False, {ENV_VAR: str(max(1, args.frames))}
+        )
+        report = next((r for r in reports if "peak_rss_mb" in r), None)
+        if report is None:
+            print(f"{name}: no memory report")
+            failed += 1
+            continue
+        print(summary(report))
+        if args.top:
+            for entry in report.get("top", ()):
+                print(f"    {entry['kb']:7d} KB {entry['count']:7d}"
+                      f"  {entry['where']}")
+        failed += over_budget(report)
+    if failed:
+        print(f"{failed} apps over budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Background sources of notifications, run by the main menu.
+
+The main menu process stays up while apps run, like the remote control
+server it hosts. :class:`NotificationService` watches for events the
+foreground app cannot see and sends them as toasts (see
+:mod:`notifications`): the WiFi link coming and going, and IRC messages
+mentioning our nick, which a second, listen-only connection picks up
+while the IRC client is not running. The remote control server sends
+its own toasts for new connections and finished uploads.
+"""
+
+import socket
+import threading
+from typing import Optional
+
+import irc_link
+from notifications import notify
+from system_metrics import read_wifi
+
+WIFI_POLL = 5.0
+
+# The watcher's nick; the IRC client itself uses irc_link.NICK.
+WATCHER_NICK = irc_link.NICK + "_"
+IRC_RETRY = 60.0
+# How often a quiet IRC connection checks whether it should stop.
+IRC_POLL = 1.0
+
+IRC_APP = "irc_chat.py"
+
+
+class NotificationService:
+    """Watch WiFi and IRC on daemon threads and send toasts."""
+
+    def __init__(self, irc: bool = True) -> None:
+        self.irc = irc
+        # The script in the foreground, or None for the menu itself.
+        self.foreground: Optional[str] = None
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        targets = [self._watch_wifi]
+        if self.irc:
+            targets.append(self._watch_irc)
+        for target in targets:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=IRC_POLL * 2)
+        self._threads = []
+
+    # --- WiFi ---
+
+    def _watch_wifi(self) -> None:
+        connected = read_wifi() is not None
+        while not self._stop.wait(WIFI_POLL):
+            now = read_wifi() is not None
+            if now != connected:
+                connected = now
+                notify("WiFi connected" if now else "WiFi lost", "wifi")
+
+    # --- IRC mentions ---
+
+    def _watch_irc(self) -> None:
+        while not self._stop.is_set():
+            try:
+                with socket.create_connection(
+                    (irc_link.SERVER, irc_link.PORT), timeout=10
+                ) as sock:
+                    sock.settimeout(IRC_POLL)
+                    irc_link.register(sock, WATCHER_NICK)
+                    self._listen(sock)
+            except OSError:
+                pass
+            self._stop.wait(IRC_RETRY)
+
+    def _listen(self, sock: socket.socket) -> None:
+        buffer = ""
+        while not self._stop.is_set():
+            try:
+                data = sock.recv(4096)
+            except socket.timeout:
+                continue
+            if not data:
+                return
+            buffer += data.decode("utf-8", "ignore")
+            while "\r\n" in buffer:
+                line, buffer = buffer.split("\r\n", 1)
+                if line.startswith("PING"):
+                    irc_link.send(sock, f"PONG {line.split()[1]}\r\n")
+                    continue
+                privmsg = irc_link.parse_privmsg(line)
+                if privmsg is not None:
+                    self._on_message(*privmsg)
+        irc_link.send(sock, "QUIT :Bye\r\n")
+
+    def _on_message(self, nick: str, target: str, text: str) -> None:
+        if nick in (irc_link.NICK, WATCHER_NICK):
+            return
+        mentioned = irc_link.NICK.lower() in text.lower()
+        if target == WATCHER_NICK:
+            mentioned = True  # a private message
+        # The IRC client shows every message itself.
+        if mentioned and self.foreground != IRC_APP:
+            notify(f"{nick}: {text}", "irc")
@@ -0,0 +1,139 @@
+"""Short notifications shown over whatever app is in the foreground.
+
+Any process can call :func:`notify`: the toast goes over the app bus to
+the foreground app, whose :class:`input_mux.InputMux` hands it to the
+:class:`Toaster` that :func:`hat.create_device` attached to its panel.
+The toaster draws it as a banner in the strip the HAT driver reserves
+at the bottom of the screen (see :meth:`hat.HatST7735.show_banner`), so
+showing or hiding a toast is one small window and the app never
+redraws.
+
+Toasts are rate-limited on the receiving end: each stays up for
+:data:`TOAST_TIME` and at most :data:`MAX_PENDING` wait behind it, so a
+flood from any number of senders changes the strip at most once per
+:data:`TOAST_TIME` and costs the app nothing more. Repeats of a waiting
+toast are merged and, when the queue is full, the oldest waiting toast
+is dropped and counted on the next one shown.
+"""
+
+import collections
+import threading
+import time
+from typing import Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+import app_bus
+from palette import colors
+
+TOAST_TIME = 2.5
+MAX_PENDING = 3
+MAX_TEXT = 80
+
+# Palette role of the banner's left edge, by source.
+SOURCE_COLORS = {
+    "irc": "highlight",
+    "wifi": "info",
+    "remote": "accent",
+}
+DEFAULT_COLOR = "text"
+
+
+def notify(text: str, source: str = "") -> bool:
+    """Show ``text`` on the foreground app; False if nobody listens."""
+    return app_bus.publish(
+        {"type": "toast", "text": text[:MAX_TEXT], "source": source}
+    )
+
+
+class Toaster:
+    """Show toasts on ``device``'s banner strip one at a time."""
+
+    def __init__(self, device, height: int, duration: float = TOAST_TIME):
+        self.device = device
+        self.size = (device.width, height)
+        self.duration = duration
+        self.shown = 0
+        self.dropped = 0
+        self._pending: collections.deque = collections.deque()
+        self._dropped_since = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._font = ImageFont.load_default()
+
+    def push(self, text: str, source: str = "") -> None:
+        with self._cond:
+            if self._closed or (text, source) in self._pending:
+                return
+            if len(self._pending) >= MAX_PENDING:
+                self._pending.popleft()
+                self.dropped += 1
+                self._dropped_since += 1
+            self._pending.append((text, source))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def render(self, text: str, source: str, more: int = 0) -> Image.Image:
+        image = Image.new("RGB", self.size, colors.panel)
+        draw = ImageDraw.Draw(image)
+        role = SOURCE_COLORS.get(source, DEFAULT_COLOR)
+        draw.rectangle(
+            (0, 0, 2, self.size[1] - 1), fill=getattr(colors, role)
+        )
+        if more:
+            text = f"(+{more}) {text}"
+        # Cut to what fits; the default font is 6 px wide.
+        text = text[: (self.size[0] - 6) // 6]
+        draw.text((5, (self.size[1] - 11) // 2), text, fill=colors.text,
+                  font=self._font)
+        return image
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                text, source = self._pending.popleft()
+                more, self._dropped_since = self._dropped_since, 0
+            try:
+                self.device.show_banner(self.render(text, source, more))
+                self.shown += 1
+                time.sleep(self.duration)
+                with self._cond:
+                    if not self._pending:
+                        self.device.clear_banner()
+            except Exception as exc:
+                # E.g. the app closed its panel under us. Drop this toast
+                # only; the thread keeps serving the queue.
+                print(f"Notification not shown: {exc}")
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._pending.clear()
+            self._cond.notify()
+
+
+_toaster: Optional[Toaster] = None
+
+
+def attach(device, height: int) -> Toaster:
+    """Show this process's toasts on ``device`` from now on."""
+    global _toaster
+    if _toaster is not None:
+        _toaster.close()
+    _toaster = Toaster(device, height)
+    return _toaster
+
+
+def deliver(message: dict) -> None:
+    """Queue a ``toast`` bus message; dropped if no panel is attached."""
+    toaster = _toaster
+    if toaster is not None:
+        toaster.push(str(message.get("text", ""))[:MAX_TEXT],
+                     str(message.get("source", "")))
@@ -0,0 +1,112 @@
+"""The colours screens draw with, resolved once per theme.
+
+Screens name colours by role (``colors.text``, ``colors.highlight``)
+rather than by Pillow colour name, and a theme maps each role to a
+colour. Switching themes changes every screen without touching app
+code: :func:`hat.create_device` applies the "Theme" setting before the
+app builds its screens, and screens built afterwards use the new
+colours.
+
+Every colour is resolved once when its theme is loaded into a
+:class:`Color`, an RGB tuple Pillow draws with directly instead of
+parsing a name on every call, which also carries its packed RGB565
+value for code that writes panel pixels itself (see
+:class:`tile_engine.Tileset`).
+"""
+
+from typing import Union
+
+from PIL import ImageColor
+
+from rgb565 import pack_pixel
+
+DEFAULT_THEME = "dark"
+
+# A colour name, an RGB tuple or a Color.
+ColorSpec = Union[str, tuple]
+
+THEMES = {
+    "dark": {
+        "background": "black",
+        "text": "white",
+        "highlight": "yellow",
+        "dim": "gray",
+        "status": "silver",
+        "panel": "#202020",
+        "warning": "orange",
+        "good": "green",
+        "alert": "red",
+        "info": "cyan",
+        "accent": "lime",
+        "shape": "blue",
+    },
+    # Full-intensity colours only, and no grey text.
+    "high_contrast": {
+        "background": "black",
+        "text": "white",
+        "highlight": "yellow",
+        "dim": "white",
+        "status": "white",
+        "panel": "black",
+        "warning": "#ff8000",
+        "good": "lime",
+        "alert": "#ff3030",
+        "info": "cyan",
+        "accent": "lime",
+        "shape": "white",
+    },
+}
+
+
+class Color(tuple):
+    """An ``(r, g, b)`` tuple with its RGB565 value and panel bytes."""
+
+    def __new__(cls, spec: "ColorSpec") -> "Color":
+        if isinstance(spec, str):
+            rgb = ImageColor.getrgb(spec)[:3]
+        else:
+            rgb = tuple(spec)[:3]
+        color = super().__new__(cls, rgb)
+        color.spec = spec
+        color.rgb565 = pack_pixel(color)
+        # Big-endian, as the panel takes pixels.
+        color.packed = color.rgb565.to_bytes(2, "big")
+        return color
+
+    def __repr__(self) -> str:
+        return f"Color({self.spec!r})"
+
+
+class Palette:
+    """Each role of the current theme as an attribute holding a Color."""
+
+    def __init__(self, theme: str = DEFAULT_THEME) -> None:
+        self.use(theme)
+
+    def use(self, theme: str) -> None:
+        """Switch to ``theme``; unknown names fall back to the default."""
+        if theme not in THEMES:
+            theme = DEFAULT_THEME
+        self.theme = theme
+        for role, spec in THEMES[theme].items():
+            setattr(self, role, Color(spec))
+
+
+colors = Palette()
+
+# Colours given by name or value rather than by role.
+_named: dict[ColorSpec, Color] = {}
+
+
+def use(theme: str) -> None:
+    colors.use(theme)
+
+
+def resolve(color: ColorSpec) -> Color:
+    """Return ``color`` as a Color; names are parsed only once."""
+    if isinstance(color, Color):
+        return color
+    resolved = _named.get(color)
+    if resolved is None:
+        resolved = _named[color] = Color(color)
+    return resolved
@@ -0,0 +1,281 @@
+"""Background WiFi and Bluetooth scanning for the settings menu.
+
+``nmcli`` and ``bluetoothctl`` can take several seconds, which used to
+freeze the settings screen. :class:`RadioWorker` runs scans and connects
+on a daemon thread, appends results as the tool prints them, and keeps
+the last scan for :data:`SCAN_TTL` seconds so reopening a menu is
+instant.
+"""
+
+import re
+import subprocess
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+# Seconds a finished scan is reused before scanning again.
+SCAN_TTL = 20.0
+
+CONNECT_TIMEOUT = 45
+
+# Seconds a Bluetooth rescan listens for devices before listing them.
+BLUETOOTH_SCAN_SECONDS = 8
+
+# bluetoothctl colours its event tags even when not on a terminal.
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+
+class WifiNetwork(NamedTuple):
+    ssid: str
+    signal: int
+    security: str
+
+    @property
+    def key(self) -> str:
+        return self.ssid
+
+    @property
+    def secured(self) -> bool:
+        return self.security not in ("", "--")
+
+
+class BluetoothDevice(NamedTuple):
+    mac: str
+    name: str
+
+    @property
+    def key(self) -> str:
+        return self.mac
+
+
+def split_terse(line: str) -> list[str]:
+    """Split one line of ``nmcli -t`` output, honouring ``\\:`` escapes."""
+    fields = []
+    current = []
+    escaped = False
+    for char in line:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == ":":
+            fields.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    fields.append("".join(current))
+    return fields
+
+
+def parse_wifi_line(line: str) -> Optional[WifiNetwork]:
+    """Parse ``SSID:SIGNAL:SECURITY`` terse output; skip hidden networks."""
+    fields = split_terse(line.rstrip("\n"))
+    if len(fields) < 3 or not fields[0].strip():
+        return None
+    try:
+        signal = int(fields[1])
+    except ValueError:
+        signal = 0
+    return WifiNetwork(fields[0].strip(), signal, fields[2].strip())
+
+
+def parse_bluetooth_line(line: str) -> Optional[BluetoothDevice]:
+    """Parse a ``Device <mac> <name>`` line from ``bluetoothctl``.
+
+    Devices found while scanning are printed as ``[NEW] Device ...``;
+    other events (``[CHG]``, ``[DEL]``) are skipped.
+    """
+    line = ANSI_ESCAPE.sub("", line).strip()
+    if line.startswith("[NEW] "):
+        line = line[len("[NEW] "):]
+    parts = line.split(" ", 2)
+    if len(parts) < 3 or parts[0] != "Device":
+        return None
+    return BluetoothDevice(parts[1], parts[2])
+
+
+def wifi_scan_commands(force: bool) -> list[list[str]]:
+    return [[
+        "nmcli",
+        "-t",
+        "-f",
+        "SSID,SIGNAL,SECURITY",
+        "device",
+        "wifi",
+        "list",
+        "--rescan",
+        "yes" if force else "auto",
+    ]]
+
+
+def bluetooth_scan_commands(force: bool) -> list[list[str]]:
+    """List known devices, after a timed discovery scan on a rescan."""
+    commands = [["bluetoothctl", "devices"]]
+    if force:
+        scan = ["bluetoothctl", "--timeout", str(BLUETOOTH_SCAN_SECONDS),
+                "scan", "on"]
+        commands.insert(0, scan)
+    return commands
+
+
+# kind -> (finished at, results)
+_scan_cache: dict[str, tuple[float, list]] = {}
+
+
+class RadioWorker:
+    """Scan and connect on a background thread.
+
+    The UI reads :attr:`items`, :attr:`busy` and :attr:`status` on every
+    redraw; :attr:`version` changes whenever any of them does. Each scan
+    runs the commands ``scan_commands(force)`` returns in turn, parsing
+    every line they print. Results are kept by key and only sorted when
+    :attr:`items` is read after a change, so a burst of lines costs one
+    sort per redraw rather than one per line.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        scan_commands: Callable[[bool], list[list[str]]],
+        parse_line: Callable[[str], Optional[NamedTuple]],
+        connect_command: Callable[[str], list[str]],
+        sort_key: Optional[Callable] = None,
+    ) -> None:
+        self.kind = kind
+        self._scan_commands = scan_commands
+        self._parse_line = parse_line
+        self._connect_command = connect_command
+        self._sort_key = sort_key
+        self._lock = threading.Lock()
+        self._found: dict = {}
+        # Sorted _found, or None until it is next read after a change.
+        self._items: Optional[list] = []
+        self.status = ""
+        # Cleared, with a version bump, as the last thing a job does.
+        self.busy = False
+        self.version = 0
+
+    @property
+    def items(self) -> list:
+        with self._lock:
+            if self._items is None:
+                items = list(self._found.values())
+                if self._sort_key is not None:
+                    items.sort(key=self._sort_key)
+                self._items = items
+            return self._items
+
+    def _set(self, items=None, status=None, busy=None) -> None:
+        with self._lock:
+            if items is not None:
+                self._found = {item.key: item for item in items}
+                self._items = None
+            if status is not None:
+                self.status = status
+            if busy is not None:
+                self.busy = busy
+            self.version += 1
+
+    def _start(self, target, *args) -> bool:
+        with self._lock:
+            if self.busy:
+                return False
+            self.busy = True
+            self.version += 1
+        threading.Thread(
+            target=self._run, args=(target, *args), daemon=True
+        ).start()
+        return True
+
+    def _run(self, target, *args) -> None:
+        try:
+            target(*args)
+        finally:
+            self._set(busy=False)
+
+    def scan(self, force: bool = False) -> None:
+        """Show cached results if fresh, otherwise start a scan."""
+        cached = _scan_cache.get(self.kind)
+        if not force and cached and time.monotonic() - cached[0] < SCAN_TTL:
+            self._set(items=list(cached[1]), status="")
+            return
+        self._start(self._run_scan, force)
+
+    def connect(self, key: str, label: str) -> None:
+        """Connect to ``key`` in the background."""
+        self._start(self._run_connect, key, label)
+
+    def _merge(self, item) -> None:
+        """Add a parsed ``item``, replacing any entry with the same key."""
+        with self._lock:
+            old = self._found.get(item.key)
+            # Keep the strongest entry when an SSID is seen on several APs.
+            if old is not None and (
+                old == item
+                or getattr(old, "signal", 0) > getattr(item, "signal", 0)
+            ):
+                return
+            self._found[item.key] = item
+            self._items = None
+            self.version += 1
+
+    def _run_scan(self, force: bool) -> None:
+        self._set(items=[], status="Scanning")
+        failed = False
+        for command in self._scan_commands(force):
+            try:
+                proc = subprocess.Popen(
+                    command,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    text=True,
+                )
+            except OSError:
+                failed = True
+                continue
+            with proc:
+                for line in proc.stdout:
+                    item = self._parse_line(line)
+                    if item is not None:
+                        self._merge(item)
+            failed = failed or proc.returncode != 0
+        items = self.items
+        if failed and not items:
+            self._set(status="Scan failed")
+            return
+        _scan_cache[self.kind] = (time.monotonic(), items)
+        self._set(status="")
+
+    def _run_connect(self, key: str, label: str) -> None:
+        self._set(status=f"Connecting {label}")
+        try:
+            result = subprocess.run(
+                self._connect_command(key),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=CONNECT_TIMEOUT,
+            )
+            ok = result.returncode == 0
+        except (OSError, subprocess.TimeoutExpired):
+            ok = False
+        self._set(status=f"Connected {label}" if ok else f"Failed {label}")
+
+
+def wifi_worker() -> RadioWorker:
+    return RadioWorker(
+        "wifi",
+        wifi_scan_commands,
+        parse_wifi_line,
+        lambda ssid: ["nmcli", "device", "wifi", "connect", ssid],
+        sort_key=lambda n: (-n.signal, n.ssid.lower()),
+    )
+
+
+def bluetooth_worker() -> RadioWorker:
+    return RadioWorker(
+        "bluetooth",
+        bluetooth_scan_commands,
+        parse_bluetooth_line,
+        lambda mac: ["bluetoothctl", "connect", mac],
+    )
@@ -1,68 +1,208 @@
-"""Simple web server for remote control of the Raspberry Pi."""
+"""Simple web server for remote control of the Raspberry Pi.
 
+The main menu runs this server as a background service for as long as it
+is up; remote buttons and image requests are forwarded over the app bus
+to whichever app is in the foreground. Run directly, the script shows the
+service status and can start a standalone server when no host is running.
+"""
+
+import concurrent.futures
 import html
 import http.server
+import json
+import os
 import queue
+import shutil
 import socket
+import subprocess
+import sys
 import threading
 import time
 import urllib.parse
 
 import RPi.GPIO as GPIO
-from luma.core.interface.serial import spi
 from luma.core.render import canvas
-from luma.lcd.device import st7735
 from PIL import ImageFont
 
+import app_bus
+import frame_mirror
+import frame_stats
+import image_transcode
+import notifications
+import tracing
+import ws_protocol
+from hat import create_device
+from idle_manager import IdleManager
+from input_mux import InputMux
+from palette import colors
+
 # Global variables for communication with the main application
-from typing import Optional
+from typing import Callable, Optional
 
 remote_input_queue: queue.Queue[str] = queue.Queue()
 remote_image_request: Optional[str] = None
-
-# List of images available for viewing
-AVAILABLE_IMAGES: list[str] = [
-    "image1.png",
-    "sunset.jpg",
-    "mountain.png",
-]
+# Set by the main menu, which serves image requests itself (see
+# main_menu.request_image); otherwise they go straight onto the bus.
+on_view_image: Optional[Callable[[str], None]] = None
 
 _server_thread = None
 _server = None
+_forward_thread = None
 
-# --- Display setup ---
-RST_PIN = 27
-DC_PIN = 25
-LCD_WIDTH = 128
-LCD_HEIGHT = 128
-
-serial = spi(
-    port=0,
-    device=0,
-    cs_high=False,
-    gpio_DC=DC_PIN,
-    gpio_RST=RST_PIN,
-    speed_hz=16000000,
+SERVER_PORT = 8000
+
+# Buttons accepted from remote clients.
+REMOTE_BUTTONS = (
+    "KEY1",
+    "KEY2",
+    "KEY3",
+    "JOY_UP",
+    "JOY_DOWN",
+    "JOY_LEFT",
+    "JOY_RIGHT",
+    "JOY_PRESS",
 )
 
-device = st7735(
-    serial, width=LCD_WIDTH, height=LCD_HEIGHT, h_offset=2, v_offset=1
+# Held remote buttons repeat like a held joystick in the menus.
+REPEAT_DELAY = 0.4
+REPEAT_INTERVAL = 0.2
+
+# Upper bound on LCD mirror updates pushed to web viewers per second.
+MIRROR_FPS = 10
+
+# How long /trace.json waits for the foreground app to write its trace.
+TRACE_WAIT = 2.0
+TRACE_POLL = 0.05
+
+# Uploads are streamed to disk in chunks of this size, up to the limit.
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_BYTES = 32 * 1024 * 1024
+
+# Each upload is converted by TRANSCODE_SCRIPT in a process of its own,
+# started from one worker thread.
+TRANSCODE_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "image_transcode.py"
 )
+TRANSCODE_TIMEOUT = 120
+# The worker thread, and the names still being converted.
+_transcoder: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_pending_uploads: set[str] = set()
+_uploads_lock = threading.Lock()
 
 try:
     font = ImageFont.truetype("DejaVuSansMono.ttf", 12)
 except IOError:
     font = ImageFont.load_default()
 
-# --- Button setup ---
-GPIO.setmode(GPIO.BCM)
-BUTTON_PINS = {
-    "KEY1": 21,
-    "KEY3": 16,
-    "JOY_PRESS": 13,
-}
-for pin in BUTTON_PINS.values():
-    GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+class KeyRepeater:
+    """Queue held remote buttons again at the menu repeat rate.
+
+    One repeater serves one WebSocket connection so that a dropped
+    client releases everything it was holding.
+    """
+
+    def __init__(self) -> None:
+        self._held: dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def press(self, button: str) -> None:
+        remote_input_queue.put(button)
+        with self._cond:
+            self._held[button] = time.monotonic() + REPEAT_DELAY
+            self._cond.notify()
+
+    def release(self, button: str) -> None:
+        with self._cond:
+            self._held.pop(button, None)
+
+    def close(self) -> None:
+        with self._cond:
+            self._held.clear()
+            self._closed = True
+            self._cond.notify()
+
+    def _run(self) -> None:
+        with self._cond:
+            while not self._closed:
+                if not self._held:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                for button, due in list(self._held.items()):
+                    if due <= now:
+                        remote_input_queue.put(button)
+                        self._held[button] = now + REPEAT_INTERVAL
+                self._cond.wait(min(self._held.values()) - now)
+
+
+class MirrorBroadcaster:
+    """Stream changed LCD tiles to every connected viewer.
+
+    A single thread polls the shared frame snapshot at most ``fps`` times
+    a second and encodes the changed tiles once; each viewer only gets a
+    reference to the same message. A viewer that falls behind loses its
+    backlog and everyone is resynchronised with a keyframe.
+    """
+
+    def __init__(self, fps: float = MIRROR_FPS) -> None:
+        self.fps = fps
+        self._viewers: set[queue.Queue[bytes]] = set()
+        self._lock = threading.Lock()
+        self._reader = frame_mirror.FrameReader()
+        self._encoder = frame_mirror.TileEncoder()
+        self._keyframe = True
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self) -> queue.Queue[bytes]:
+        viewer: queue.Queue[bytes] = queue.Queue(maxsize=2)
+        with self._lock:
+            self._viewers.add(viewer)
+            self._keyframe = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return viewer
+
+    def unsubscribe(self, viewer: queue.Queue[bytes]) -> None:
+        with self._lock:
+            self._viewers.discard(viewer)
+
+    def _run(self) -> None:
+        last_seq = None
+        while True:
+            time.sleep(1.0 / self.fps)
+            with self._lock:
+                if not self._viewers:
+                    self._thread = None
+                    return
+                viewers = list(self._viewers)
+                keyframe = self._keyframe
+                self._keyframe = False
+            snapshot = self._reader.read()
+            if snapshot is None:
+                continue
+            seq, width, height, pixels = snapshot
+            if seq == last_seq and not keyframe:
+                continue
+            last_seq = seq
+            if keyframe:
+                self._encoder.reset()
+            message = self._encoder.encode(width, height, pixels)
+            for viewer in viewers:
+                try:
+                    viewer.put_nowait(message)
+                except queue.Full:
+                    while not viewer.empty():
+                        viewer.get_nowait()
+                    with self._lock:
+                        self._keyframe = True
+
+
+_mirror = MirrorBroadcaster()
 
 
 class RemoteHandler(http.server.BaseHTTPRequestHandler):
@@ -70,7 +210,11 @@ class RemoteHandler(http.server.BaseHTTPRequestHandler):
 
     def do_GET(self) -> None:
         parsed = urllib.parse.urlparse(self.path)
-        if parsed.path == "/":
+        if parsed.path == "/ws":
+            self._serve_input_socket()
+        elif parsed.path == "/mirror":
+            self._serve_mirror_socket()
+        elif parsed.path == "/":
             self.send_response(200)
             self.send_header("Content-Type", "text/html")
             self.end_headers()
@@ -80,23 +224,285 @@ class RemoteHandler(http.server.BaseHTTPRequestHandler):
         elif parsed.path == "/input":
             params = urllib.parse.parse_qs(parsed.query)
             button_id = params.get("button_id", [None])[0]
-            if button_id:
+            if button_id in REMOTE_BUTTONS:
                 remote_input_queue.put(button_id)
             self.send_response(303)
             self.send_header("Location", "/")
             self.end_headers()
+        elif parsed.path == "/images.json":
+            with _uploads_lock:
+                pending = sorted(_pending_uploads)
+            self._send_json(
+                {
+                    "images": image_transcode.list_images(),
+                    "pending": pending,
+                }
+            )
+        elif parsed.path == "/stats.json":
+            self._send_json(frame_stats_counters())
+        elif parsed.path == "/trace.json":
+            self._send_trace()
+        elif parsed.path.startswith("/thumb/"):
+            self._send_thumbnail(urllib.parse.unquote(parsed.path[7:]))
         elif parsed.path == "/view_image":
             params = urllib.parse.parse_qs(parsed.query)
             image_name = params.get("image_name", [None])[0]
             if image_name:
-                global remote_image_request
-                remote_image_request = image_name
+                request_image(image_name)
             self.send_response(303)
             self.send_header("Location", "/")
             self.end_headers()
         else:
             self.send_error(404)
 
+    def do_POST(self) -> None:
+        parsed = urllib.parse.urlparse(self.path)
+        if parsed.path == "/upload":
+            self._receive_upload(parsed)
+        else:
+            self.send_error(404)
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_trace(self) -> None:
+        """Fetch the foreground app's Chrome trace over the app bus."""
+        path = os.path.join(
+            tracing.TRACE_DIR, f"remote-{time.monotonic_ns()}.json"
+        )
+        if not app_bus.publish({"type": "trace_dump", "path": path}):
+            self._send_json({"error": "no app is running"}, status=503)
+            return
+        deadline = time.monotonic() + TRACE_WAIT
+        # The app writes the trace to a temporary name, then renames it.
+        while not os.path.exists(path):
+            if time.monotonic() > deadline:
+                self._send_json({"error": "the app did not answer"}, 504)
+                return
+            time.sleep(TRACE_POLL)
+        with open(path, "rb") as trace_file:
+            body = trace_file.read()
+        os.unlink(path)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header(
+            "Content-Disposition", 'attachment; filename="trace.json"'
+        )
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_thumbnail(self, name: str) -> None:
+        """Serve an upload's thumbnail, or the small display copy itself."""
+        target = image_transcode.display_name(name)
+        candidates = (
+            os.path.join(image_transcode.THUMBS_DIR, target),
+            os.path.join(image_transcode.IMG_DIR, target),
+        )
+        for path in candidates:
+            try:
+                with open(path, "rb") as thumb:
+                    body = thumb.read()
+                break
+            except OSError:
+                continue
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "max-age=60")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _iter_body(self):
+        """Yield the request body in chunks without buffering all of it."""
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            while True:
+                line = self.rfile.readline(1024)
+                size = int(line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    # Skip optional trailers up to the final blank line.
+                    while self.rfile.readline(1024) not in (b"\r\n", b""):
+                        pass
+                    return
+                while size:
+                    data = self.rfile.read(min(size, UPLOAD_CHUNK_SIZE))
+                    if not data:
+                        raise ValueError("truncated chunk")
+                    size -= len(data)
+                    yield data
+                self.rfile.readline(1024)
+        else:
+            remaining = int(self.headers.get("Content-Length", "0"))
+            while remaining > 0:
+                data = self.rfile.read(min(remaining, UPLOAD_CHUNK_SIZE))
+                if not data:
+                    raise ValueError("truncated body")
+                remaining -= len(data)
+                yield data
+
+    def _receive_upload(self, parsed) -> None:
+        """Stream an upload to disk and queue it for transcoding."""
+        params = urllib.parse.parse_qs(parsed.query)
+        name = image_transcode.safe_name(params.get("name", [""])[0])
+        if not name.lower().endswith(image_transcode.IMAGE_EXTENSIONS):
+            self.send_error(400, "Unsupported image name")
+            return
+        if "chunked" not in self.headers.get("Transfer-Encoding", "").lower():
+            try:
+                length = int(self.headers.get("Content-Length", ""))
+            except ValueError:
+                length = -1
+            if length < 0:
+                self.close_connection = True
+                self.send_error(400, "Missing or bad Content-Length")
+                return
+            if length > MAX_UPLOAD_BYTES:
+                self.send_error(413, "Image too large")
+                return
+        os.makedirs(image_transcode.INCOMING_DIR, exist_ok=True)
+        incoming = os.path.join(
+            image_transcode.INCOMING_DIR, f"{threading.get_ident()}-{name}"
+        )
+        received = 0
+        try:
+            with open(incoming, "wb") as out:
+                for data in self._iter_body():
+                    tracing.instant("recv", "upload")
+                    received += len(data)
+                    if received > MAX_UPLOAD_BYTES:
+                        raise OverflowError
+                    out.write(data)
+        except OverflowError:
+            os.unlink(incoming)
+            self.close_connection = True
+            self.send_error(413, "Image too large")
+            return
+        except (ValueError, OSError):
+            if os.path.exists(incoming):
+                os.unlink(incoming)
+            self.close_connection = True
+            self.send_error(400, "Incomplete upload")
+            return
+        target = _queue_transcode(incoming, name)
+        self._send_json({"name": target, "bytes": received}, status=202)
+
+    def _upgrade(self) -> Optional[ws_protocol.WebSocket]:
+        """Complete the WebSocket handshake or reply with an error."""
+        if not ws_protocol.is_upgrade_request(self.headers):
+            self.send_error(400, "Expected a WebSocket upgrade")
+            return None
+        key = self.headers["Sec-WebSocket-Key"]
+        # Browsers reject a 101 sent as HTTP/1.0.
+        self.protocol_version = "HTTP/1.1"
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", ws_protocol.accept_key(key))
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        return ws_protocol.WebSocket(self.rfile, self.wfile)
+
+    def _serve_input_socket(self) -> None:
+        """Feed button events from a WebSocket into the input queue.
+
+        Clients send ``{"type": "down"|"up"|"press", "button": ..., "seq":
+        n}``; every event is acknowledged with ``{"ack": n, ...}`` so the
+        page can show round-trip latency.
+        """
+        sock = self._upgrade()
+        if sock is None:
+            return
+        notifications.notify(
+            f"Remote connected: {self.client_address[0]}", "remote"
+        )
+        repeater = KeyRepeater()
+        try:
+            while True:
+                message = sock.receive()
+                if message is None:
+                    break
+                opcode, payload = message
+                tracing.instant("recv", "ws")
+                if opcode != ws_protocol.OP_TEXT:
+                    continue
+                try:
+                    event = json.loads(payload)
+                    kind = event["type"]
+                    button = event["button"]
+                except (ValueError, KeyError, TypeError):
+                    sock.send_text(json.dumps({"error": "bad event"}))
+                    continue
+                if button not in REMOTE_BUTTONS:
+                    sock.send_text(json.dumps({"error": "unknown button"}))
+                    continue
+                if kind == "down":
+                    repeater.press(button)
+                elif kind == "up":
+                    repeater.release(button)
+                elif kind == "press":
+                    remote_input_queue.put(button)
+                sock.send_text(
+                    json.dumps(
+                        {
+                            "ack": event.get("seq"),
+                            "type": kind,
+                            "button": button,
+                        }
+                    )
+                )
+        except ws_protocol.WebSocketClosed:
+            pass
+        finally:
+            repeater.close()
+            sock.close()
+
+    def _serve_mirror_socket(self) -> None:
+        """Push LCD mirror messages to one viewer until it disconnects.
+
+        A reader thread answers the viewer's pings and notices its close
+        frame, then wakes this loop with an empty message.
+        """
+        sock = self._upgrade()
+        if sock is None:
+            return
+        viewer = _mirror.subscribe()
+
+        def read_until_closed() -> None:
+            # Viewers send nothing but control frames; receive() handles
+            # those and returns None once the connection is closed.
+            while sock.receive() is not None:
+                pass
+            try:
+                viewer.put_nowait(b"")
+            except queue.Full:
+                pass  # The sender wakes anyway and sees sock.closed.
+
+        threading.Thread(target=read_until_closed, daemon=True).start()
+        try:
+            while not sock.closed:
+                try:
+                    message = viewer.get(timeout=5)
+                except queue.Empty:
+                    sock.ping()
+                    continue
+                if not message:
+                    break
+                sock.send_binary(message)
+        except ws_protocol.WebSocketClosed:
+            pass
+        finally:
+            _mirror.unsubscribe(viewer)
+            sock.close()
+
     def _build_index_page(self, ip_addr: str) -> str:
         """Return the HTML for the main control page."""
         joystick_buttons = [
@@ -108,26 +514,31 @@ class RemoteHandler(http.server.BaseHTTPRequestHandler):
         ]
         hat_buttons = ["KEY1", "KEY2", "KEY3"]
 
+        # The links keep working without JavaScript; the script below
+        # takes over with a WebSocket once it connects.
         btn = "".join(
             (
                 f'<a href="/input?button_id={html.escape(b)}">'
-                f'<button class="joystick">{html.escape(label)}</button></a>'
+                f'<button class="joystick" data-button="{html.escape(b)}">'
+                f"{html.escape(label)}</button></a>"
             )
             for b, label in joystick_buttons
         )
         hat_btn = "".join(
             (
                 f'<a href="/input?button_id={html.escape(b)}">'
-                f'<button class="key">{html.escape(b)}</button></a>'
+                f'<button class="key" data-button="{html.escape(b)}">'
+                f"{html.escape(b)}</button></a>"
             )
             for b in hat_buttons
         )
         images = "".join(
             (
                 f'<li><a href="/view_image?image_name={html.escape(img)}">'
-                f'{html.escape(img)}</a></li>'
+                f'<img src="/thumb/{html.escape(img)}" alt=""> '
+                f"{html.escape(img)}</a></li>"
             )
-            for img in AVAILABLE_IMAGES
+            for img in image_transcode.list_images()
         )
         style = (
             "<style>"
@@ -136,19 +547,190 @@ class RemoteHandler(http.server.BaseHTTPRequestHandler):
             ".joystick{background:#4CAF50;color:white;}"
             ".key{background:#2196F3;color:white;}"
             "ul{list-style:none;padding:0;}"
+            "li img{width:32px;height:32px;vertical-align:middle;}"
+            "#lcd{width:256px;height:256px;image-rendering:pixelated;"
+            "background:#000;}"
             "</style>"
         )
         html_doc = (
             "<html><head>" + style + "</head><body>"
             "<h1>Pi Remote Control</h1>"
             f"<p>IP Address: {html.escape(ip_addr)}</p>"
+            '<canvas id="lcd" width="128" height="128"></canvas>'
             f"<div>{btn}</div><div>{hat_btn}</div>"
+            '<p id="ws-status">Connecting...</p>'
             "<h2>Images</h2><ul>" + images + "</ul>"
+            '<p><input type="file" id="upload" accept="image/*"> '
+            '<span id="upload-status"></span></p>'
+            "<script>"
+            + _INPUT_SCRIPT
+            + _MIRROR_SCRIPT
+            + _UPLOAD_SCRIPT
+            + "</script>"
             "</body></html>"
         )
         return html_doc
 
 
+# Small client for the /ws input channel: pointer down/up map to held
+# buttons, acknowledgements report the round trip.
+_INPUT_SCRIPT = """
+(function(){
+var st=document.getElementById('ws-status'),ws=null,seq=0,sent={};
+function connect(){
+ ws=new WebSocket((location.protocol=='https:'?'wss://':'ws://')
+  +location.host+'/ws');
+ ws.onopen=function(){st.textContent='Live';};
+ ws.onclose=function(){ws=null;st.textContent='Reconnecting...';
+  setTimeout(connect,1000);};
+ ws.onmessage=function(e){var m=JSON.parse(e.data);
+  if(m.ack in sent){st.textContent='Live - '+m.button+' '+
+   Math.round(performance.now()-sent[m.ack])+' ms';delete sent[m.ack];}};
+}
+function send(type,b){if(!ws||ws.readyState!=1)return false;seq++;
+ sent[seq]=performance.now();
+ ws.send(JSON.stringify({type:type,button:b,seq:seq}));return true;}
+document.querySelectorAll('button[data-button]').forEach(function(el){
+ var b=el.dataset.button,held=false;
+ el.parentNode.addEventListener('click',function(e){
+  if(ws&&ws.readyState==1)e.preventDefault();});
+ el.addEventListener('pointerdown',function(e){
+  if(send('down',b)){held=true;el.setPointerCapture(e.pointerId);}});
+ function up(){if(held){held=false;send('up',b);}}
+ el.addEventListener('pointerup',up);
+ el.addEventListener('pointercancel',up);
+ el.addEventListener('lostpointercapture',up);
+});
+connect();
+})();
+"""
+
+
+# Paints /mirror messages: u16 width, u16 height, u8 tile size, u16 tile
+# count, then per tile u8 column, u8 row and RGB888 pixels.
+_MIRROR_SCRIPT = """
+(function(){
+var cv=document.getElementById('lcd'),cx=cv.getContext('2d');
+function connect(){
+ var ws=new WebSocket((location.protocol=='https:'?'wss://':'ws://')
+  +location.host+'/mirror');
+ ws.binaryType='arraybuffer';
+ ws.onclose=function(){setTimeout(connect,2000);};
+ ws.onmessage=function(e){
+  var b=new Uint8Array(e.data),d=new DataView(e.data),
+   w=d.getUint16(0,true),h=d.getUint16(2,true),t=b[4],
+   n=d.getUint16(5,true),o=7;
+  if(cv.width!=w||cv.height!=h){cv.width=w;cv.height=h;}
+  for(var i=0;i<n;i++){
+   var x=b[o]*t,y=b[o+1]*t,tw=Math.min(t,w-x),th=Math.min(t,h-y),
+    img=cx.createImageData(tw,th),p=img.data;o+=2;
+   for(var k=0;k<p.length;k+=4){p[k]=b[o++];p[k+1]=b[o++];
+    p[k+2]=b[o++];p[k+3]=255;}
+   cx.putImageData(img,x,y);
+  }
+ };
+}
+connect();
+})();
+"""
+
+
+# Sends the chosen file as the raw request body so the browser streams it
+# and the server never has to parse multipart form data.
+_UPLOAD_SCRIPT = """
+(function(){
+var inp=document.getElementById('upload'),
+ st=document.getElementById('upload-status');
+inp.addEventListener('change',function(){
+ var f=inp.files[0];if(!f)return;st.textContent='Uploading...';
+ fetch('/upload?name='+encodeURIComponent(f.name),{method:'POST',body:f})
+  .then(function(r){return r.json().then(function(j){
+   st.textContent=r.ok?'Converting '+j.name+'...':'Upload failed';
+   if(r.ok)setTimeout(function(){location.reload();},3000);});})
+  .catch(function(){st.textContent='Upload failed';});
+});
+})();
+"""
+
+
+def _run_transcode(original: str, target: str) -> None:
+    """Worker thread: convert ``original`` in a process of its own.
+
+    A fresh process inherits none of the server's threads, locks or
+    device handles, and if the kernel kills it for using too much memory
+    only this upload fails.
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            TRANSCODE_SCRIPT,
+            original,
+            os.path.join(image_transcode.IMG_DIR, target),
+            os.path.join(image_transcode.THUMBS_DIR, target),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        timeout=TRANSCODE_TIMEOUT,
+    )
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(
+            lines[-1] if lines else f"exit status {result.returncode}"
+        )
+
+
+def _queue_transcode(incoming: str, name: str) -> str:
+    """Keep the original and queue its conversion.
+
+    Returns the display name, renamed if ``name`` clashes with an image
+    already there or still converting.
+    """
+    global _transcoder
+    os.makedirs(image_transcode.ORIGINALS_DIR, exist_ok=True)
+    os.makedirs(image_transcode.THUMBS_DIR, exist_ok=True)
+    with _uploads_lock:
+        name = image_transcode.unique_name(name, _pending_uploads)
+        target = image_transcode.display_name(name)
+        original = os.path.join(image_transcode.ORIGINALS_DIR, name)
+        shutil.move(incoming, original)
+        if _transcoder is None:
+            # One conversion at a time keeps the peak memory to one photo.
+            _transcoder = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1
+            )
+        _pending_uploads.add(target)
+        try:
+            future = _transcoder.submit(_run_transcode, original, target)
+        except RuntimeError:
+            # The server is stopping; the original stays for a retry.
+            _pending_uploads.discard(target)
+            raise
+
+    def done(fut: concurrent.futures.Future) -> None:
+        with _uploads_lock:
+            _pending_uploads.discard(target)
+        if fut.cancelled():
+            return
+        if fut.exception() is not None:
+            print(f"Could not convert {name}: {fut.exception()}")
+        else:
+            notifications.notify(f"Uploaded {target}", "remote")
+
+    future.add_done_callback(done)
+    return target
+
+
+def request_image(name: str) -> None:
+    """Ask for ``name`` to be shown in the image viewer."""
+    global remote_image_request
+    remote_image_request = name
+    if on_view_image is not None:
+        on_view_image(name)
+    else:
+        app_bus.publish({"type": "view_image", "name": name})
+
+
 def get_pi_ip_address() -> str:
     """Return the Pi's local IP address or 127.0.0.1 if unknown."""
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -162,21 +744,53 @@ def get_pi_ip_address() -> str:
     return ip
 
 
-def start_server(host: str = "0.0.0.0", port: int = 8000) -> None:
-    """Start the remote control HTTP server."""
-    global _server_thread, _server
+def _forward_remote_input() -> None:
+    """Hand queued remote buttons to the foreground app over the bus."""
+    while True:
+        button = remote_input_queue.get()
+        if button is None:
+            return
+        app_bus.publish({"type": "button", "button": button})
+
+
+def frame_stats_counters() -> dict:
+    """Frame counters of the app on the panel, if it records them."""
+    counters = frame_stats.read()
+    if counters is None:
+        return {"enabled": False}
+    try:
+        os.kill(counters["pid"], 0)
+    except ProcessLookupError:
+        return {"enabled": False}
+    except PermissionError:
+        pass
+    return {"enabled": True, **counters}
+
+
+def start_server(
+    host: str = "0.0.0.0",
+    port: int = SERVER_PORT,
+    mirror_fps: float = MIRROR_FPS,
+) -> None:
+    """Start the remote control HTTP server and its input forwarder."""
+    global _server_thread, _server, _forward_thread
     if _server_thread and _server_thread.is_alive():
         return
+    _mirror.fps = mirror_fps
     _server = http.server.ThreadingHTTPServer((host, port), RemoteHandler)
     _server_thread = threading.Thread(
         target=_server.serve_forever, daemon=True
     )
     _server_thread.start()
+    _forward_thread = threading.Thread(
+        target=_forward_remote_input, daemon=True
+    )
+    _forward_thread.start()
 
 
 def stop_server() -> None:
     """Stop the running HTTP server if it is active."""
-    global _server_thread, _server
+    global _server_thread, _server, _forward_thread, _transcoder
     if _server:
         _server.shutdown()
         _server.server_close()
@@ -184,29 +798,62 @@ def stop_server() -> None:
     if _server_thread:
         _server_thread.join(timeout=1)
         _server_thread = None
+    if _forward_thread:
+        remote_input_queue.put(None)
+        _forward_thread.join(timeout=1)
+        _forward_thread = None
+    with _uploads_lock:
+        if _transcoder is not None:
+            _transcoder.shutdown(wait=False, cancel_futures=True)
+            _transcoder = None
 
 
-def draw_remote(running: bool, ip_addr: str) -> None:
+def server_running() -> bool:
+    """Return True if this process is serving the remote UI."""
+    return _server_thread is not None and _server_thread.is_alive()
+
+
+def service_running(port: int = SERVER_PORT) -> bool:
+    """Return True if any process (usually the main menu) is serving."""
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return True
+    except OSError:
+        return False
+
+
+def draw_remote(device, running: bool, hosted: bool, ip_addr: str) -> None:
     """Render the remote server status on the LCD."""
-    with canvas(device) as draw:
-        draw.rectangle(device.bounding_box, outline="black", fill="black")
-        draw.text((10, 30), "Remote Server", fill="white", font=font)
+    with tracing.span("draw"), canvas(device) as draw:
+        draw.rectangle(
+            device.bounding_box,
+            outline=colors.background,
+            fill=colors.background,
+        )
+        draw.text((10, 30), "Remote Server", fill=colors.text, font=font)
         status = "ON" if running else "OFF"
-        color = "green" if running else "red"
+        color = colors.good if running else colors.alert
         draw.text((10, 60), f"Status: {status}", fill=color, font=font)
         if running:
-            draw.text((10, 80), f"{ip_addr}:8000", fill="yellow", font=font)
+            draw.text(
+                (10, 80),
+                f"{ip_addr}:{SERVER_PORT}",
+                fill=colors.highlight,
+                font=font,
+            )
+        if hosted:
+            draw.text((10, 100), "Menu service", fill=colors.dim, font=font)
 
 
-def remote_menu() -> None:
-    """Display a simple interface to toggle the web server."""
-    running = _server_thread is not None and _server_thread.is_alive()
+def remote_menu(device, mux: InputMux) -> None:
+    """Show the server status; KEY1 toggles a standalone server."""
+    hosted = not server_running() and service_running()
+    running = hosted or server_running()
     ip_addr = get_pi_ip_address()
     while True:
-        if (
-            GPIO.input(BUTTON_PINS["KEY1"]) == GPIO.LOW
-            or GPIO.input(BUTTON_PINS["JOY_PRESS"]) == GPIO.LOW
-        ):
+        draw_remote(device, running, hosted, ip_addr)
+        button = mux.get()
+        if button in ("KEY1", "JOY_PRESS") and not hosted:
             if running:
                 stop_server()
                 running = False
@@ -214,19 +861,19 @@ def remote_menu() -> None:
                 start_server()
                 running = True
                 ip_addr = get_pi_ip_address()
-            time.sleep(0.2)
-        elif GPIO.input(BUTTON_PINS["KEY3"]) == GPIO.LOW:
+        elif button == "KEY3":
             break
 
-        draw_remote(running, ip_addr)
-        time.sleep(0.05)
-
 
 if __name__ == "__main__":
+    device = create_device()
+    mux = InputMux(idle=IdleManager(device))
     try:
-        remote_menu()
+        remote_menu(device, mux)
     except KeyboardInterrupt:
         pass
     finally:
+        stop_server()
+        mux.close()
         device.cleanup()
         GPIO.cleanup()
@@ -0,0 +1,88 @@
+"""Pack RGB frames into the ST7735's 16-bit big-endian RGB565 format.
+
+luma sends the panel 18-bit colour by turning every frame into a Python
+list of three ints per pixel, which is most of the time spent in a
+full-frame update and half again as many bytes on the SPI bus as the
+panel needs. :class:`Rgb565Packer` converts a frame into a preallocated
+buffer in a few vectorized passes with NumPy, or with Pillow lookup
+tables when NumPy is not installed.
+
+One copy of each frame remains on the NumPy path: Pillow only hands out
+its pixels as a new ``bytes`` object (``numpy.asarray(image)`` goes
+through ``tobytes()`` as well), and everything after that works in the
+packer's preallocated buffers. The Pillow fallback builds a handful of
+single-band images per frame (split, lookups, sums and the merge); a
+version with fewer of them, using a matrix ``convert``, was slower.
+"""
+
+from typing import Optional
+
+from PIL import Image, ImageChops
+
+try:
+    import numpy
+except ImportError:  # the Pillow fallback needs nothing extra
+    numpy = None
+
+# Lookup tables for Image.point(): the high byte is RRRRRGGG and the
+# low byte GGGBBBBB.
+_RED_HIGH = [r & 0xF8 for r in range(256)]
+_GREEN_HIGH = [g >> 5 for g in range(256)]
+_GREEN_LOW = [(g << 3) & 0xE0 for g in range(256)]
+_BLUE_LOW = [b >> 3 for b in range(256)]
+
+
+def pack_pixel(rgb: tuple[int, int, int]) -> int:
+    """Return one colour as a 16-bit RGB565 value."""
+    red, green, blue = rgb
+    return (red & 0xF8) << 8 | (green & 0xFC) << 3 | blue >> 3
+
+
+class Rgb565Packer:
+    """Convert RGB images of up to ``max_pixels`` pixels to RGB565.
+
+    :meth:`pack` may return a view of an internal buffer that is reused
+    by the next call, so send it before packing the next region.
+    """
+
+    def __init__(self, max_pixels: int, backend: Optional[str] = None):
+        if backend is None:
+            backend = "numpy" if numpy is not None else "pil"
+        self.backend = backend
+        self.buffer = bytearray(max_pixels * 2)
+        self._view = memoryview(self.buffer)
+        if backend == "numpy":
+            self._out = numpy.frombuffer(self.buffer, dtype=">u2")
+            self._acc = numpy.empty(max_pixels, dtype=numpy.uint16)
+            self._tmp = numpy.empty(max_pixels, dtype=numpy.uint16)
+            self.pack = self._pack_numpy
+        else:
+            self.pack = self._pack_pil
+
+    def _pack_numpy(self, image: Image.Image) -> memoryview:
+        count = image.width * image.height
+        # The one copy of the frame; see the module docstring.
+        pixels = numpy.frombuffer(image.tobytes(), numpy.uint8)
+        pixels = pixels.reshape(count, 3)
+        acc = self._acc[:count]
+        tmp = self._tmp[:count]
+        numpy.copyto(acc, pixels[:, 0])
+        acc <<= 8
+        acc &= 0xF800
+        numpy.copyto(tmp, pixels[:, 1])
+        tmp <<= 3
+        tmp &= 0x07E0
+        acc |= tmp
+        numpy.copyto(tmp, pixels[:, 2])
+        tmp >>= 3
+        acc |= tmp
+        # The '>u2' view writes the bytes big-endian, as the panel wants.
+        numpy.copyto(self._out[:count], acc)
+        return self._view[:2 * count]
+
+    def _pack_pil(self, image: Image.Image) -> bytes:
+        red, green, blue = image.split()
+        # The bit fields do not overlap, so adding bands never clips.
+        high = ImageChops.add(red.point(_RED_HIGH), green.point(_GREEN_HIGH))
+        low = ImageChops.add(green.point(_GREEN_LOW), blue.point(_BLUE_LOW))
+        return Image.merge("LA", (high, low)).tobytes()
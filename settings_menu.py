@@ -2,278 +2,309 @@
 """Settings menu for the Waveshare 1.44"""
 
 import time
-import subprocess
+
 import RPi.GPIO as GPIO
-from luma.core.interface.serial import spi
 from luma.core.render import canvas
-from luma.lcd.device import st7735
-from PIL import ImageFont
-
-# --- Display setup ---
-RST_PIN = 27
-DC_PIN = 25
-LCD_WIDTH = 128
-LCD_HEIGHT = 128
-
-serial = spi(
-    port=0,
-    device=0,
-    cs_high=False,
-    gpio_DC=DC_PIN,
-    gpio_RST=RST_PIN,
-    speed_hz=16000000,
+from PIL import Image, ImageDraw, ImageFont
+
+import palette
+import radio_scan
+import spi_tuning
+import tracing
+from display_writer import DisplayWriter
+from hat import (
+    LCD_HEIGHT,
+    LCD_WIDTH,
+    create_device,
+    set_frame_stats,
+    tune_spi,
 )
+from idle_manager import IdleManager
+from input_mux import InputMux
+from list_view import ListView
+from palette import colors
+from settings_store import SettingsStore
+from status_bar import STATUS_HEIGHT, StatusBar
+from widgets import WidgetScreen
 
-device = st7735(
-    serial, width=LCD_WIDTH, height=LCD_HEIGHT, h_offset=2, v_offset=1
-)
+# --- Display setup ---
+device = create_device()
+screen = DisplayWriter(device)
 
 try:
     font = ImageFont.truetype("DejaVuSansMono.ttf", 12)
 except IOError:
     font = ImageFont.load_default()
 
-# --- Button/Joystick setup ---
-GPIO.setmode(GPIO.BCM)
-BUTTON_PINS = {
-    "KEY1": 21,
-    "KEY2": 20,
-    "KEY3": 16,
-    "JOY_UP": 6,
-    "JOY_DOWN": 19,
-    "JOY_LEFT": 5,
-    "JOY_RIGHT": 26,
-    "JOY_PRESS": 13,
-}
-
-for pin in BUTTON_PINS.values():
-    GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+# A faster SPI clock is dropped unless confirmed within this many seconds.
+SPI_CONFIRM_TIMEOUT = 10.0
 
-brightness = 128  # start mid-level
+# --- Button/Joystick setup ---
+mux = InputMux(idle=IdleManager(device))
+
+# Brightness changes show on screen at once; the backlight and the
+# settings file only see the value the joystick settles on.
+settings = SettingsStore(
+    appliers={
+        "brightness": device.contrast,
+        "frame_stats": lambda enabled: set_frame_stats(device, enabled),
+        "tracing": tracing.enable,
+        "theme": palette.use,
+    }
+)
 
 
 def brightness_menu():
-    global brightness
     while True:
-        if GPIO.input(BUTTON_PINS["JOY_LEFT"]) == GPIO.LOW:
-            brightness = max(0, brightness - 5)
-            device.contrast(brightness)
-            time.sleep(0.1)
-        elif GPIO.input(BUTTON_PINS["JOY_RIGHT"]) == GPIO.LOW:
-            brightness = min(255, brightness + 5)
-            device.contrast(brightness)
-            time.sleep(0.1)
-        elif (
-            GPIO.input(BUTTON_PINS["KEY1"]) == GPIO.LOW
-            or GPIO.input(BUTTON_PINS["JOY_PRESS"]) == GPIO.LOW
-            or GPIO.input(BUTTON_PINS["KEY3"]) == GPIO.LOW
-        ):
-            wait_for_release("KEY1", "JOY_PRESS", "KEY3")
+        brightness = settings.get("brightness")
+        with canvas(screen) as draw:
+            draw.rectangle(
+                screen.bounding_box,
+                outline=colors.background,
+                fill=colors.background,
+            )
+            draw.text((20, 50), "Brightness", fill=colors.text, font=font)
+            draw.text(
+                (20, 70), f"{brightness}", fill=colors.highlight, font=font
+            )
+
+        button = mux.get()
+        if button == "JOY_LEFT":
+            settings.set("brightness", max(0, brightness - 5))
+        elif button == "JOY_RIGHT":
+            settings.set("brightness", min(255, brightness + 5))
+        elif button in ("KEY1", "JOY_PRESS", "KEY3"):
             return "BACK"
 
-        with canvas(device) as draw:
-            draw.rectangle(device.bounding_box, outline="black", fill="black")
-            draw.text((20, 50), "Brightness", fill="white", font=font)
-            draw.text((20, 70), f"{brightness}", fill="yellow", font=font)
-        time.sleep(0.05)
 
+def toggle_frame_stats():
+    settings.set("frame_stats", not settings.get("frame_stats"))
+
+
+def frame_stats_label():
+    return "Frame stats: " + ("on" if settings.get("frame_stats") else "off")
+
+
+def toggle_tracing():
+    settings.set("tracing", not settings.get("tracing"))
+
+
+def tracing_label():
+    return "Tracing: " + ("on" if settings.get("tracing") else "off")
+
+
+def next_theme():
+    """Switch to the next theme; menus opened from now on use it."""
+    themes = list(palette.THEMES)
+    theme = settings.get("theme")
+    index = themes.index(theme) if theme in themes else -1
+    settings.set("theme", themes[(index + 1) % len(themes)])
+
+
+def theme_label():
+    return "Theme: " + settings.get("theme").replace("_", " ")
+
+
+def spi_label():
+    return f"SPI: {device.spi_speed_hz // 1000000} MHz"
+
+
+def spi_pattern_ok(speed):
+    """Show the test pattern at ``speed`` and ask whether it looks clean.
+
+    Anything but KEY1 or the joystick, or no answer within
+    :data:`SPI_CONFIRM_TIMEOUT`, counts as no, so a panel too garbled to
+    read goes back to the old clock by itself.
+    """
+    image = spi_tuning.test_pattern(device)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 86, LCD_WIDTH, LCD_HEIGHT), fill=colors.background)
+    draw.text((4, 88), f"{speed // 1000000} MHz clean?", fill=colors.text,
+              font=font)
+    draw.text((4, 104), "KEY1 yes, KEY3 no", fill=colors.highlight,
+              font=font)
+    device.spi_speed_hz = speed
+    spi_tuning.show_pattern(device, image)
+    deadline = time.monotonic() + SPI_CONFIRM_TIMEOUT
+    while time.monotonic() < deadline:
+        # None also comes back after bus messages; keep waiting.
+        button = mux.get(timeout=deadline - time.monotonic())
+        if button is not None:
+            return button in ("KEY1", "JOY_PRESS")
+    return False
+
+
+def choose_spi_speed(speed):
+    """Switch to ``speed``; clocks above the safe one need confirming."""
+    screen.flush()
+    previous = device.spi_speed_hz
+    if speed > spi_tuning.SAFE_SPI_SPEED_HZ and not spi_pattern_ok(speed):
+        device.spi_speed_hz = previous
+        device.force_full_refresh()
+        return
+    # Also retimes the transfer size at the new clock.
+    tune_spi(device, (speed,))
 
-def wait_for_release(*buttons):
-    """Block until the specified buttons are released."""
-    if not buttons:
-        buttons = ("KEY1", "JOY_PRESS")
-    while any(GPIO.input(BUTTON_PINS[b]) == GPIO.LOW for b in buttons):
-        time.sleep(0.05)
+
+def spi_speed_item(speed):
+    def label():
+        mark = "*" if device.spi_speed_hz == speed else " "
+        return f"{mark} {speed // 1000000} MHz"
+
+    return (label, lambda: choose_spi_speed(speed))
+
+
+def spi_menu():
+    menu_loop(
+        [spi_speed_item(speed) for speed in spi_tuning.SPI_SPEEDS_HZ]
+        + [("Back", lambda: "BACK")]
+    )
+
+
+def new_frame():
+    return Image.new("RGB", (LCD_WIDTH, LCD_HEIGHT), colors.background)
+
+
+def menu_label(item):
+    """Menu items are ``(name, action)``; ``name`` may be a callable."""
+    name = item[0]
+    return name() if callable(name) else name
 
 
 def menu_loop(menu_items):
-    index = 0
+    view = ListView(
+        (0, 40, LCD_WIDTH, LCD_HEIGHT), 20, font, label=menu_label
+    )
+    view.items = menu_items
+    frame = new_frame()
+    status = WidgetScreen(
+        screen, [StatusBar((0, 0, LCD_WIDTH, STATUS_HEIGHT))], frame=frame
+    )
     while True:
-        if GPIO.input(BUTTON_PINS["JOY_UP"]) == GPIO.LOW:
-            index = (index - 1) % len(menu_items)
-            time.sleep(0.2)
-        elif GPIO.input(BUTTON_PINS["JOY_DOWN"]) == GPIO.LOW:
-            index = (index + 1) % len(menu_items)
-            time.sleep(0.2)
-        elif (
-            GPIO.input(BUTTON_PINS["KEY1"]) == GPIO.LOW
-            or GPIO.input(BUTTON_PINS["JOY_PRESS"]) == GPIO.LOW
-        ):
-            wait_for_release("KEY1", "JOY_PRESS")
-            action = menu_items[index][1]
+        with tracing.span("draw"):
+            changed = view.draw(frame)
+            changed = status.draw() or changed
+        if changed:
+            screen.display(frame.copy())
+
+        timeouts = [view.next_frame_in(), status.timeout()]
+        button = mux.get(
+            timeout=min((t for t in timeouts if t is not None), default=None)
+        )
+        if button == "JOY_UP":
+            view.move(-1)
+        elif button == "JOY_DOWN":
+            view.move(1)
+        elif button in ("KEY1", "JOY_PRESS"):
+            action = view.selected[1]
             if callable(action):
                 result = action()
                 if result == "BACK":
                     return
-            time.sleep(0.2)
-        elif GPIO.input(BUTTON_PINS["KEY3"]) == GPIO.LOW:
+                view.invalidate()
+                status.invalidate()
+        elif button == "KEY3":
             return
 
-        with canvas(device) as draw:
-            draw.rectangle(device.bounding_box, outline="black", fill="black")
-            for i, (name, _) in enumerate(menu_items):
-                y = 40 + i * 20
-                if i == index:
-                    draw.text((15, y), f"> {name}", fill="yellow", font=font)
-                else:
-                    draw.text((15, y), name, fill="white", font=font)
-        time.sleep(0.05)
-
 
 def display_menu():
     menu_loop(
         [
             ("Brightness", brightness_menu),
+            (frame_stats_label, toggle_frame_stats),
+            (spi_label, spi_menu),
+            (tracing_label, toggle_tracing),
+            (theme_label, next_theme),
             ("Back", lambda: "BACK"),
         ]
     )
 
 
-def wifi_menu():
-    index = 0
-    networks = []
-
-    def scan():
-        nonlocal networks, index
-        try:
-            out = subprocess.check_output(
-                [
-                    "nmcli",
-                    "-t",
-                    "-f",
-                    "SSID",
-                    "device",
-                    "wifi",
-                    "list",
-                ]
-            )
-            networks = sorted(
-                {n.strip() for n in out.decode().splitlines() if n.strip()}
-            )
-        except Exception:
-            networks = []
-        index = 0
+# Spinner frames shown while a radio worker is scanning or connecting.
+SPINNER = "|/-\\"
+SPINNER_INTERVAL = 0.15
+
 
-    def connect(ssid: str):
-        subprocess.call(["nmcli", "device", "wifi", "connect", ssid])
-        time.sleep(1)
+def radio_menu(title, worker, label, detail, empty_text):
+    """List scan results as they stream in; KEY2 rescans, KEY1 connects.
 
-    scan()
+    Scans and connects run on ``worker``'s thread so the screen keeps
+    responding while the radio is busy.
+    """
+    view = ListView(
+        (0, 20, LCD_WIDTH, 100), 20, font, label=label, detail=detail
+    )
+    frame = new_frame()
+    draw = ImageDraw.Draw(frame)
+    spin = 0
+    shown = None
+    worker.scan()
     while True:
-        if networks and GPIO.input(BUTTON_PINS["JOY_UP"]) == GPIO.LOW:
-            index = (index - 1) % len(networks)
-            time.sleep(0.2)
-        elif networks and GPIO.input(BUTTON_PINS["JOY_DOWN"]) == GPIO.LOW:
-            index = (index + 1) % len(networks)
-            time.sleep(0.2)
-        elif GPIO.input(BUTTON_PINS["KEY2"]) == GPIO.LOW:
-            scan()
-            time.sleep(0.2)
-        elif (
-            GPIO.input(BUTTON_PINS["KEY1"]) == GPIO.LOW
-            or GPIO.input(BUTTON_PINS["JOY_PRESS"]) == GPIO.LOW
-        ):
-            wait_for_release("KEY1", "JOY_PRESS")
-            if networks:
-                connect(networks[index])
-            return "BACK"
-        elif GPIO.input(BUTTON_PINS["KEY3"]) == GPIO.LOW:
-            wait_for_release("KEY3")
+        # Read the version first: a change after this redraws again.
+        version = worker.version
+        busy = worker.busy
+        view.items = worker.items
+        view.empty_text = "Scanning..." if busy else empty_text
+        heading = title
+        if busy:
+            heading += " " + SPINNER[spin % len(SPINNER)]
+        footer = worker.status or "KEY2:Rescan"
+        dirty = view.draw(frame)
+        if (heading, footer) != shown:
+            shown = heading, footer
+            draw.rectangle((0, 0, LCD_WIDTH - 1, 19), fill=colors.background)
+            draw.text((15, 0), heading, fill=colors.text, font=font)
+            draw.rectangle((0, 100, LCD_WIDTH - 1, LCD_HEIGHT - 1),
+                           fill=colors.background)
+            draw.text((0, 110), footer[:18], fill=colors.dim, font=font)
+            dirty = True
+        if dirty:
+            screen.display(frame.copy())
+
+        timeout = view.next_frame_in()
+        if busy and (timeout is None or timeout > SPINNER_INTERVAL):
+            timeout = SPINNER_INTERVAL
+        if worker.version != version:
+            timeout = 0
+        button = mux.get(timeout=timeout)
+        spin += 1
+        if button == "JOY_UP":
+            view.move(-1)
+        elif button == "JOY_DOWN":
+            view.move(1)
+        elif button == "KEY2":
+            worker.scan(force=True)
+        elif button in ("KEY1", "JOY_PRESS"):
+            item = view.selected
+            if item is not None and not worker.busy:
+                worker.connect(item.key, label(item))
+        elif button == "KEY3":
             return "BACK"
 
-        with canvas(device) as draw:
-            draw.rectangle(device.bounding_box, outline="black", fill="black")
-            draw.text((15, 0), "WiFi", fill="white", font=font)
-            if not networks:
-                draw.text((15, 60), "No networks", fill="yellow", font=font)
-            else:
-                max_visible = 4
-                start = max(
-                    0,
-                    min(index - max_visible // 2, len(networks) - max_visible),
-                )
-                for offset, ssid in enumerate(
-                    networks[start:start + max_visible]
-                ):
-                    y = 20 + offset * 20
-                    if start + offset == index:
-                        draw.text(
-                            (15, y), f"> {ssid}", fill="yellow", font=font
-                        )
-                    else:
-                        draw.text((15, y), ssid, fill="white", font=font)
-            draw.text((0, 110), "KEY2:Rescan", fill="gray", font=font)
-        time.sleep(0.05)
 
+def network_detail(network):
+    """Signal strength, and a ``*`` if the network is secured."""
+    return f"{network.signal:>3}{'*' if network.secured else ' '}"
 
-def bluetooth_menu():
-    index = 0
-    devices = []
-
-    def scan():
-        nonlocal devices, index
-        try:
-            out = subprocess.check_output(["bluetoothctl", "devices"])
-            devs = []
-            for line in out.decode().splitlines():
-                parts = line.split(" ", 2)
-                if len(parts) >= 3:
-                    devs.append((parts[1], parts[2]))
-            devices = devs
-        except Exception:
-            devices = []
-        index = 0
-
-    def connect(mac: str):
-        subprocess.call(["bluetoothctl", "connect", mac])
-        time.sleep(1)
-
-    scan()
-    while True:
-        if devices and GPIO.input(BUTTON_PINS["JOY_UP"]) == GPIO.LOW:
-            index = (index - 1) % len(devices)
-            time.sleep(0.2)
-        elif devices and GPIO.input(BUTTON_PINS["JOY_DOWN"]) == GPIO.LOW:
-            index = (index + 1) % len(devices)
-            time.sleep(0.2)
-        elif GPIO.input(BUTTON_PINS["KEY2"]) == GPIO.LOW:
-            scan()
-            time.sleep(0.2)
-        elif (
-            GPIO.input(BUTTON_PINS["KEY1"]) == GPIO.LOW
-            or GPIO.input(BUTTON_PINS["JOY_PRESS"]) == GPIO.LOW
-        ):
-            wait_for_release("KEY1", "JOY_PRESS")
-            if devices:
-                connect(devices[index][0])
-            return "BACK"
-        elif GPIO.input(BUTTON_PINS["KEY3"]) == GPIO.LOW:
-            wait_for_release("KEY3")
-            return "BACK"
 
-        with canvas(device) as draw:
-            draw.rectangle(device.bounding_box, outline="black", fill="black")
-            draw.text((15, 0), "Bluetooth", fill="white", font=font)
-            if not devices:
-                draw.text((15, 60), "No devices", fill="yellow", font=font)
-            else:
-                max_visible = 4
-                start = max(
-                    0,
-                    min(index - max_visible // 2, len(devices) - max_visible),
-                )
-                for offset, (_mac, name) in enumerate(
-                    devices[start:start + max_visible]
-                ):
-                    y = 20 + offset * 20
-                    if start + offset == index:
-                        draw.text(
-                            (15, y), f"> {name}", fill="yellow", font=font
-                        )
-                    else:
-                        draw.text((15, y), name, fill="white", font=font)
-            draw.text((0, 110), "KEY2:Rescan", fill="gray", font=font)
-        time.sleep(0.05)
+def wifi_menu():
+    return radio_menu(
+        "WiFi",
+        radio_scan.wifi_worker(),
+        lambda network: network.ssid,
+        network_detail,
+        "No networks",
+    )
+
+
+def bluetooth_menu():
+    return radio_menu(
+        "Bluetooth",
+        radio_scan.bluetooth_worker(),
+        lambda bt_device: bt_device.name,
+        None,
+        "No devices",
+    )
 
 
 def connections_menu():
@@ -298,5 +329,8 @@ try:
 except KeyboardInterrupt:
     pass
 finally:
+    settings.flush()
+    mux.close()
+    screen.close()
     device.cleanup()
     GPIO.cleanup()
@@ -0,0 +1,150 @@
+"""Persistent device settings shared by every app.
+
+Settings live in one small JSON file that every app reads once, in a
+single read, when it opens the display. Writes are atomic (temporary file
+plus rename) so a power cut never leaves a half-written file, and rapid
+changes such as a held joystick are coalesced so only the final value
+reaches the panel and the SD card.
+"""
+
+import json
+import os
+import tempfile
+import threading
+from typing import Callable, Optional
+
+SETTINGS_PATH = os.path.join(
+    os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"),
+    "nanodeck",
+    "settings.json",
+)
+
+DEFAULTS = {
+    "brightness": 128,
+    "frame_stats": False,
+    "tracing": False,
+    # A theme from palette.THEMES.
+    "theme": "dark",
+    # Probed on first use by hat.create_device().
+    "spi_speed_hz": None,
+    "spi_transfer_size": None,
+}
+
+# Quiet periods before a changed value is applied to the hardware and
+# written to disk. The panel delay is just longer than the joystick
+# repeat interval so a held adjustment is applied once when it stops.
+APPLY_DELAY = 0.25
+SAVE_DELAY = 1.0
+
+
+def load(path: str = SETTINGS_PATH) -> dict:
+    """Return the saved settings merged over :data:`DEFAULTS`."""
+    values = dict(DEFAULTS)
+    try:
+        with open(path, "rb") as settings_file:
+            saved = json.loads(settings_file.read())
+    except (OSError, ValueError):
+        return values
+    if isinstance(saved, dict):
+        values.update(saved)
+    return values
+
+
+def save(values: dict, path: str = SETTINGS_PATH) -> None:
+    """Write ``values`` atomically."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".settings-")
+    try:
+        with os.fdopen(fd, "w") as tmp:
+            json.dump(values, tmp, indent=1, sort_keys=True)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def update(path: str = SETTINGS_PATH, **values) -> None:
+    """Change some settings in the file, keeping the others."""
+    settings = load(path)
+    settings.update(values)
+    save(settings, path)
+
+
+def _restart(timer: Optional[threading.Timer], delay: float, callback):
+    if timer is not None:
+        timer.cancel()
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+class SettingsStore:
+    """Settings with coalesced writes to the hardware and to disk.
+
+    ``appliers`` maps a setting name to a callable that pushes the value
+    to the hardware, e.g. ``{"brightness": device.contrast}``.
+    """
+
+    def __init__(
+        self,
+        path: str = SETTINGS_PATH,
+        appliers: Optional[dict[str, Callable]] = None,
+    ) -> None:
+        self.path = path
+        self.values = load(path)
+        self._appliers = appliers or {}
+        self._lock = threading.Lock()
+        self._pending: dict = {}
+        self._changed: set = set()
+        self._apply_timer: Optional[threading.Timer] = None
+        self._save_timer: Optional[threading.Timer] = None
+
+    def get(self, key: str):
+        return self.values.get(key, DEFAULTS.get(key))
+
+    def set(self, key: str, value) -> None:
+        """Change a setting; hardware and disk follow once it settles."""
+        with self._lock:
+            if self.values.get(key) == value and key not in self._pending:
+                return
+            self.values[key] = value
+            self._pending[key] = value
+            self._changed.add(key)
+            self._apply_timer = _restart(
+                self._apply_timer, APPLY_DELAY, self._apply_pending
+            )
+            self._save_timer = _restart(
+                self._save_timer, SAVE_DELAY, self._save_if_dirty
+            )
+
+    def _apply_pending(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for key, value in pending.items():
+            applier = self._appliers.get(key)
+            if applier is not None:
+                applier(value)
+
+    def _save_if_dirty(self) -> None:
+        with self._lock:
+            if not self._changed:
+                return
+            changed = {key: self.values[key] for key in self._changed}
+            self._changed = set()
+        # Other apps may have saved settings since this store loaded.
+        update(self.path, **changed)
+
+    def flush(self) -> None:
+        """Apply and save anything still pending, e.g. before exiting."""
+        for timer in (self._apply_timer, self._save_timer):
+            if timer is not None:
+                timer.cancel()
+        self._apply_pending()
+        self._save_if_dirty()
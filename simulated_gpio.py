@@ -0,0 +1,112 @@
+"""``RPi.GPIO`` without a Raspberry Pi.
+
+:func:`install` registers a :class:`SimulatedGPIO` as the ``RPi.GPIO``
+module, so the HAT driver, the input mux and the apps import it instead
+of the real one. It has to run before anything imports :mod:`hat`, and
+this module imports nothing from the HAT so that it can.
+"""
+
+import sys
+import threading
+import types
+from typing import Callable, Optional
+
+
+class SimulatedPWM:
+    """Stand-in for ``RPi.GPIO.PWM`` that remembers the duty cycle."""
+
+    def __init__(self, pin: int, frequency: float) -> None:
+        self.duty_cycle = 0.0
+
+    def start(self, duty_cycle: float) -> None:
+        self.duty_cycle = duty_cycle
+
+    def ChangeDutyCycle(self, duty_cycle: float) -> None:
+        self.duty_cycle = duty_cycle
+
+    def stop(self) -> None:
+        self.duty_cycle = 0.0
+
+
+class SimulatedGPIO:
+    """The parts of ``RPi.GPIO`` that luma, the HAT and the apps use.
+
+    Inputs read HIGH (released) until :meth:`press` pulls them low, which
+    also fires the pin's edge callback as a real falling edge would.
+    Callbacks run one at a time, as on RPi.GPIO's single callback thread.
+    """
+
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_UP = 22
+    FALLING = 32
+
+    def __init__(self) -> None:
+        self.levels: dict[int, int] = {}
+        self._callbacks: dict[int, Callable[[int], None]] = {}
+        self._callback_lock = threading.Lock()
+
+    def setmode(self, mode: int) -> None:
+        pass
+
+    def setwarnings(self, enabled: bool) -> None:
+        pass
+
+    def setup(self, pin: int, direction: int, **kwargs) -> None:
+        pass
+
+    def output(self, pin: int, value: int) -> None:
+        pass
+
+    def input(self, pin: int) -> int:
+        return self.levels.get(pin, self.HIGH)
+
+    def add_event_detect(
+        self, pin: int, edge: int, callback=None, bouncetime: int = 0
+    ) -> None:
+        if callback is not None:
+            self._callbacks[pin] = callback
+
+    def remove_event_detect(self, pin: int) -> None:
+        self._callbacks.pop(pin, None)
+
+    def press(self, pin: int) -> None:
+        """Pull ``pin`` low, as a pressed button does."""
+        self.levels[pin] = self.LOW
+        callback = self._callbacks.get(pin)
+        if callback is not None:
+            with self._callback_lock:
+                callback(pin)
+
+    def release(self, pin: int) -> None:
+        self.levels[pin] = self.HIGH
+
+    def cleanup(self, *pins) -> None:
+        pass
+
+    def PWM(self, pin: int, frequency: float) -> SimulatedPWM:
+        return SimulatedPWM(pin, frequency)
+
+
+gpio: Optional[SimulatedGPIO] = None
+
+
+def install() -> SimulatedGPIO:
+    """Make ``import RPi.GPIO`` return the simulated GPIO; idempotent."""
+    global gpio
+    if gpio is None:
+        hat = sys.modules.get("hat")
+        if hat is not None:
+            raise RuntimeError(
+                "simulated GPIO installed after hat imported "
+                f"{hat.GPIO.__name__}"
+            )
+        gpio = SimulatedGPIO()
+        package = types.ModuleType("RPi")
+        package.GPIO = gpio
+        sys.modules["RPi"] = package
+        sys.modules["RPi.GPIO"] = gpio
+    return gpio
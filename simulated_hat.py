@@ -0,0 +1,72 @@
+"""A HAT display with no hardware behind it.
+
+:func:`create_simulated_device` builds the real :class:`hat.HatST7735`
+driver on top of a simulated SPI bus and GPIO, so the whole display path
+(frame diff, RGB565 packing, chunked transfers) runs as it does on the
+Pi while the bus only counts what would have been sent. The HAT module
+is imported only once :func:`simulated_gpio.install` has replaced
+``RPi.GPIO``, so this runs on machines without one.
+"""
+
+import simulated_gpio
+
+
+class SimulatedSpiDev:
+    """Stand-in for ``spidev.SpiDev`` that counts the bytes written."""
+
+    def __init__(self) -> None:
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.cshigh = False
+        self.transfers = 0
+        self.bytes_written = 0
+
+    def open(self, bus: int, device: int) -> None:
+        pass
+
+    def writebytes(self, data: list) -> None:
+        # spidev copies the list into a C buffer one int at a time.
+        self.transfers += 1
+        self.bytes_written += len(bytes(data))
+
+    def writebytes2(self, data) -> None:
+        self.transfers += 1
+        self.bytes_written += memoryview(data).nbytes
+
+    def close(self) -> None:
+        pass
+
+
+def create_simulated_device(device_class=None, **kwargs):
+    """Return ``device_class`` driving a :class:`SimulatedSpiDev`.
+
+    ``device_class`` defaults to :class:`hat.HatST7735`. The bus is
+    available as ``device.simulated_spi``.
+    """
+    gpio = simulated_gpio.install()
+    from hat import BACKLIGHT_PWM_HZ, BL_PIN, DC_PIN, LCD_HEIGHT, LCD_WIDTH
+    from hat import RST_PIN, HatSPI, HatST7735, spidev_bufsiz
+
+    if device_class is None:
+        device_class = HatST7735
+    spi_dev = SimulatedSpiDev()
+    serial = HatSPI(
+        spi=spi_dev,
+        gpio=gpio,
+        gpio_DC=DC_PIN,
+        gpio_RST=RST_PIN,
+        transfer_size=spidev_bufsiz(),
+    )
+    device = device_class(
+        serial,
+        width=LCD_WIDTH,
+        height=LCD_HEIGHT,
+        h_offset=2,
+        v_offset=1,
+        gpio=gpio,
+        gpio_LIGHT=BL_PIN,
+        pwm_frequency=BACKLIGHT_PWM_HZ,
+        **kwargs,
+    )
+    device.simulated_spi = spi_dev
+    return device
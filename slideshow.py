@@ -0,0 +1,238 @@
+"""Timed slideshow with crossfade, wipe and slide transitions.
+
+While a picture is on screen (the dwell), a worker thread loads the next
+one and renders every frame of the transition to it from the two cached
+128x128 frames with NumPy array arithmetic (or Pillow's C blend and
+paste when NumPy is missing). Each transition frame is stored with the
+packed window that turns the previous frame into it, so playing a
+transition only sends prepared bytes at a steady rate and the CPU work
+is spread over the dwell instead of landing on the transition.
+"""
+
+import concurrent.futures
+import os
+import time
+from typing import Callable, Optional
+
+from PIL import Image, ImageChops
+
+import tracing
+from rgb565 import Rgb565Packer, numpy
+
+DWELL = 8.0
+TRANSITIONS = ("crossfade", "wipe", "slide")
+TRANSITION_FPS = 25
+TRANSITION_FRAMES = 15
+
+# How often a finished dwell checks whether the next picture is ready.
+PREPARE_POLL = 0.05
+
+
+def _ease(step: int, steps: int) -> float:
+    """Smoothstep from 0 to 1 over ``steps`` frames."""
+    t = step / steps
+    return t * t * (3 - 2 * t)
+
+
+def _blend_numpy(kind: str, a: Image.Image, b: Image.Image, steps: int):
+    src = numpy.asarray(a, dtype=numpy.uint16)
+    dst = numpy.asarray(b, dtype=numpy.uint16)
+    width = src.shape[1]
+    acc = numpy.empty_like(src)
+    tmp = numpy.empty_like(src)
+    out = numpy.empty(src.shape, dtype=numpy.uint8)
+    for step in range(1, steps + 1):
+        t = _ease(step, steps)
+        if kind == "crossfade":
+            # (a * (256 - w) + b * w) >> 8 fits in 16 bits.
+            weight = round(t * 256)
+            numpy.multiply(src, 256 - weight, out=acc)
+            numpy.multiply(dst, weight, out=tmp)
+            acc += tmp
+            acc >>= 8
+            numpy.copyto(out, acc, casting="unsafe")
+        elif kind == "wipe":
+            edge = round(t * width)
+            out[:, :edge] = dst[:, :edge]
+            out[:, edge:] = src[:, edge:]
+        else:  # slide: the new picture pushes the old one out left
+            shift = round(t * width)
+            out[:, :width - shift] = src[:, shift:]
+            out[:, width - shift:] = dst[:, :shift]
+        yield Image.fromarray(out, "RGB")
+
+
+def _blend_pil(kind: str, a: Image.Image, b: Image.Image, steps: int):
+    width, height = a.size
+    for step in range(1, steps + 1):
+        t = _ease(step, steps)
+        if kind == "crossfade":
+            yield Image.blend(a, b, t)
+            continue
+        frame = a.copy()
+        if kind == "wipe":
+            edge = round(t * width)
+            frame.paste(b.crop((0, 0, edge, height)), (0, 0))
+        else:
+            shift = round(t * width)
+            frame.paste(a.crop((shift, 0, width, height)), (0, 0))
+            frame.paste(b.crop((0, 0, shift, height)), (width - shift, 0))
+        yield frame
+
+
+def transition_frames(
+    kind: str, a: Image.Image, b: Image.Image, steps: int = TRANSITION_FRAMES
+):
+    """Yield the frames of transition ``kind`` from ``a`` to ``b``."""
+    if numpy is not None:
+        return _blend_numpy(kind, a, b, steps)
+    return _blend_pil(kind, a, b, steps)
+
+
+class Slideshow:
+    """Show ``paths`` one after another on ``device``, starting at ``start``.
+
+    ``load(path)`` returns a screen-sized RGB frame. The app calls
+    :meth:`update` whenever :meth:`timeout` runs out.
+    """
+
+    def __init__(
+        self,
+        device,
+        paths: list[str],
+        start: int,
+        load: Callable[[str], Image.Image],
+        dwell: float = DWELL,
+        transitions: tuple[str, ...] = TRANSITIONS,
+    ) -> None:
+        self.device = device
+        self.paths = paths
+        self.index = start
+        self.load = load
+        self.dwell = dwell
+        self.transitions = transitions
+        self._count = 0
+        self._packer = Rgb565Packer(device.width * device.height)
+        self._worker = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._frame = load(paths[start])
+        self.device.display(self._frame)
+        self._prepared: Optional[concurrent.futures.Future] = None
+        # The picture being prepared, and how many failed in a row.
+        self._preparing = start
+        self._failures = 0
+        # Frames of the running transition and when it started.
+        self._playing: Optional[list] = None
+        self._played = 0
+        self._started = 0.0
+        self._next_at = time.monotonic() + dwell
+        self._prepare()
+
+    def _prepare(self, index: Optional[int] = None) -> None:
+        """Start preparing picture ``index``, by default the next one."""
+        if len(self.paths) < 2:
+            return
+        kind = self.transitions[self._count % len(self.transitions)]
+        self._count += 1
+        if index is None:
+            index = (self.index + 1) % len(self.paths)
+        self._preparing = index
+        self._prepared = self._worker.submit(
+            self._render, kind, index, self._frame
+        )
+
+    def _render(self, kind: str, index: int, current: Image.Image):
+        """Worker: load picture ``index`` and pack the transition to it."""
+        with tracing.span("decode", os.path.basename(self.paths[index])):
+            target = self.load(self.paths[index])
+        with tracing.span("transition", kind):
+            frames = self._pack_transition(kind, current, target)
+        return index, target, frames
+
+    def _pack_transition(self, kind: str, current, target) -> list:
+        frames = []
+        previous = current
+        for frame in transition_frames(kind, current, target):
+            box = ImageChops.difference(previous, frame).getbbox()
+            windows = []
+            if box is not None:
+                data = bytes(self._packer.pack(frame.crop(box)))
+                windows.append((box, data))
+            frames.append((frame, windows))
+            previous = frame
+        return frames
+
+    def timeout(self) -> Optional[float]:
+        now = time.monotonic()
+        if self._playing is not None:
+            due = self._started + self._played / TRANSITION_FPS
+            return max(0.0, due - now)
+        if self._prepared is None:
+            return None
+        if now >= self._next_at:
+            return PREPARE_POLL
+        return self._next_at - now
+
+    def update(self) -> None:
+        now = time.monotonic()
+        if self._playing is None:
+            if (
+                self._prepared is None
+                or now < self._next_at
+                or not self._prepared.done()
+            ):
+                return
+            try:
+                index, target, frames = self._prepared.result()
+            except Exception as exc:
+                # Any picture that fails to load or decode is skipped.
+                self._prepared = None
+                self._skip(now, exc)
+                return
+            self._prepared = None
+            self._failures = 0
+            self.index = index
+            self._frame = target
+            self._playing = frames
+            self._played = 0
+            self._started = now
+        due = min(
+            int((now - self._started) * TRANSITION_FPS),
+            len(self._playing) - 1,
+        )
+        if due < self._played:
+            return
+        frame, windows = self._playing[due]
+        tracing.instant("frame", str(due))
+        if due == self._played and hasattr(self.device, "display_windows"):
+            self.device.display_windows(frame, windows)
+        else:
+            # Behind schedule: skip to the due frame and let the driver
+            # work out what changed.
+            self.device.display(frame)
+        self._played = due + 1
+        if self._played == len(self._playing):
+            self._playing = None
+            self._next_at = now + self.dwell
+            self._prepare()
+
+    def _skip(self, now: float, exc: Exception) -> None:
+        failed = self._preparing
+        name = os.path.basename(self.paths[failed])
+        print(f"Slideshow: skipping {name}: {exc}")
+        self._failures += 1
+        if self._failures >= len(self.paths) - 1:
+            # No other picture loads; try them again after a dwell.
+            self._failures = 0
+            self._next_at = now + self.dwell
+            self._prepare()
+        else:
+            self._prepare((failed + 1) % len(self.paths))
+
+    def stop(self) -> None:
+        if self._prepared is not None:
+            self._prepared.cancel()
+        self._worker.shutdown(wait=False)
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.paths[self.index])
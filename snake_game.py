@@ -4,30 +4,24 @@ import time
 import random
 from datetime import datetime
 import RPi.GPIO as GPIO
-from luma.core.interface.serial import spi
-from luma.core.render import canvas
-from luma.lcd.device import st7735
 from PIL import ImageFont, ImageDraw, Image
 
-# --- Display Configuration ---
-RST_PIN = 27  # GPIO pin connected to the RST (Reset) line
-DC_PIN = 25  # GPIO pin connected to the DC (Data/Command) line
-
-LCD_WIDTH = 128
-LCD_HEIGHT = 128
-
-serial = spi(
-    port=0,
-    device=0,
-    cs_high=False,
-    gpio_DC=DC_PIN,
-    gpio_RST=RST_PIN,
-    speed_hz=16000000,
-)
+import tracing
+from compositor import OVERLAY, Compositor
+from display_writer import DisplayWriter
+from hat import LCD_HEIGHT, LCD_WIDTH, create_device
+from idle_manager import IdleManager
+from input_mux import InputMux
+from palette import colors
+from tile_engine import Sprite, Tileset, TileScene
 
-device = st7735(
-    serial, width=LCD_WIDTH, height=LCD_HEIGHT, h_offset=2, v_offset=1
-)
+# --- Display Configuration ---
+device = create_device()
+# Frames go out on a writer thread so game ticks never wait for SPI.
+writer = DisplayWriter(device)
+# The board is the app layer; the "Game Over" screen is a popup above it.
+screen = Compositor(writer)
+popup = screen.add_layer("game_over", OVERLAY)
 
 # Load fonts for game text
 try:
@@ -39,33 +33,20 @@ except IOError:
     font_score = ImageFont.load_default()
     font_gameover = ImageFont.load_default()
 
-# --- GPIO Configuration for Buttons and Joystick ---
-GPIO.setmode(GPIO.BCM)  # Use BCM numbering
-
-BUTTON_PINS = {
-    "KEY1": 21,  # KEY1 GPIO
-    "KEY2": 20,  # KEY2 GPIO
-    "KEY3": 16,  # KEY3 GPIO
-    "JOY_UP": 6,  # Upward direction of the Joystick
-    "JOY_DOWN": 19,  # Downward direction of the Joystick
-    "JOY_LEFT": 5,  # Left direction of the Joystick
-    "JOY_RIGHT": 26,  # Right direction of the Joystick
-    "JOY_PRESS": 13,  # Press the Joystick
-}
-
-# Set up each button pin as an input with a pull-up resistor
-for pin_name, pin_num in BUTTON_PINS.items():
-    GPIO.setup(
-        pin_num, GPIO.IN, pull_up_down=GPIO.PUD_UP
-    )  # Buttons typically pull low when pressed
+# --- Buttons and Joystick ---
+# Every press is an event, so no key repeat is needed for steering.
+# A running game counts as activity so the panel never dims mid-game.
+idle = IdleManager(device)
+mux = InputMux(repeat=(), idle=idle)
 
 # --- Game Constants ---
 SNAKE_BLOCK_SIZE = 4  # Size of each snake segment and food item in pixels
 GAME_AREA_WIDTH = LCD_WIDTH // SNAKE_BLOCK_SIZE
 GAME_AREA_HEIGHT = LCD_HEIGHT // SNAKE_BLOCK_SIZE
-SNAKE_COLOR = "lime"
-FOOD_COLOR = "red"
-BG_COLOR = "black"
+SNAKE_COLOR = colors.accent
+HEAD_COLOR = colors.text
+FOOD_COLOR = colors.alert
+BG_COLOR = colors.background
 INITIAL_SPEED = 0.25  # Seconds per frame (higher value = slower game)
 SPEED_INCREMENT = 0.01  # How much speed increases per food eaten
 SCORE_INCREMENT = 10
@@ -77,66 +58,28 @@ direction = "RIGHT"  # Current direction of the snake
 score = 0
 game_over = False
 game_speed = INITIAL_SPEED  # Current delay between snake moves
-last_direction_change_time = (
-    0  # To prevent immediate 180-degree turns and fast changes
-)
+# Direction of the last move; turning back onto it is not allowed even if
+# several presses arrive between two moves.
+moved_direction = direction
 
-# --- Callback for Restarting Game ---
-# This function is triggered by KEY1 or JOY_PRESS when the game is over
-last_event_time = {
-    name: 0 for name in BUTTON_PINS.items()
-}  # To debounce restart
 
-
-def restart_game_callback(channel):
+# --- Restarting Game ---
+# Triggered by KEY1 or JOY_PRESS when the game is over
+def restart_game():
     global game_over, snake, food, direction, score, game_speed
-    global last_direction_change_time
-    pin_name = next(
-        (name for name, num in BUTTON_PINS.items() if num == channel),
-        f"Pin {channel}",
-    )
+    global moved_direction
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Restarting game!")
+    # Reset all game state variables to initial values
+    snake = [
+        (GAME_AREA_WIDTH // 2, GAME_AREA_HEIGHT // 2)
+    ]  # Start in middle of screen
+    direction = "RIGHT"
+    moved_direction = direction
+    score = 0
+    game_speed = INITIAL_SPEED
+    food = generate_food_position(snake)  # Generate new food
+    game_over = False
 
-    current_time = time.time()
-    # Simple debounce for restart buttons
-    if (
-        current_time - last_event_time[pin_name] < 0.3
-    ):  # Minimum 300ms between restarts
-        return
-
-    if (
-        GPIO.input(channel) == GPIO.LOW
-    ):  # Only react on button press (falling edge)
-        if game_over:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Restarting game!")
-            # Reset all game state variables to initial values
-            snake = [
-                (GAME_AREA_WIDTH // 2, GAME_AREA_HEIGHT // 2)
-            ]  # Start in middle of screen
-            direction = "RIGHT"
-            score = 0
-            game_speed = INITIAL_SPEED
-            food = generate_food_position(snake)  # Generate new food
-            game_over = False
-            last_direction_change_time = 0  # Reset this too
-
-    last_event_time[pin_name] = (
-        current_time  # Update last event time for debounce
-    )
-
-
-# Assign restart callback to KEY1 and JOY_PRESS
-GPIO.add_event_detect(
-    BUTTON_PINS["KEY1"],
-    GPIO.FALLING,
-    callback=restart_game_callback,
-    bouncetime=200,
-)
-GPIO.add_event_detect(
-    BUTTON_PINS["JOY_PRESS"],
-    GPIO.FALLING,
-    callback=restart_game_callback,
-    bouncetime=200,
-)
 
 # --- Game Logic Helper Functions ---
 
@@ -154,108 +97,85 @@ def generate_food_position(snake_body):
             return (fx, fy)
 
 
-# Draws all game elements onto the display canvas
-def draw_game_elements(
-    draw_obj, snake_body, food_pos, current_score, game_status
-):
-    # Draw food item
-    draw_obj.rectangle(
-        (
-            food_pos[0] * SNAKE_BLOCK_SIZE,
-            food_pos[1] * SNAKE_BLOCK_SIZE,
-            (food_pos[0] + 1) * SNAKE_BLOCK_SIZE - 1,
-            (food_pos[1] + 1) * SNAKE_BLOCK_SIZE - 1,
-        ),
-        fill=FOOD_COLOR,
-    )
+# --- Drawing ---
+# The board is a grid of pre-rendered tiles; each tick only the cells that
+# changed (new head, old head, old tail, food) are sent to the panel.
+tileset = Tileset(SNAKE_BLOCK_SIZE)
+tileset.add("empty", BG_COLOR)
+tileset.add("body", SNAKE_COLOR)
+tileset.add("head", HEAD_COLOR)
+tileset.add("food", FOOD_COLOR)
+scene = TileScene(screen, tileset, "empty")
 
-    # Draw snake segments
-    for i, segment in enumerate(snake_body):
-        color = (
-            SNAKE_COLOR if i > 0 else "white"
-        )  # Head is white, body is SNAKE_COLOR
-        draw_obj.rectangle(
-            (
-                segment[0] * SNAKE_BLOCK_SIZE,
-                segment[1] * SNAKE_BLOCK_SIZE,
-                (segment[0] + 1) * SNAKE_BLOCK_SIZE - 1,
-                (segment[1] + 1) * SNAKE_BLOCK_SIZE - 1,
-            ),
-            fill=color,
-        )
+# Cells currently showing something other than "empty".
+shown_cells = {}
 
-    # Draw current score on screen
-    draw_obj.text(
-        (3, 3), f"Score: {current_score}", fill="white", font=font_score
-    )
+score_sprite = scene.add_sprite(Sprite(Image.new("RGBA", (1, 1)), 3, 3, 1))
+shown_score = None
+game_over_shown = False
 
-    # If game is over, draw the "Game Over!" screen
-    if game_status:
-        # Create a semi-transparent black overlay for the "Game Over" message
-        overlay = Image.new("RGBA", device.size, (0, 0, 0, 128))
-        overlay_draw = ImageDraw.Draw(overlay)
-
-        text_go = "GAME OVER!"
-        text_score = f"Final Score: {current_score}"
-        restart_msg = "Press KEY1/JOY_PRESS to restart"
-
-        # --- CORRECTED LINES FOR TEXT DIMENSIONS ---
-        # Get width using font.getlength()
-        text_go_width = font_gameover.getlength(text_go)
-        text_score_width = font_game.getlength(text_score)
-        restart_msg_width = font_score.getlength(restart_msg)
-
-        # Height is bottom minus top using font.getbbox()
-        text_go_height = (
-            font_gameover.getbbox(text_go)[3]
-            - font_gameover.getbbox(text_go)[1]
-        )
-        text_score_height = (
-            font_game.getbbox(text_score)[3]
-            - font_gameover.getbbox(text_go)[1]
-        )  # Re-using top/bottom for simplicity
-        restart_msg_height = (
-            font_score.getbbox(restart_msg)[3]
-            - font_score.getbbox(restart_msg)[1]
-        )
-        # --- END CORRECTED LINES ---
 
-        # Center Game Over text using calculated dimensions
-        overlay_draw.text(
-            (
-                (LCD_WIDTH - text_go_width) // 2,
-                (LCD_HEIGHT - text_go_height) // 2 - 10,
-            ),
-            text_go,
-            fill="red",
-            font=font_gameover,
-        )
-        overlay_draw.text(
-            (
-                (LCD_WIDTH - text_score_width) // 2,
-                (LCD_HEIGHT - text_score_height) // 2 + 10,
-            ),
-            text_score,
-            fill="yellow",
-            font=font_game,
-        )
-        overlay_draw.text(
+def text_image(text, font, fill):
+    """Return ``text`` on a transparent background."""
+    left, top, right, bottom = font.getbbox(text)
+    image = Image.new("RGBA", (right, bottom))
+    ImageDraw.Draw(image).text((0, 0), text, fill=fill, font=font)
+    return image
+
+
+def game_over_image(current_score):
+    """The "Game Over" screen: a dimmed board with the final score."""
+    overlay = Image.new("RGBA", (LCD_WIDTH, LCD_HEIGHT), (0, 0, 0, 128))
+    lines = (
+        ("GAME OVER!", font_gameover, colors.alert, -10),
+        (f"Final Score: {current_score}", font_game, colors.highlight, 10),
+        ("Press KEY1/JOY_PRESS to restart", font_score, colors.text, 30),
+    )
+    for text, font, fill, offset in lines:
+        image = text_image(text, font, fill)
+        overlay.alpha_composite(
+            image,
             (
-                (LCD_WIDTH - restart_msg_width) // 2,
-                (LCD_HEIGHT - restart_msg_height) // 2 + 30,
+                max(0, (LCD_WIDTH - image.width) // 2),
+                (LCD_HEIGHT - image.height) // 2 + offset,
             ),
-            restart_msg,
-            fill="white",
-            font=font_score,
         )
+    return overlay
+
+
+# Updates the scene to show the current game state
+def draw_game_elements(snake_body, food_pos, current_score, game_status):
+    global shown_cells, shown_score, game_over_shown
+    cells = {segment: "body" for segment in snake_body[1:]}
+    if snake_body:
+        cells[snake_body[0]] = "head"
+    cells.setdefault(food_pos, "food")
+    for cell in shown_cells.keys() - cells.keys():
+        scene.set_tile(cell[0], cell[1], "empty")
+    for (x, y), name in cells.items():
+        scene.set_tile(x, y, name)
+    shown_cells = cells
 
-        # Composite the overlay onto the main display
-        device.display(
-            Image.alpha_composite(
-                Image.new("RGBA", device.size, (0, 0, 0, 0)), overlay
-            )
+    # Draw current score on screen
+    if current_score != shown_score:
+        shown_score = current_score
+        scene.set_sprite_image(
+            score_sprite,
+            text_image(f"Score: {current_score}", font_score, colors.text),
         )
 
+    # If game is over, dim the board and show the "Game Over" screen
+    if game_status and not game_over_shown:
+        popup.paste(game_over_image(current_score))
+        game_over_shown = True
+    elif not game_status and game_over_shown:
+        popup.clear()
+        game_over_shown = False
+
+    # Sends the changed cells, plus whatever the popup changed.
+    if not scene.render():
+        screen.render()
+
 
 print(
     "Welcome to Snake on Waveshare HAT! Use joystick to play."
@@ -271,44 +191,38 @@ try:
     last_move_time = time.time()  # Tracks when the snake last moved
 
     while True:
-        if GPIO.input(BUTTON_PINS["KEY3"]) == GPIO.LOW:
+        # Sleep until a button event or the next snake move, whichever
+        # comes first; a finished game just waits for input.
+        timeout = None
+        if not game_over:
+            timeout = max(0.0, last_move_time + game_speed - time.time())
+            idle.poke()
+        button = mux.get(timeout=timeout)
+        if button == "KEY3":
             break
+        if game_over and button in ("KEY1", "JOY_PRESS"):
+            restart_game()
+            last_move_time = time.time()
+        tick_start = time.perf_counter_ns()
         # Only process game logic if the game is not over
         if not game_over:
             current_time = time.time()
 
             # --- Handle Joystick Input (change snake direction) ---
-            # Small delay prevents super fast direction changes
-            if current_time - last_direction_change_time > 0.1:
-                if (
-                    GPIO.input(BUTTON_PINS["JOY_UP"]) == GPIO.LOW
-                    and direction != "DOWN"
-                ):
-                    direction = "UP"
-                    last_direction_change_time = current_time
-                elif (
-                    GPIO.input(BUTTON_PINS["JOY_DOWN"]) == GPIO.LOW
-                    and direction != "UP"
-                ):
-                    direction = "DOWN"
-                    last_direction_change_time = current_time
-                elif (
-                    GPIO.input(BUTTON_PINS["JOY_LEFT"]) == GPIO.LOW
-                    and direction != "RIGHT"
-                ):
-                    direction = "LEFT"
-                    last_direction_change_time = current_time
-                elif (
-                    GPIO.input(BUTTON_PINS["JOY_RIGHT"]) == GPIO.LOW
-                    and direction != "LEFT"
-                ):
-                    direction = "RIGHT"
-                    last_direction_change_time = current_time
+            if button == "JOY_UP" and moved_direction != "DOWN":
+                direction = "UP"
+            elif button == "JOY_DOWN" and moved_direction != "UP":
+                direction = "DOWN"
+            elif button == "JOY_LEFT" and moved_direction != "RIGHT":
+                direction = "LEFT"
+            elif button == "JOY_RIGHT" and moved_direction != "LEFT":
+                direction = "RIGHT"
 
             # --- Game Tick (Move Snake) ---
             # Move the snake only if enough time has passed based on game_speed
-            if current_time - last_move_time > game_speed:
+            if current_time - last_move_time >= game_speed:
                 last_move_time = current_time
+                moved_direction = direction
 
                 # Determine the new head position
                 head_x, head_y = snake[0]
@@ -355,19 +269,11 @@ try:
                         # Remove the tail segment if the snake didn't eat
                         snake.pop()
 
+        tracing.complete("tick", tick_start)
+
         # --- Drawing ---
-        with canvas(device) as draw:
-            draw.rectangle(
-                device.bounding_box, outline=BG_COLOR, fill=BG_COLOR
-            )  # Clear screen with background color
-            draw_game_elements(
-                draw, snake, food, score, game_over
-            )  # Draw all game components
-
-        # Small sleep to ensure consistent frame rate and prevent CPU hogging
-        time.sleep(
-            0.01
-        )  # This determines the display update rate, separate from game_speed
+        with tracing.span("draw"):
+            draw_game_elements(snake, food, score, game_over)
 
 except KeyboardInterrupt:
     print("\nExiting Snake game.")
@@ -375,6 +281,8 @@ except Exception as e:
     print(f"\nAn unexpected error occurred: {e}")
 finally:
     print("Cleaning up display and GPIO resources...")
+    mux.close()
+    writer.close()
     device.cleanup()  # Cleans up luma.lcd display resources
     GPIO.cleanup()  # Cleans up RPi.GPIO pins
     print("Cleanup complete.")
@@ -0,0 +1,108 @@
+"""Find the fastest SPI clock and transfer size the panel keeps up with.
+
+The ST7735 is only specified to about 15 MHz but usually runs much
+faster; the Pi can only divide its core clock by even numbers, so some
+requested rates are no faster than lower ones. :func:`probe` writes a
+full-screen test pattern at the given clocks and keeps the fastest rate
+that writes without errors and is measurably faster than the previous
+one, then times the transfer sizes spidev allows at that rate.
+
+The HAT does not wire the panel's data-out line, so pixels cannot be
+read back, and a panel that garbles the picture still takes every
+write. Only a person looking at the test pattern can tell, so probing
+on its own never goes above :data:`SAFE_SPI_SPEED_HZ`; faster clocks
+are chosen under Settings -> Display -> SPI, which shows the pattern at
+the new clock and keeps it only once confirmed. Above the safe clock the
+display driver still refreshes the whole panel periodically and falls
+back to a slower clock on any transfer error.
+"""
+
+import time
+
+# Clocks to try, slowest first; all are rates luma accepts.
+SPI_SPEEDS_HZ = (16000000, 20000000, 24000000, 32000000, 40000000)
+SAFE_SPI_SPEED_HZ = SPI_SPEEDS_HZ[0]
+
+PROBE_REPEATS = 3
+
+# A faster clock has to beat the best so far by this factor to be used.
+MIN_GAIN = 1.05
+
+
+def slower_speed(speed_hz: int):
+    """Return the next slower probe rate, or None at the bottom."""
+    slower = [speed for speed in SPI_SPEEDS_HZ if speed < speed_hz]
+    return slower[-1] if slower else None
+
+
+def test_pattern(device):
+    """Return a full-screen RGB image with gradients in every band."""
+    from PIL import Image, ImageChops
+
+    ramp = Image.linear_gradient("L").resize(device.size)
+    return Image.merge(
+        "RGB", (ramp, ramp.rotate(90), ImageChops.invert(ramp))
+    )
+
+
+def _time_frame(device, data) -> float:
+    start = time.perf_counter()
+    device.write_window(device.bounding_box, data)
+    return time.perf_counter() - start
+
+
+def _best_time(device, data) -> float:
+    return min(_time_frame(device, data) for _ in range(PROBE_REPEATS))
+
+
+def show_pattern(device, image=None) -> None:
+    """Write ``image`` (the test pattern by default) straight to the panel.
+
+    The next frame is sent in full, replacing it.
+    """
+    if image is None:
+        image = test_pattern(device)
+    device.write_window(device.bounding_box, bytes(device.pack(image)))
+    device.force_full_refresh()
+
+
+def probe(
+    device, bufsiz: int, speeds: tuple[int, ...] = (SAFE_SPI_SPEED_HZ,)
+) -> tuple[int, int]:
+    """Tune ``device`` and return the chosen ``(speed_hz, transfer_size)``.
+
+    Only ``speeds`` are tried, slowest first; pass clocks above the safe
+    one only once the test pattern has been seen to be clean at them.
+    The panel shows the test pattern while probing and is cleared
+    afterwards.
+    """
+    data = bytes(device.pack(test_pattern(device)))
+    best_speed = speeds[0]
+    best_time = None
+    for speed in speeds:
+        device.spi_speed_hz = speed
+        try:
+            elapsed = _best_time(device, data)
+        except OSError:
+            break
+        if best_time is None or elapsed * MIN_GAIN < best_time:
+            best_speed, best_time = speed, elapsed
+    device.spi_speed_hz = best_speed
+
+    best_size = bufsiz
+    best_time = None
+    size = bufsiz
+    while size >= 1024:
+        device.transfer_size = size
+        try:
+            elapsed = _best_time(device, data)
+        except OSError:
+            elapsed = None
+        if elapsed is not None and (best_time is None or elapsed < best_time):
+            best_size, best_time = size, elapsed
+        size //= 2
+    device.transfer_size = best_size
+
+    device.force_full_refresh()
+    device.clear()
+    return best_speed, best_size
@@ -0,0 +1,105 @@
+"""A status strip with CPU, temperature, memory, WiFi and the time.
+
+:class:`StatusBar` is a :class:`widgets.Widget`, so it redraws only its
+own strip and only when a value changes as shown (whole percent or
+degree, or a new minute). Values come from the shared
+:class:`system_metrics.MetricsSampler`, so drawing never calls into psutil
+or ``/sys``.
+
+The main menu, the settings screens and the IRC client show the bar
+across the top. The apps that need every row of the panel do not:
+
+* the image viewer, because pictures are fitted to the full 128x128
+  panel, and a bar would hide the top of every one;
+* Snake, because the board covers the whole panel and the snake moves
+  through the top rows;
+* ``test_144_lcd.py`` and ``test_screen_buttons_joystick.py``, because
+  they check the panel and the buttons with a fixed full-screen layout.
+"""
+
+import math
+import time
+from typing import Hashable, Optional
+
+from PIL import ImageDraw, ImageFont
+
+from palette import ColorSpec, colors, resolve
+from system_metrics import MetricsSampler, shared_sampler
+from widgets import Box, Widget
+
+STATUS_HEIGHT = 10
+
+# Values drawn in the warning colour.
+HOT_CPU = 80
+HOT_TEMPERATURE = 70
+HOT_MEMORY = 90
+
+# Left edges of the fields, for an 8 px monospace font.
+FIELD_X = (0, 28, 48, 73)
+
+
+def _font():
+    try:
+        return ImageFont.truetype("DejaVuSansMono.ttf", 8)
+    except IOError:
+        return ImageFont.load_default()
+
+
+def _rounded(value: Optional[float]) -> Optional[int]:
+    return None if value is None else round(value)
+
+
+class StatusBar(Widget):
+    """System status across ``box``, normally the top of the screen."""
+
+    def __init__(
+        self,
+        box: Box,
+        sampler: Optional[MetricsSampler] = None,
+        font=None,
+        color: Optional[ColorSpec] = None,
+        hot_color: Optional[ColorSpec] = None,
+        background: Optional[ColorSpec] = None,
+    ) -> None:
+        super().__init__(box, background or colors.panel)
+        self.sampler = sampler or shared_sampler()
+        self.font = font or _font()
+        self.color = resolve(color or colors.status)
+        self.hot_color = resolve(hot_color or colors.warning)
+        self._state: tuple = ()
+
+    def state(self, now: float) -> Hashable:
+        metrics = self.sampler.latest
+        self._state = (
+            _rounded(metrics.cpu),
+            _rounded(metrics.temperature),
+            _rounded(metrics.memory),
+            metrics.wifi,
+            time.strftime("%H:%M", time.localtime(now)),
+        )
+        return self._state
+
+    def next_change(self, now: float) -> Optional[float]:
+        next_minute = (math.floor(now / 60) + 1) * 60
+        return min(next_minute, self.sampler.next_sample())
+
+    def draw(self, draw: ImageDraw.ImageDraw, now: float) -> None:
+        cpu, temperature, memory, wifi, clock = self._state
+        fields = (
+            ("C", cpu, "%", HOT_CPU),
+            ("", temperature, "C", HOT_TEMPERATURE),
+            ("M", memory, "%", HOT_MEMORY),
+            ("W", wifi, "%", None),
+        )
+        for x, (prefix, value, unit, hot) in zip(FIELD_X, fields):
+            if value is None:
+                text, color = f"{prefix}--", self.color
+            else:
+                text = f"{prefix}{min(value, 99)}{unit}"
+                hot = hot is not None and value >= hot
+                color = self.hot_color if hot else self.color
+            draw.text((x, 0), text, fill=color, font=self.font)
+        width = draw.textlength(clock, font=self.font)
+        draw.text(
+            (self.size[0] - width, 0), clock, fill=self.color, font=self.font
+        )
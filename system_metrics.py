@@ -0,0 +1,127 @@
+"""System metrics sampled on one background thread and cached.
+
+Reading psutil, ``/sys`` and ``/proc`` from a render path costs system
+calls on every frame. :class:`MetricsSampler` samples CPU load, CPU
+temperature, memory use and WiFi link quality every
+:data:`SAMPLE_INTERVAL` seconds on a daemon thread, and renders read the
+cached :class:`Metrics` without touching the system. The thread only
+samples while someone is reading, so a sleeping screen costs nothing.
+"""
+
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import psutil
+
+SAMPLE_INTERVAL = 2.0
+
+# How soon to look again when a sample is due but has not arrived.
+RETRY_INTERVAL = 0.1
+
+# Stop sampling when nobody has read the metrics for this many intervals.
+IDLE_INTERVALS = 3
+
+WIRELESS_PATH = "/proc/net/wireless"
+# Link quality in /proc/net/wireless is out of 70 on the Pi's WiFi.
+LINK_QUALITY_MAX = 70
+
+# Preferred psutil temperature sensors, Pi first.
+TEMPERATURE_SENSORS = ("cpu_thermal", "coretemp", "k10temp", "soc_thermal")
+
+
+class Metrics(NamedTuple):
+    """One sample; a field is None when the system does not report it."""
+
+    cpu: Optional[float] = None
+    temperature: Optional[float] = None
+    memory: Optional[float] = None
+    wifi: Optional[int] = None
+    sampled_at: float = 0.0
+
+
+def read_temperature() -> Optional[float]:
+    """Return the CPU temperature in degrees Celsius."""
+    sensors = getattr(psutil, "sensors_temperatures", None)
+    if sensors is None:
+        return None
+    readings = sensors()
+    for name in TEMPERATURE_SENSORS + tuple(readings):
+        if readings.get(name):
+            return readings[name][0].current
+    return None
+
+
+def read_wifi(path: str = WIRELESS_PATH) -> Optional[int]:
+    """Return the link quality of the first wireless interface in %."""
+    try:
+        with open(path) as f:
+            lines = f.readlines()[2:]
+    except OSError:
+        return None
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 3:
+            try:
+                quality = float(fields[2].rstrip("."))
+            except ValueError:
+                continue
+            return min(100, round(quality * 100 / LINK_QUALITY_MAX))
+    return None
+
+
+def sample() -> Metrics:
+    return Metrics(
+        cpu=psutil.cpu_percent(interval=None),
+        temperature=read_temperature(),
+        memory=psutil.virtual_memory().percent,
+        wifi=read_wifi(),
+        sampled_at=time.time(),
+    )
+
+
+class MetricsSampler:
+    """Sample :class:`Metrics` every ``interval`` seconds while in use."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self._latest = Metrics()
+        self._read_at = 0.0
+        self._wanted = threading.Event()
+        # The first cpu_percent() call only starts the measurement.
+        psutil.cpu_percent(interval=None)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    @property
+    def latest(self) -> Metrics:
+        """The newest sample; wakes the sampler if it was idle."""
+        self._read_at = time.monotonic()
+        self._wanted.set()
+        return self._latest
+
+    def next_sample(self) -> float:
+        """Wall-clock time to look for the next sample."""
+        due = self._latest.sampled_at + self.interval
+        return max(due, time.time() + RETRY_INTERVAL)
+
+    def _run(self) -> None:
+        while True:
+            self._wanted.wait()
+            self._latest = sample()
+            idle = time.monotonic() - self._read_at
+            if idle > self.interval * IDLE_INTERVALS:
+                self._wanted.clear()
+            time.sleep(self.interval)
+
+
+_shared: Optional[MetricsSampler] = None
+_shared_lock = threading.Lock()
+
+
+def shared_sampler(interval: float = SAMPLE_INTERVAL) -> MetricsSampler:
+    """Return the process's sampler, starting it on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = MetricsSampler(interval)
+        return _shared
@@ -1,48 +1,20 @@
 #!/usr/bin/env python3
 
-import time
-from datetime import datetime
 import RPi.GPIO as GPIO
-from luma.core.interface.serial import spi
-from luma.core.render import canvas
-from luma.lcd.device import st7735
 from PIL import ImageFont
 
-# --- Configuration for your Waveshare 1.44inch LCD HAT ---
-# !!! CORRECTED GPIO PIN NUMBERS BASED ON WAVESHARE WIKI !!!
-RST_PIN = 27  # GPIO pin connected to the RST (Reset) line
-DC_PIN = 25  # GPIO pin connected to the DC (Data/Command) line
-# CS_PIN (GPIO 8 / CE0) is handled automatically by luma.lcd's SPI
-# interface (device=0)
-
-# Display dimensions
-LCD_WIDTH = 128  # Resolution of the LCD
-LCD_HEIGHT = 128  # Resolution of the LCD
-
-# SPI Configuration
-# port=0, device=0 means SPI0 CE0. This is standard and matches CS=P8/CE0.
-# cs_high=False: Chip Select is active LOW (standard for most SPI devices).
-# speed_hz: Max SPI speed (ST7735 can often handle 16MHz or higher).
-serial = spi(
-    port=0,
-    device=0,
-    cs_high=False,
-    gpio_DC=DC_PIN,
-    gpio_RST=RST_PIN,
-    speed_hz=16000000,
-)
+from hat import LCD_WIDTH, create_device
+from idle_manager import IdleManager
+from input_mux import InputMux
+from palette import colors
+from widgets import Clock, Slider, Text, WidgetScreen
 
-# Initialize the ST7735S display device
-# h_offset and v_offset are common for ST7735S on 128x128 displays
-# and might need minor tuning if your display area is slightly off-center.
-device = st7735(
-    serial, width=LCD_WIDTH, height=LCD_HEIGHT, h_offset=2, v_offset=1
-)
+# --- Configuration for your Waveshare 1.44inch LCD HAT ---
+# Pins, SPI settings and offsets live in hat.py.
+device = create_device()
 
 # --- Button setup ---
-GPIO.setmode(GPIO.BCM)
-KEY3_PIN = 16
-GPIO.setup(KEY3_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+mux = InputMux(buttons=("KEY3",), idle=IdleManager(device))
 
 # Load a default font (or specify a path to a .ttf font file if you have one)
 try:
@@ -53,38 +25,32 @@ except IOError:
 
 print("Screen test started. Press Ctrl+C to exit.")
 
+# Each widget redraws only when its text changes or, for the rectangle,
+# when it has moved a whole pixel; the rest of the frame stays put.
+screen = WidgetScreen(
+    device,
+    [
+        Text((5, 5, LCD_WIDTH, 25), "Waveshare LCD HAT", font),
+        Clock(
+            (5, 25, LCD_WIDTH, 45), font, "Time: %H:%M:%S", color=colors.info
+        ),
+        Clock(
+            (5, 45, LCD_WIDTH, 65), font, "Date: %Y-%m-%d",
+            color=colors.accent,
+        ),
+        Text((5, 65, LCD_WIDTH, 85), "Working!", font, color=colors.highlight),
+        # A simple animated rectangle moving 20 pixels per second
+        Slider((5, 90, LCD_WIDTH - 5, 106), (16, 16), 20),
+    ],
+)
+
 try:
     while True:
-        if GPIO.input(KEY3_PIN) == GPIO.LOW:
+        screen.update()
+        # Sleep until the next widget changes; KEY3, on the HAT or
+        # remotely, ends the test.
+        if mux.get(timeout=screen.timeout()) == "KEY3":
             break
-        # Create a new drawing canvas
-        with canvas(device) as draw:
-            # Clear the screen (fill with black)
-            draw.rectangle(device.bounding_box, outline="black", fill="black")
-
-            # Get current time and date
-            now = datetime.now()
-            current_time = now.strftime("%H:%M:%S")
-            current_date = now.strftime("%Y-%m-%d")
-
-            # Draw text strings on the display
-            draw.text((5, 5), "Waveshare LCD HAT", fill="white", font=font)
-            draw.text((5, 25), f"Time: {current_time}", fill="cyan", font=font)
-            draw.text((5, 45), f"Date: {current_date}", fill="lime", font=font)
-            draw.text((5, 65), "Working!", fill="yellow", font=font)
-
-            # Draw a simple animated rectangle
-            # Horizontal position shifts based on the current time (seconds),
-            # creating movement
-            rect_x = int(5 + (time.time() * 20) % (LCD_WIDTH - 20))
-            draw.rectangle(
-                (rect_x, 90, rect_x + 15, 105), outline="red", fill="blue"
-            )
-
-        # Pause for a short period before updating the display again
-        time.sleep(
-            0.1
-        )  # Updates the display approximately 10 times per second
 
 except KeyboardInterrupt:
     # Handles a graceful exit when Ctrl+C is pressed in the terminal
@@ -95,6 +61,7 @@ except Exception as e:
 finally:
     # Ensure cleanup runs whether the script exits normally or due to an error
     print("Cleaning up display...")
+    mux.close()
     device.cleanup()  # Cleans up the luma.lcd device resources
     GPIO.cleanup()
     print("Cleanup complete.")
@@ -1,34 +1,17 @@
 #!/usr/bin/env python3
 
-import time
 from datetime import datetime
 import RPi.GPIO as GPIO  # This is for the buttons and joystick
-from luma.core.interface.serial import spi
-from luma.core.render import canvas
-from luma.lcd.device import st7735
 from PIL import ImageFont
 
-# --- Display Configuration (from previous script, corrected pins) ---
-# !!! IMPORTANT: VERIFY THESE GPIO PIN NUMBERS AGAINST YOUR HAT'S
-# DOCUMENTATION !!!
-RST_PIN = 27  # GPIO pin connected to the RST (Reset) line
-DC_PIN = 25  # GPIO pin connected to the DC (Data/Command) line
-
-LCD_WIDTH = 128
-LCD_HEIGHT = 128
-
-serial = spi(
-    port=0,
-    device=0,
-    cs_high=False,
-    gpio_DC=DC_PIN,
-    gpio_RST=RST_PIN,
-    speed_hz=16000000,
-)
+from hat import BUTTON_PINS, LCD_WIDTH, create_device
+from idle_manager import IdleManager
+from input_mux import InputMux
+from palette import colors
+from widgets import Clock, Slider, Widget, WidgetScreen
 
-device = st7735(
-    serial, width=LCD_WIDTH, height=LCD_HEIGHT, h_offset=2, v_offset=1
-)
+# --- Display Configuration (pins and SPI settings live in hat.py) ---
+device = create_device()
 
 try:
     font = ImageFont.truetype(
@@ -37,96 +20,75 @@ try:
 except IOError:
     font = ImageFont.load_default()
 
-# --- GPIO Configuration for Buttons and Joystick ---
-# Using BCM (Broadcom) GPIO numbering
-GPIO.setmode(GPIO.BCM)
-
-# Define button/joystick pins based on Waveshare Wiki
-BUTTON_PINS = {
-    "KEY1": 21,
-    "KEY2": 20,
-    "KEY3": 16,
-    "JOY_UP": 6,
-    "JOY_DOWN": 19,
-    "JOY_LEFT": 5,
-    "JOY_RIGHT": 26,
-    "JOY_PRESS": 13,
-}
-
-# Set up each button pin as an input with a pull-up resistor
-# Buttons connect to ground when pressed, so PUD_UP keeps them HIGH when
-# not pressed.
-for pin_name, pin_num in BUTTON_PINS.items():
-    GPIO.setup(pin_num, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-
-# --- Event Detection for Button Presses (for console output) ---
-# This will print a message to the terminal whenever a button state changes
-# `GPIO.FALLING` triggers when the button is pressed (goes from HIGH to LOW)
-# `bouncetime` helps prevent multiple detections from a single press.
-def button_callback(channel):
-    pin_name = next(
-        (name for name, num in BUTTON_PINS.items() if num == channel),
-        f"Pin {channel}",
-    )
-    if GPIO.input(channel) == GPIO.LOW:  # Button is pressed (pulled low)
+# --- Buttons and Joystick ---
+# The input multiplexer reports presses from the HAT and from the remote
+# control page alike; key repeat is off so each press prints once.
+mux = InputMux(repeat=(), idle=IdleManager(device))
+pressed = {name: False for name in BUTTON_PINS}
+
+# How often held buttons are checked for release.
+POLL_INTERVAL = 0.05
+
+
+def log_button(pin_name, is_pressed):
+    if is_pressed:
         print(f"[{datetime.now().strftime('%H:%M:%S')}] {pin_name} PRESSED!")
     else:  # Button is released (goes back high)
         print(f"[{datetime.now().strftime('%H:%M:%S')}] {pin_name} Released.")
 
 
-# Add event detection to all button pins
-for pin_name, pin_num in BUTTON_PINS.items():
-    GPIO.add_event_detect(
-        pin_num, GPIO.BOTH, callback=button_callback, bouncetime=200
-    )
-
 print("Screen and input test started. Press Ctrl+C to exit.")
 print("Press buttons/joystick, and observe console output & LCD display.")
 
-# --- Main Display and Input Polling Loop ---
+
+class ButtonStates(Widget):
+    """ON/OFF for every button; polled only while one is held."""
+
+    def state(self, now):
+        return tuple(pressed.values())
+
+    def next_change(self, now):
+        # A press wakes the loop by itself; releases have to be polled.
+        return now + POLL_INTERVAL if any(pressed.values()) else None
+
+    def draw(self, draw, now):
+        for row, name in enumerate(BUTTON_PINS):
+            if pressed[name]:
+                state, color = "ON", colors.good
+            else:
+                state, color = "OFF", colors.alert
+            draw.text((0, row * 10), f"{name}: {state}", fill=color, font=font)
+
+
+screen = WidgetScreen(
+    device,
+    [
+        Clock((5, 0, LCD_WIDTH, 10), font),
+        Clock((5, 10, LCD_WIDTH, 20), font, "%Y-%m-%d", color=colors.dim),
+        ButtonStates((5, 25, LCD_WIDTH, 25 + 10 * len(BUTTON_PINS))),
+        # Simple animated rectangle (from previous test)
+        Slider(
+            (5, 100, LCD_WIDTH - 4, 116),
+            (21, 16),
+            10,
+            fill=colors.highlight,
+            outline=colors.shape,
+        ),
+    ],
+)
+
+# --- Main Display and Input Loop ---
 try:
     while True:
-        if GPIO.input(BUTTON_PINS["KEY3"]) == GPIO.LOW:
+        for pin_name in BUTTON_PINS:
+            is_pressed = mux.is_pressed(pin_name)
+            if is_pressed != pressed[pin_name]:
+                pressed[pin_name] = is_pressed
+                log_button(pin_name, is_pressed)
+        screen.update()
+        # Sleep until a press or the next widget change.
+        if mux.get(timeout=screen.timeout()) == "KEY3":
             break
-        with canvas(device) as draw:
-            # Clear the screen
-            draw.rectangle(device.bounding_box, outline="black", fill="black")
-
-            # Display Time and Date
-            now = datetime.now()
-            draw.text(
-                (5, 0), now.strftime("%H:%M:%S"), fill="white", font=font
-            )
-            draw.text(
-                (5, 10), now.strftime("%Y-%m-%d"), fill="gray", font=font
-            )
-
-            # Display Button States
-            y_offset = 25
-            for pin_name, pin_num in BUTTON_PINS.items():
-                state = "OFF"
-                color = "red"
-                if GPIO.input(pin_num) == GPIO.LOW:  # Button is pressed
-                    state = "ON"
-                    color = "green"
-                draw.text(
-                    (5, y_offset),
-                    f"{pin_name}: {state}",
-                    fill=color,
-                    font=font,
-                )
-                y_offset += 10  # Move to the next line
-
-            # Simple animated rectangle (from previous test)
-            rect_x = int(5 + (time.time() * 10) % (LCD_WIDTH - 25))
-            draw.rectangle(
-                (rect_x, 100, rect_x + 20, 115), outline="blue", fill="yellow"
-            )
-
-        time.sleep(
-            0.05
-        )  # Update faster to feel more responsive for input (~20 FPS)
 
 except KeyboardInterrupt:
     print("\nExiting screen and input test.")
@@ -134,6 +96,7 @@ except Exception as e:
     print(f"\nAn unexpected error occurred: {e}")
 finally:
     print("Cleaning up display and GPIO resources...")
+    mux.close()
     device.cleanup()  # Cleans up luma.lcd resources
     GPIO.cleanup()  # Cleans up RPi.GPIO resources
     print("Cleanup complete.")
@@ -0,0 +1,255 @@
+"""Tiles and sprites for games on the 128x128 panel.
+
+A :class:`TileScene` is a grid of tiles from a :class:`Tileset` plus
+sprites drawn over it. Tiles are rendered once and kept both as images
+and as packed RGB565 rows, so changing a cell costs no drawing and no
+colour conversion. The scene tracks which cells changed since the last
+:meth:`TileScene.render`, merges them into as few rectangles as it can
+and sends only those windows, skipping the whole-frame diff in
+:mod:`hat`. Cells under a sprite are composed and packed when they
+change.
+"""
+
+from typing import Optional, Union
+
+from PIL import Image
+
+from palette import ColorSpec, resolve
+from rgb565 import Rgb565Packer
+
+Cell = tuple[int, int]
+Box = tuple[int, int, int, int]
+
+
+class Tileset:
+    """Named square tiles of ``tile_size`` pixels."""
+
+    def __init__(self, tile_size: int) -> None:
+        self.tile_size = tile_size
+        self.images: dict[str, Image.Image] = {}
+        # Packed pixels of each tile, one bytes object per pixel row.
+        self.rows: dict[str, list[bytes]] = {}
+        self._packer = Rgb565Packer(tile_size * tile_size)
+
+    def add(self, name: str, tile: Union[ColorSpec, Image.Image]) -> None:
+        """Add a tile from an image or a colour (a solid tile)."""
+        size = (self.tile_size, self.tile_size)
+        if isinstance(tile, Image.Image):
+            image = tile.convert("RGB")
+            assert image.size == size
+            data = bytes(self._packer.pack(image))
+        else:
+            # A solid tile is its colour's packed pixel, repeated.
+            color = resolve(tile)
+            image = Image.new("RGB", size, color)
+            data = color.packed * (self.tile_size * self.tile_size)
+        stride = self.tile_size * 2
+        self.images[name] = image
+        self.rows[name] = [
+            data[offset:offset + stride]
+            for offset in range(0, len(data), stride)
+        ]
+
+
+class Sprite:
+    """An image drawn over the tiles; RGBA images are blended.
+
+    Change sprites through the scene (:meth:`TileScene.move_sprite` and
+    friends) so it knows which cells to redraw.
+    """
+
+    def __init__(
+        self, image: Image.Image, x: int = 0, y: int = 0, layer: int = 0
+    ) -> None:
+        self.image = image
+        self.x = x
+        self.y = y
+        self.layer = layer
+
+    @property
+    def box(self) -> Box:
+        return (
+            self.x,
+            self.y,
+            self.x + self.image.width,
+            self.y + self.image.height,
+        )
+
+
+def _intersect(a: Box, b: Box) -> Optional[Box]:
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return None
+    return box
+
+
+def merge_cells(cells) -> list[Box]:
+    """Cover ``cells`` with rectangles ``(col0, row0, col1, row1)``.
+
+    Runs of cells in a row become one rectangle, and runs spanning the
+    same columns in consecutive rows are stacked into one.
+    """
+    runs_by_row: dict[int, list[tuple[int, int]]] = {}
+    for col, row in sorted(cells, key=lambda cell: (cell[1], cell[0])):
+        runs = runs_by_row.setdefault(row, [])
+        if runs and runs[-1][1] == col:
+            runs[-1] = (runs[-1][0], col + 1)
+        else:
+            runs.append((col, col + 1))
+    rects: list[Box] = []
+    # Rectangles still growing downwards, by column span.
+    open_rects: dict[tuple[int, int], int] = {}
+    for row in sorted(runs_by_row):
+        spans = runs_by_row[row]
+        for span, index in list(open_rects.items()):
+            rect = rects[index]
+            if span not in spans or rect[3] != row:
+                del open_rects[span]
+        for span in spans:
+            index = open_rects.get(span)
+            if index is None:
+                open_rects[span] = len(rects)
+                rects.append((span[0], row, span[1], row + 1))
+            else:
+                rect = rects[index]
+                rects[index] = (rect[0], rect[1], rect[2], row + 1)
+    return rects
+
+
+class TileScene:
+    """A grid of tiles with sprites, sent to ``screen`` cell by cell.
+
+    ``screen`` is a :class:`hat.HatST7735` or a
+    :class:`display_writer.DisplayWriter` around one.
+    """
+
+    def __init__(self, screen, tileset: Tileset, fill: str) -> None:
+        self.screen = screen
+        self.tileset = tileset
+        size = tileset.tile_size
+        self.cols = screen.width // size
+        self.rows = screen.height // size
+        self.tiles = [[fill] * self.cols for _ in range(self.rows)]
+        # What each cell showed at the last render; None forces a resend.
+        self._sent: list[list[Optional[str]]] = [
+            [None] * self.cols for _ in range(self.rows)
+        ]
+        self.sprites: list[Sprite] = []
+        self.frame = Image.new("RGB", screen.size)
+        # Cells set since the last render, and cells a sprite touched.
+        self._dirty: set[Cell] = set()
+        self._forced: set[Cell] = set()
+        self._packer = Rgb565Packer(screen.width * screen.height)
+        self.invalidate()
+
+    # --- Tiles ---
+
+    def set_tile(self, col: int, row: int, name: str) -> None:
+        if self.tiles[row][col] != name:
+            self.tiles[row][col] = name
+            self._dirty.add((col, row))
+
+    def fill(self, name: str) -> None:
+        for row in range(self.rows):
+            for col in range(self.cols):
+                self.set_tile(col, row, name)
+
+    def invalidate(self) -> None:
+        """Send every cell on the next render, e.g. after a full screen."""
+        self._forced.update(
+            (col, row) for row in range(self.rows) for col in range(self.cols)
+        )
+
+    # --- Sprites ---
+
+    def _mark_box(self, box: Box) -> None:
+        size = self.tileset.tile_size
+        box = _intersect(box, (0, 0) + self.screen.size)
+        if box is None:
+            return
+        for row in range(box[1] // size, (box[3] - 1) // size + 1):
+            for col in range(box[0] // size, (box[2] - 1) // size + 1):
+                self._forced.add((col, row))
+
+    def add_sprite(self, sprite: Sprite) -> Sprite:
+        self.sprites.append(sprite)
+        self.sprites.sort(key=lambda item: item.layer)
+        self._mark_box(sprite.box)
+        return sprite
+
+    def remove_sprite(self, sprite: Sprite) -> None:
+        self.sprites.remove(sprite)
+        self._mark_box(sprite.box)
+
+    def move_sprite(self, sprite: Sprite, x: int, y: int) -> None:
+        if (x, y) != (sprite.x, sprite.y):
+            self._mark_box(sprite.box)
+            sprite.x, sprite.y = x, y
+            self._mark_box(sprite.box)
+
+    def set_sprite_image(self, sprite: Sprite, image: Image.Image) -> None:
+        self._mark_box(sprite.box)
+        sprite.image = image
+        self._mark_box(sprite.box)
+
+    # --- Output ---
+
+    def _compose(self, rect: Box) -> tuple[Box, bytes]:
+        size = self.tileset.tile_size
+        images = self.tileset.images
+        col0, row0, col1, row1 = rect
+        box = (col0 * size, row0 * size, col1 * size, row1 * size)
+        for row in range(row0, row1):
+            for col in range(col0, col1):
+                self.frame.paste(
+                    images[self.tiles[row][col]], (col * size, row * size)
+                )
+        covered = False
+        for sprite in self.sprites:
+            overlap = _intersect(box, sprite.box)
+            if overlap is None:
+                continue
+            covered = True
+            part = sprite.image.crop(
+                (
+                    overlap[0] - sprite.x,
+                    overlap[1] - sprite.y,
+                    overlap[2] - sprite.x,
+                    overlap[3] - sprite.y,
+                )
+            )
+            mask = part if part.mode == "RGBA" else None
+            self.frame.paste(part, overlap[:2], mask)
+        if covered:
+            return box, bytes(self._packer.pack(self.frame.crop(box)))
+        # Only tiles: join their packed rows, top to bottom.
+        tile_rows = self.tileset.rows
+        data = b"".join(
+            tile_rows[self.tiles[row][col]][line]
+            for row in range(row0, row1)
+            for line in range(size)
+            for col in range(col0, col1)
+        )
+        return box, data
+
+    def render(self) -> int:
+        """Send the cells changed since the last call.
+
+        Returns the number of windows sent.
+        """
+        cells = self._forced
+        # A cell set and set back between renders needs no update.
+        cells.update(
+            (col, row)
+            for col, row in self._dirty
+            if self.tiles[row][col] != self._sent[row][col]
+        )
+        self._dirty = set()
+        self._forced = set()
+        if not cells:
+            return 0
+        for col, row in cells:
+            self._sent[row][col] = self.tiles[row][col]
+        windows = [self._compose(rect) for rect in merge_cells(cells)]
+        self.screen.display_windows(self.frame.copy(), windows)
+        return len(windows)
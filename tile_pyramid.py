@@ -0,0 +1,288 @@
+"""Pan and zoom over large pictures, one screen-sized tile at a time.
+
+A :class:`TilePyramid` cuts a picture into 128x128 tiles at a series of
+zoom levels, each twice the scale of the one before: level 0 fits the
+whole picture on the screen and the last level is the original
+resolution. A level is decoded once, on a background thread, the first
+time it is needed, and can be shown as soon as it is decoded; its tiles
+are then saved under ``images/.tiles`` and later read one by one, so a
+pan only ever loads the tiles that come into view.
+
+:class:`PanZoomView` shows a 128x128 window onto one level. Panning
+shifts the previous frame and fills in only the newly exposed strips.
+"""
+
+import os
+import queue
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from PIL import Image
+
+from image_transcode import IMG_DIR, safe_name, upright_rgb
+from palette import colors
+
+PYRAMID_DIR = os.path.join(IMG_DIR, ".tiles")
+
+TILE_SIZE = 128
+
+# Decoded tiles kept in memory (48 KB each).
+TILE_CACHE_SIZE = 48
+
+# EXIF orientations that swap width and height.
+_ORIENTATION = 0x0112
+_TRANSPOSED = (5, 6, 7, 8)
+
+Box = tuple[int, int, int, int]
+
+
+def _intersect(a: Box, b: Box) -> Optional[Box]:
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return None
+    return box
+
+
+class TilePyramid:
+    """Zoom levels of ``source`` cut into tiles, built on demand."""
+
+    def __init__(self, source: str, screen_size=(TILE_SIZE, TILE_SIZE)):
+        self.source = source
+        with Image.open(source) as img:
+            width, height = img.size
+            self._transposed = img.getexif().get(_ORIENTATION) in _TRANSPOSED
+            if self._transposed:
+                width, height = height, width
+        self.size = (width, height)
+
+        scale = min(screen_size[0] / width, screen_size[1] / height, 1.0)
+        self.levels: list[tuple[int, int]] = []
+        while True:
+            self.levels.append(
+                (max(1, round(width * scale)), max(1, round(height * scale)))
+            )
+            if scale >= 1.0:
+                break
+            scale = min(1.0, scale * 2)
+
+        # A changed source gets a new directory rather than stale tiles.
+        stat = os.stat(source)
+        self.cache_dir = os.path.join(
+            PYRAMID_DIR,
+            f"{safe_name(os.path.basename(source))}"
+            f"-{stat.st_size}-{int(stat.st_mtime)}",
+        )
+        self._ready = {
+            level
+            for level in range(len(self.levels))
+            if os.path.exists(self._done_path(level))
+        }
+        self._queued: set[int] = set()
+        # Levels that could not be decoded, e.g. a truncated file.
+        self.failed: set[int] = set()
+        self._requests: queue.Queue[int] = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._tiles: OrderedDict = OrderedDict()
+        # The level being saved as tiles, served from memory meanwhile.
+        self._decoded: Optional[tuple[int, Image.Image]] = None
+
+    def _level_dir(self, level: int) -> str:
+        return os.path.join(self.cache_dir, str(level))
+
+    def _done_path(self, level: int) -> str:
+        return os.path.join(self._level_dir(level), "done")
+
+    def _tile_path(self, level: int, col: int, row: int) -> str:
+        return os.path.join(self._level_dir(level), f"{col}_{row}.png")
+
+    def ready(self, level: int) -> bool:
+        """Return True if ``level`` can be shown; else start building it."""
+        with self._lock:
+            if level in self._ready:
+                return True
+            if level not in self._queued and level not in self.failed:
+                self._queued.add(level)
+                self._requests.put(level)
+                if self._worker is None:
+                    self._worker = threading.Thread(
+                        target=self._run, daemon=True
+                    )
+                    self._worker.start()
+        return False
+
+    def _run(self) -> None:
+        while True:
+            level = self._requests.get()
+            try:
+                self._build(level)
+            except OSError as exc:
+                print(f"Cannot build zoom level {level}: {exc}")
+                with self._lock:
+                    if level not in self._ready:
+                        self.failed.add(level)
+            else:
+                # Every tile is on disk now.
+                self._decoded = None
+            with self._lock:
+                self._queued.discard(level)
+
+    def _build(self, level: int) -> None:
+        size = self.levels[level]
+        with Image.open(self.source) as img:
+            # JPEGs decode at the smallest DCT scale covering the level.
+            img.draft("RGB", size[::-1] if self._transposed else size)
+            img = upright_rgb(img)
+            if img.size != size:
+                img = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+        self._decoded = (level, img)
+        with self._lock:
+            self._ready.add(level)
+        os.makedirs(self._level_dir(level), exist_ok=True)
+        for top in range(0, size[1], TILE_SIZE):
+            for left in range(0, size[0], TILE_SIZE):
+                tile = img.crop((left, top, left + TILE_SIZE, top + TILE_SIZE))
+                path = self._tile_path(
+                    level, left // TILE_SIZE, top // TILE_SIZE
+                )
+                tile.save(path + ".tmp", format="PNG", compress_level=1)
+                os.replace(path + ".tmp", path)
+        open(self._done_path(level), "w").close()
+
+    def tile(self, level: int, col: int, row: int) -> Image.Image:
+        """Return one tile of a ready level."""
+        key = (level, col, row)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+        decoded = self._decoded
+        if decoded is not None and decoded[0] == level:
+            left, top = col * TILE_SIZE, row * TILE_SIZE
+            tile = decoded[1].crop(
+                (left, top, left + TILE_SIZE, top + TILE_SIZE)
+            )
+        else:
+            with Image.open(self._tile_path(level, col, row)) as img:
+                tile = img.convert("RGB")
+        self._tiles[key] = tile
+        if len(self._tiles) > TILE_CACHE_SIZE:
+            self._tiles.popitem(last=False)
+        return tile
+
+
+class PanZoomView:
+    """A screen-sized window onto one level of a :class:`TilePyramid`."""
+
+    def __init__(self, pyramid: TilePyramid, size=(TILE_SIZE, TILE_SIZE)):
+        self.pyramid = pyramid
+        self.size = size
+        self.level = 0
+        # Top left of the window in level pixels; negative when the level
+        # is smaller than the screen, which centres it.
+        self.x = 0
+        self.y = 0
+        self._shown: Optional[tuple[int, int, int]] = None
+        self._frame: Optional[Image.Image] = None
+        self._clamp()
+
+    @property
+    def max_level(self) -> int:
+        return len(self.pyramid.levels) - 1
+
+    def _clamp(self) -> None:
+        width, height = self.pyramid.levels[self.level]
+        screen_w, screen_h = self.size
+        if width <= screen_w:
+            self.x = (width - screen_w) // 2
+        else:
+            self.x = max(0, min(self.x, width - screen_w))
+        if height <= screen_h:
+            self.y = (height - screen_h) // 2
+        else:
+            self.y = max(0, min(self.y, height - screen_h))
+
+    def zoom(self, delta: int) -> bool:
+        """Change level by ``delta`` keeping the centre; False at a limit."""
+        level = max(0, min(self.max_level, self.level + delta))
+        if level == self.level:
+            return False
+        old_w, old_h = self.pyramid.levels[self.level]
+        new_w, new_h = self.pyramid.levels[level]
+        centre_x = (self.x + self.size[0] / 2) * new_w / old_w
+        centre_y = (self.y + self.size[1] / 2) * new_h / old_h
+        self.level = level
+        self.x = round(centre_x - self.size[0] / 2)
+        self.y = round(centre_y - self.size[1] / 2)
+        self._clamp()
+        return True
+
+    def pan(self, dx: int, dy: int) -> bool:
+        """Move the window; False if it is already at that edge."""
+        before = (self.x, self.y)
+        self.x += dx
+        self.y += dy
+        self._clamp()
+        return (self.x, self.y) != before
+
+    def _fill(self, frame: Image.Image, box: Box) -> None:
+        """Draw the part of the level under screen ``box`` into ``frame``."""
+        width, height = self.pyramid.levels[self.level]
+        world = _intersect(
+            (box[0] + self.x, box[1] + self.y, box[2] + self.x,
+             box[3] + self.y),
+            (0, 0, width, height),
+        )
+        if world is None:
+            return
+        for row in range(
+            world[1] // TILE_SIZE, (world[3] - 1) // TILE_SIZE + 1
+        ):
+            for col in range(
+                world[0] // TILE_SIZE, (world[2] - 1) // TILE_SIZE + 1
+            ):
+                left, top = col * TILE_SIZE, row * TILE_SIZE
+                part = _intersect(
+                    world, (left, top, left + TILE_SIZE, top + TILE_SIZE)
+                )
+                tile = self.pyramid.tile(self.level, col, row)
+                frame.paste(
+                    tile.crop(
+                        (part[0] - left, part[1] - top,
+                         part[2] - left, part[3] - top)
+                    ),
+                    (part[0] - self.x, part[1] - self.y),
+                )
+
+    def render(self) -> Optional[Image.Image]:
+        """Return the current window, or None while its level is built."""
+        if not self.pyramid.ready(self.level):
+            return None
+        width, height = self.size
+        frame = Image.new("RGB", self.size, colors.background)
+        shown = self._shown
+        dx = dy = None
+        if shown is not None and shown[0] == self.level:
+            dx, dy = self.x - shown[1], self.y - shown[2]
+        if dx is not None and abs(dx) < width and abs(dy) < height:
+            # Reuse what is already on screen and fetch only the strips
+            # that scrolled into view.
+            frame.paste(self._frame, (-dx, -dy))
+            if dx:
+                self._fill(
+                    frame,
+                    (width - dx, 0, width, height) if dx > 0
+                    else (0, 0, -dx, height),
+                )
+            if dy:
+                self._fill(
+                    frame,
+                    (0, height - dy, width, height) if dy > 0
+                    else (0, 0, width, -dy),
+                )
+        else:
+            self._fill(frame, (0, 0, width, height))
+        self._shown = (self.level, self.x, self.y)
+        self._frame = frame
+        return frame
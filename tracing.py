@@ -0,0 +1,210 @@
+"""Timeline of what an app does, in a ring buffer, for chrome://tracing.
+
+Apps mark spans (``with tracing.span("draw"):``) and instants
+(``tracing.instant("input", "KEY1")``) on the way from a button edge
+through the app's reaction and drawing to packing and the SPI write.
+Events go into a ring buffer of :data:`CAPACITY` slots in plain integer
+arrays, allocated when tracing is first switched on: recording one costs
+two clock reads and a few array stores, and allocates nothing for
+instants. While tracing is off,
+:func:`span` returns a shared no-op and :func:`instant` returns at once.
+
+:func:`dump` writes the buffer as Chrome trace JSON, which Perfetto
+(https://ui.perfetto.dev) and ``chrome://tracing`` open. A running app
+dumps on ``SIGUSR1`` or when asked over the app bus, which is how the
+remote server's ``/trace.json`` fetches the foreground app's timeline.
+Tracing is switched on with the "Tracing" setting, which every app
+applies when it opens the display.
+"""
+
+import contextlib
+import itertools
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from typing import Optional
+
+CAPACITY = 16384
+
+TRACE_DIR = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+    "nanodeck-traces",
+)
+
+# Duration stored for instants.
+_INSTANT = -1
+_NO_ARG = -1
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Tracer:
+    """A ring buffer of the last ``capacity`` events."""
+
+    def __init__(self, capacity: int = CAPACITY) -> None:
+        self.capacity = capacity
+        self.enabled = False
+        # The slots take 512 KB, allocated the first time tracing is on.
+        self._start = array("q")
+        self._duration = array("q")
+        self._name = array("i")
+        self._arg = array("i")
+        self._thread = array("q")
+        # Event names and details, interned to keep the slots numeric.
+        self._strings: dict[str, int] = {}
+        self._string_list: list[str] = []
+        self._strings_lock = threading.Lock()
+        # next() on a count is atomic, so threads never share a slot.
+        self._slots = itertools.count()
+        self._origin = time.perf_counter_ns()
+
+    def enable(self, enabled: bool = True) -> None:
+        if enabled and not self._start:
+            capacity = self.capacity
+            self._duration = array("q", bytes(8 * capacity))
+            self._name = array("i", bytes(4 * capacity))
+            self._arg = array("i", bytes(4 * capacity))
+            self._thread = array("q", bytes(8 * capacity))
+            # Last: an empty _start means the slots are not there yet.
+            self._start = array("q", bytes(8 * capacity))
+        self.enabled = enabled
+
+    def _intern(self, text: str) -> int:
+        index = self._strings.get(text)
+        if index is None:
+            with self._strings_lock:
+                index = self._strings.get(text)
+                if index is None:
+                    index = len(self._string_list)
+                    self._string_list.append(text)
+                    self._strings[text] = index
+        return index
+
+    def record(
+        self, name: str, start: int, duration: int, arg: Optional[str]
+    ) -> None:
+        """Store one event; times are ``perf_counter_ns`` values."""
+        slot = next(self._slots) % self.capacity
+        self._start[slot] = start
+        self._duration[slot] = duration
+        self._name[slot] = self._intern(name)
+        self._arg[slot] = _NO_ARG if arg is None else self._intern(arg)
+        self._thread[slot] = threading.get_native_id()
+
+    def events(self) -> list[dict]:
+        """Return the buffered events as Chrome trace events, oldest first."""
+        pid = os.getpid()
+        strings = self._string_list
+        slots = sorted(
+            (self._start[slot], slot)
+            for slot in range(len(self._start))
+            if self._start[slot]
+        )
+        events = []
+        for start, slot in slots:
+            duration = self._duration[slot]
+            event = {
+                "name": strings[self._name[slot]],
+                "cat": "app",
+                "pid": pid,
+                "tid": self._thread[slot],
+                "ts": (start - self._origin) / 1000,
+            }
+            if duration == _INSTANT:
+                event["ph"] = "i"
+                event["s"] = "t"
+            else:
+                event["ph"] = "X"
+                event["dur"] = duration / 1000
+            if self._arg[slot] != _NO_ARG:
+                event["args"] = {"detail": strings[self._arg[slot]]}
+            events.append(event)
+        # Name the process and its threads for the viewer.
+        app = os.path.basename(sys.argv[0]) or "python"
+        events.append(
+            {"name": "process_name", "ph": "M", "pid": pid,
+             "args": {"name": app}}
+        )
+        for thread in threading.enumerate():
+            events.append(
+                {"name": "thread_name", "ph": "M", "pid": pid,
+                 "tid": thread.native_id, "args": {"name": thread.name}}
+            )
+        return events
+
+    def dump(self, path: str) -> str:
+        """Write the buffer to ``path`` as Chrome trace JSON."""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as trace_file:
+            json.dump(
+                {"traceEvents": self.events(), "displayTimeUnit": "ms"},
+                trace_file,
+            )
+        os.replace(tmp_path, path)
+        return path
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "arg", "start")
+
+    def __init__(self, tracer: Tracer, name: str, arg: Optional[str]):
+        self.tracer = tracer
+        self.name = name
+        self.arg = arg
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        end = time.perf_counter_ns()
+        self.tracer.record(self.name, self.start, end - self.start, self.arg)
+
+
+tracer = Tracer()
+
+
+def enable(enabled: bool = True) -> None:
+    tracer.enable(enabled)
+
+
+def span(name: str, arg: Optional[str] = None):
+    """Context manager recording how long its body takes."""
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return _Span(tracer, name, arg)
+
+
+def instant(name: str, arg: Optional[str] = None) -> None:
+    if tracer.enabled:
+        tracer.record(name, time.perf_counter_ns(), _INSTANT, arg)
+
+
+def complete(name: str, start: int, arg: Optional[str] = None) -> None:
+    """Record a span that began at ``start`` (``perf_counter_ns``)."""
+    if tracer.enabled:
+        tracer.record(name, start, time.perf_counter_ns() - start, arg)
+
+
+def default_path() -> str:
+    app = os.path.splitext(os.path.basename(sys.argv[0]))[0] or "python"
+    return os.path.join(TRACE_DIR, f"{app}-{os.getpid()}.json")
+
+
+def dump(path: Optional[str] = None) -> str:
+    """Write this process's trace; returns the file written."""
+    path = tracer.dump(path or default_path())
+    print(f"Trace written to {path}")
+    return path
+
+
+def install_signal_handler(signum: int = signal.SIGUSR1) -> None:
+    """Dump the trace whenever the process receives ``signum``."""
+    signal.signal(signum, lambda _signum, _frame: dump())
@@ -0,0 +1,206 @@
+"""Screen regions that redraw only when what they show changes.
+
+Each :class:`Widget` owns a box on the frame, says what it currently
+shows (:meth:`Widget.state`) and when that may next change
+(:meth:`Widget.next_change`): a clock at the next second, an animation
+at its next whole-pixel step. :class:`WidgetScreen` keeps the frame,
+redraws only the widgets whose state changed and tells the app how long
+it can sleep, so a clock costs one small redraw a second instead of a
+full frame ten times a second. Only the redrawn boxes differ from the
+previous frame, so only they go over SPI.
+
+Times are wall-clock seconds (``time.time()``) so clocks tick on real
+second boundaries.
+"""
+
+import math
+import time
+from typing import Hashable, Iterable, Optional
+
+from PIL import Image, ImageDraw
+
+import tracing
+from palette import ColorSpec, colors, resolve
+
+Box = tuple[int, int, int, int]
+
+
+class Widget:
+    """A region of the screen at ``box`` (left, top, right, bottom)."""
+
+    def __init__(
+        self, box: Box, background: Optional[ColorSpec] = None
+    ) -> None:
+        self.box = box
+        self.background = resolve(background or colors.background)
+        self.size = (box[2] - box[0], box[3] - box[1])
+
+    def state(self, now: float) -> Hashable:
+        """Return a value that changes whenever the drawing would."""
+        return None
+
+    def next_change(self, now: float) -> Optional[float]:
+        """Return when :meth:`state` may next change (None: on input)."""
+        return None
+
+    def draw(self, draw: ImageDraw.ImageDraw, now: float) -> None:
+        """Draw the widget; ``(0, 0)`` is the top left of its box."""
+        raise NotImplementedError
+
+
+class Text(Widget):
+    """A fixed line of text, changed by assigning :attr:`text`."""
+
+    def __init__(
+        self,
+        box: Box,
+        text: str,
+        font,
+        color: Optional[ColorSpec] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(box, **kwargs)
+        self.text = text
+        self.font = font
+        self.color = resolve(color or colors.text)
+
+    def state(self, now: float) -> Hashable:
+        return self.text
+
+    def draw(self, draw: ImageDraw.ImageDraw, now: float) -> None:
+        draw.text((0, 0), self.text, fill=self.color, font=self.font)
+
+
+class Clock(Text):
+    """The local time formatted with ``strftime``.
+
+    Checked every second; a date-only format still redraws once a day.
+    """
+
+    def __init__(
+        self, box: Box, font, fmt: str = "%H:%M:%S", **kwargs
+    ) -> None:
+        super().__init__(box, "", font, **kwargs)
+        self.fmt = fmt
+
+    def state(self, now: float) -> Hashable:
+        self.text = time.strftime(self.fmt, time.localtime(now))
+        return self.text
+
+    def next_change(self, now: float) -> Optional[float]:
+        return math.floor(now) + 1
+
+
+class Slider(Widget):
+    """A block moving across its box at ``speed`` pixels per second.
+
+    It wraps to the left edge at the right end, and redraws only when it
+    has moved by a whole pixel.
+    """
+
+    def __init__(
+        self,
+        box: Box,
+        block: tuple[int, int],
+        speed: float,
+        fill: Optional[ColorSpec] = None,
+        outline: Optional[ColorSpec] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(box, **kwargs)
+        self.block = block
+        self.speed = speed
+        self.fill = resolve(fill or colors.shape)
+        self.outline = resolve(outline or colors.alert)
+        self._span = max(1, self.size[0] - block[0])
+
+    def state(self, now: float) -> Hashable:
+        return int(now * self.speed) % self._span
+
+    def next_change(self, now: float) -> Optional[float]:
+        return (math.floor(now * self.speed) + 1) / self.speed
+
+    def draw(self, draw: ImageDraw.ImageDraw, now: float) -> None:
+        x = self.state(now)
+        draw.rectangle(
+            (x, 0, x + self.block[0] - 1, self.block[1] - 1),
+            fill=self.fill,
+            outline=self.outline,
+        )
+
+
+class WidgetScreen:
+    """Compose ``widgets`` onto a frame and send it to ``screen``.
+
+    ``screen`` is a luma device or a :class:`display_writer.DisplayWriter`.
+    Call :meth:`update` whenever the app wakes and wait at most
+    :meth:`timeout` seconds for input in between. An app that draws the
+    rest of the screen itself passes its own ``frame``, calls
+    :meth:`draw` and sends the frame when anything changed.
+    """
+
+    def __init__(
+        self,
+        screen,
+        widgets: Iterable[Widget] = (),
+        background: Optional[ColorSpec] = None,
+        frame: Optional[Image.Image] = None,
+    ) -> None:
+        self.screen = screen
+        if frame is None:
+            frame = Image.new(
+                screen.mode, screen.size, background or colors.background
+            )
+        self.frame = frame
+        self.widgets: list[Widget] = []
+        self._images: dict[Widget, Image.Image] = {}
+        self._shown: dict[Widget, Hashable] = {}
+        for widget in widgets:
+            self.add(widget)
+
+    def add(self, widget: Widget) -> None:
+        self.widgets.append(widget)
+        self._images[widget] = Image.new(self.frame.mode, widget.size)
+
+    def invalidate(self, widget: Optional[Widget] = None) -> None:
+        """Redraw ``widget``, or every widget, on the next update."""
+        for item in self.widgets if widget is None else (widget,):
+            self._shown.pop(item, None)
+
+    def update(self, now: Optional[float] = None) -> bool:
+        """Redraw the widgets that changed and send the frame if any did."""
+        changed = self.draw(now)
+        if changed:
+            self.screen.display(self.frame.copy())
+        return changed
+
+    def draw(self, now: Optional[float] = None) -> bool:
+        """Redraw the widgets that changed; return True if any did."""
+        if now is None:
+            now = time.time()
+        changed = False
+        for widget in self.widgets:
+            state = widget.state(now)
+            if widget in self._shown and self._shown[widget] == state:
+                continue
+            self._shown[widget] = state
+            image = self._images[widget]
+            image.paste(widget.background, (0, 0) + image.size)
+            with tracing.span("draw", type(widget).__name__):
+                widget.draw(ImageDraw.Draw(image), now)
+            self.frame.paste(image, widget.box[:2])
+            changed = True
+        return changed
+
+    def timeout(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until the next widget may change, or None."""
+        if now is None:
+            now = time.time()
+        deadlines = [
+            deadline
+            for deadline in (w.next_change(now) for w in self.widgets)
+            if deadline is not None
+        ]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - now)
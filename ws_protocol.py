@@ -0,0 +1,183 @@
+"""Minimal RFC 6455 WebSocket support for the remote control server.
+
+Only what the remote UI needs is implemented: the opening handshake,
+unfragmented or fragmented text/binary messages, ping/pong and close.
+Everything runs on top of the streams that ``http.server`` already gives
+each request handler, so no extra dependency is required.
+"""
+
+import base64
+import hashlib
+import struct
+import threading
+from typing import BinaryIO, Optional
+
+_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# Client messages are tiny button events; refuse anything unreasonable.
+MAX_MESSAGE_SIZE = 64 * 1024
+
+
+class WebSocketClosed(Exception):
+    """Raised when the peer closed the connection or broke the protocol."""
+
+
+def accept_key(key: str) -> str:
+    """Return the ``Sec-WebSocket-Accept`` value for a client key."""
+    digest = hashlib.sha1((key + _GUID).encode("ascii")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def is_upgrade_request(headers) -> bool:
+    """Return True if the request headers ask for a WebSocket upgrade."""
+    upgrade = headers.get("Upgrade", "")
+    connection = headers.get("Connection", "")
+    return (
+        upgrade.lower() == "websocket"
+        and "upgrade" in connection.lower()
+        and bool(headers.get("Sec-WebSocket-Key"))
+    )
+
+
+def encode_frame(opcode: int, payload: bytes = b"") -> bytes:
+    """Return a single unmasked (server to client) frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def _read_exact(rfile: BinaryIO, size: int) -> bytes:
+    data = rfile.read(size)
+    if data is None or len(data) < size:
+        raise WebSocketClosed("connection closed mid-frame")
+    return data
+
+
+def _read_frame(rfile: BinaryIO) -> tuple[bool, int, bytes]:
+    """Read one raw frame and return ``(fin, opcode, payload)``."""
+    first, second = _read_exact(rfile, 2)
+    fin = bool(first & 0x80)
+    opcode = first & 0x0F
+    masked = second & 0x80
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", _read_exact(rfile, 2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", _read_exact(rfile, 8))
+    if not masked:
+        raise WebSocketClosed("client frames must be masked")
+    if length > MAX_MESSAGE_SIZE:
+        raise WebSocketClosed("frame too large")
+    mask = _read_exact(rfile, 4)
+    payload = _read_exact(rfile, length)
+    if length:
+        # XOR with the repeated mask in one big-integer operation rather
+        # than a Python-level loop over every byte.
+        repeated = (mask * (length // 4 + 1))[:length]
+        payload = (
+            int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")
+        ).to_bytes(length, "big")
+    return fin, opcode, payload
+
+
+class WebSocket:
+    """Server side of an upgraded connection.
+
+    ``send_*`` methods are thread safe so that broadcasters can push to a
+    socket while the handler thread is blocked in :meth:`receive`.
+    """
+
+    def __init__(self, rfile: BinaryIO, wfile: BinaryIO) -> None:
+        self._rfile = rfile
+        self._wfile = wfile
+        self._send_lock = threading.Lock()
+        self.closed = False
+
+    def _send(self, opcode: int, payload: bytes) -> None:
+        frame = encode_frame(opcode, payload)
+        with self._send_lock:
+            if self.closed:
+                raise WebSocketClosed("socket already closed")
+            try:
+                self._wfile.write(frame)
+                self._wfile.flush()
+            except OSError as exc:
+                self.closed = True
+                raise WebSocketClosed(str(exc)) from exc
+
+    def send_text(self, text: str) -> None:
+        self._send(OP_TEXT, text.encode("utf-8"))
+
+    def send_binary(self, data: bytes) -> None:
+        self._send(OP_BINARY, data)
+
+    def ping(self) -> None:
+        """Send a ping; a dead peer surfaces as :class:`WebSocketClosed`."""
+        self._send(OP_PING, b"")
+
+    def close(self, code: int = 1000) -> None:
+        """Send a close frame (once) and mark the socket closed."""
+        if self.closed:
+            return
+        try:
+            self._send(OP_CLOSE, struct.pack("!H", code))
+        except WebSocketClosed:
+            pass
+        self.closed = True
+
+    def receive(self) -> Optional[tuple[int, bytes]]:
+        """Return the next data message as ``(opcode, payload)``.
+
+        Pings are answered transparently. ``None`` is returned once the
+        peer has closed the connection.
+        """
+        message_opcode = None
+        parts: list[bytes] = []
+        size = 0
+        while True:
+            try:
+                fin, opcode, payload = _read_frame(self._rfile)
+            except (WebSocketClosed, OSError, ValueError):
+                self.closed = True
+                return None
+            if opcode == OP_CLOSE:
+                self.close()
+                return None
+            if opcode == OP_PING:
+                try:
+                    self._send(OP_PONG, payload)
+                except WebSocketClosed:
+                    return None
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CONTINUATION:
+                if message_opcode is None:
+                    self.close(1002)
+                    return None
+            elif opcode in (OP_TEXT, OP_BINARY):
+                message_opcode = opcode
+                parts = []
+                size = 0
+            else:
+                self.close(1002)
+                return None
+            parts.append(payload)
+            size += len(payload)
+            if size > MAX_MESSAGE_SIZE:
+                self.close(1009)
+                return None
+            if fin:
+                return message_opcode, b"".join(parts)